@@ -65,8 +65,51 @@ CACHES = {
     }
 }
 
+# In-process LRU in front of Redis for the weather and tracking lookups, entries expire after
+# LOCAL_CACHE_TIMEOUT seconds. With LOCAL_CACHE_PUBSUB, tracking invalidations reach the other processes right away
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 10000))
+LOCAL_CACHE_TIMEOUT = float(os.environ.get('LOCAL_CACHE_TIMEOUT', 5))
+LOCAL_CACHE_PUBSUB = bool(int(os.environ.get('LOCAL_CACHE_PUBSUB', 0)))
+
+# Public tracking responses are invalidated on write, the TTL only evicts cold entries
+TRACKING_CACHE_TIMEOUT = int(os.environ.get('TRACKING_CACHE_TIMEOUT', 60*60*24))
+# TTL of the responses read from a replica, which may miss a write whose invalidation already happened
+TRACKING_CACHE_REPLICA_TIMEOUT = int(os.environ.get('TRACKING_CACHE_REPLICA_TIMEOUT', 30))
+# Latest tracking events returned with a shipment
+TRACKING_TIMELINE_LIMIT = int(os.environ.get('TRACKING_TIMELINE_LIMIT', 100))
+# Change notifications of the tracking streams: "redis" (across processes) or "local" (single process, tests).
+# Idle streams send a heartbeat every SHIPMENT_EVENTS_HEARTBEAT seconds and are closed after SHIPMENT_EVENTS_MAX_DURATION
+SHIPMENT_EVENTS_BROKER = os.environ.get('SHIPMENT_EVENTS_BROKER', 'redis')
+SHIPMENT_EVENTS_HEARTBEAT = float(os.environ.get('SHIPMENT_EVENTS_HEARTBEAT', 15))
+SHIPMENT_EVENTS_MAX_DURATION = float(os.environ.get('SHIPMENT_EVENTS_MAX_DURATION', 60*60))
+# Shipments looked up by one batch tracking request
+TRACKING_LOOKUP_MAX_SHIPMENTS = int(os.environ.get('TRACKING_LOOKUP_MAX_SHIPMENTS', 500))
+# Scan events applied per transaction by the bulk ingestion endpoint
+TRACKING_EVENTS_BATCH_SIZE = int(os.environ.get('TRACKING_EVENTS_BATCH_SIZE', 5000))
+# Shipments read per round trip of the export cursor (see shipments/exporter.py)
+SHIPMENT_EXPORT_CHUNK_SIZE = int(os.environ.get('SHIPMENT_EXPORT_CHUNK_SIZE', 2000))
+
+# Weather is served from the cache for WEATHER_CACHE_TIMEOUT, then served stale while it is refreshed in
+# the background, until WEATHER_CACHE_STALE_TIMEOUT. Failed lookups are cached for a short time
+WEATHER_CACHE_TIMEOUT = int(os.environ.get('WEATHER_CACHE_TIMEOUT', 60*60*2))
+WEATHER_CACHE_STALE_TIMEOUT = int(os.environ.get('WEATHER_CACHE_STALE_TIMEOUT', 60*60*6))
+WEATHER_NEGATIVE_CACHE_TIMEOUT = int(os.environ.get('WEATHER_NEGATIVE_CACHE_TIMEOUT', 60*10))
+WEATHER_ERROR_CACHE_TIMEOUT = int(os.environ.get('WEATHER_ERROR_CACHE_TIMEOUT', 30))
+
 # Set WEATHER_API_KEY env var otherwise DummyWeatherClient will be used!
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', None)
+# Max concurrent upstream weather calls when a list page is serialized
+WEATHER_MAX_WORKERS = int(os.environ.get('WEATHER_MAX_WORKERS', 8))
+# Pooled keep-alive connections to the weather API (per process), timeouts in seconds
+WEATHER_HTTP_POOL_SIZE = int(os.environ.get('WEATHER_HTTP_POOL_SIZE', 10))
+WEATHER_ASYNC_MAX_CONNECTIONS = int(os.environ.get('WEATHER_ASYNC_MAX_CONNECTIONS', 100))
+WEATHER_HTTP_CONNECT_TIMEOUT = float(os.environ.get('WEATHER_HTTP_CONNECT_TIMEOUT', 3.05))
+WEATHER_HTTP_READ_TIMEOUT = float(os.environ.get('WEATHER_HTTP_READ_TIMEOUT', 5))
+WEATHER_HTTP_RETRIES = int(os.environ.get('WEATHER_HTTP_RETRIES', 2))
+WEATHER_HTTP_BACKOFF_FACTOR = float(os.environ.get('WEATHER_HTTP_BACKOFF_FACTOR', 0.2))
+# Only one worker calls the weather API per location and expiry, the others wait up to WEATHER_LOCK_WAIT
+WEATHER_LOCK_TIMEOUT = int(os.environ.get('WEATHER_LOCK_TIMEOUT', 30))
+WEATHER_LOCK_WAIT = float(os.environ.get('WEATHER_LOCK_WAIT', 10))
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
@@ -76,6 +119,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "shipments.middleware.ReadYourWritesMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -120,6 +164,18 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database, comma separated hosts. The public tracking reads, the list and
+# the stats are served by them, everything else by the primary (see shipments/db_router.py)
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('SQL_REPLICA_HOSTS', '').split(','))):
+    DATABASE_REPLICAS.append(f'replica{index + 1}')
+    # The tests read the replicas from the test database of the primary
+    DATABASES[f'replica{index + 1}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['shipments.db_router.ReplicaRouter']
+# Seconds during which the reads of a client stay on the primary after it wrote
+DATABASE_REPLICA_STICKINESS = float(os.environ.get('DATABASE_REPLICA_STICKINESS', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
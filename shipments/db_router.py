@@ -0,0 +1,121 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Seconds during which the reads of a client go to the primary after it wrote, longer than the replication lag
+DEFAULT_STICKINESS = 5
+
+# Alias the reads of the current block go to (see replica_reads), None for the primary
+_replica = ContextVar('replica', default=None)
+# Writes of the current request (see record_writes), None outside of a request
+_writes = ContextVar('writes', default=None)
+
+
+def get_replicas() -> list:
+    """ Aliases of DATABASES holding a read-only copy of the primary """
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary, reads as well unless they run in a replica_reads block: only the read-only
+    public paths opt in (see ShipmentViewSet), the write paths read what they are about to write from the
+    primary, without replication lag.
+    """
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None:
+            writes.append(model)
+        # Explicit, instances read from a replica would be saved back to it otherwise
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        return obj1._state.db in aliases and obj2._state.db in aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get the schema through replication
+        return db not in get_replicas()
+
+
+def using_replica() -> Optional[str]:
+    """ Alias of the replica the reads of the current block go to, None if they go to the primary """
+    return _replica.get()
+
+
+@contextmanager
+def replica_reads(sticky: bool = False):
+    """
+    Route the reads of the block to one replica, picked at random, so that they all see the same state.
+    With `sticky` (see is_sticky) or without replicas, they stay on the primary.
+    """
+    replicas = get_replicas()
+    token = _replica.set(random.choice(replicas) if replicas and not sticky else None)
+    try:
+        yield _replica.get()
+    finally:
+        _replica.reset(token)
+
+
+def read_from_replicas(view_method):
+    """ Decorator of the read-only actions of a viewset, see replica_reads """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        with replica_reads(sticky=is_sticky(get_client_key(request))):
+            return view_method(self, request, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def record_writes():
+    """ Collect the models written in the block, see ReadYourWritesMiddleware """
+    writes = []
+    token = _writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _writes.reset(token)
+
+
+def get_client_key(request, user=None) -> str:
+    """ The authenticated user, or else the address of the client """
+    user = user if user is not None else getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR")}'
+
+
+def get_sticky_cache_key(client_key: str) -> str:
+    return f'db-primary:{client_key}'
+
+
+def set_sticky(client_key: str):
+    """ Send the reads of the client to the primary for DATABASE_REPLICA_STICKINESS seconds """
+    timeout = getattr(settings, 'DATABASE_REPLICA_STICKINESS', DEFAULT_STICKINESS)
+    if get_replicas() and timeout > 0:
+        cache.set(get_sticky_cache_key(client_key), True, timeout=timeout)
+
+
+async def aset_sticky(client_key: str):
+    timeout = getattr(settings, 'DATABASE_REPLICA_STICKINESS', DEFAULT_STICKINESS)
+    if get_replicas() and timeout > 0:
+        await cache.aset(get_sticky_cache_key(client_key), True, timeout=timeout)
+
+
+def is_sticky(client_key: str) -> bool:
+    """ Whether the client wrote recently: a replica may not have its writes yet """
+    return bool(get_replicas()) and cache.get(get_sticky_cache_key(client_key), False)
+
+
+async def ais_sticky(client_key: str) -> bool:
+    return bool(get_replicas()) and await cache.aget(get_sticky_cache_key(client_key), False)
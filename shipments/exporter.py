@@ -0,0 +1,76 @@
+"""
+Streaming export of the shipments, as csv in the `data.csv` layout read by `import_shipment_data` or as NDJSON
+in the shape of the API (without the weather). The shipments are read with a server-side cursor and their
+articles are joined per chunk, so the memory usage does not depend on the size of the export.
+"""
+import csv
+from typing import Iterator
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from .importer import iter_chunks
+from .models import Shipment
+from .rest.fast_serializers import SHIPMENT_FIELDS, FastJSONRenderer, serialize_shipments
+
+# Shipments read per round trip of the cursor, and serialized together
+DEFAULT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+CSV_COLUMNS = [
+    'tracking_number', 'carrier', 'sender_address', 'receiver_address',
+    'article_name', 'article_quantity', 'article_price', 'SKU', 'status',
+]
+
+# The csv files use the status labels ("in-transit"), see importer.normalize_status
+STATUS_LABELS = dict(Shipment.ShipmentStatus.choices)
+
+
+class Echo:
+    """ File-like object returning what is written, for csv.writer to format single rows """
+
+    def write(self, value):
+        return value
+
+
+def iter_export(queryset: QuerySet, export_format: str, chunk_size: int = None) -> Iterator[str]:
+    """
+    Args:
+        queryset (QuerySet): Shipments to export, e.g. filtered by status or carrier.
+        export_format (str): "csv" or "ndjson".
+        chunk_size (int): Shipments per chunk, defaults to `SHIPMENT_EXPORT_CHUNK_SIZE`.
+
+    Returns:
+        Iterator[str]: The export, one piece per chunk of shipments.
+    """
+    chunk_size = chunk_size or getattr(settings, 'SHIPMENT_EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    rows = queryset.prefetch_related(None).values(*SHIPMENT_FIELDS).order_by('id').iterator(chunk_size=chunk_size)
+    format_chunk = format_csv_chunk if export_format == 'csv' else format_ndjson_chunk
+
+    if export_format == 'csv':
+        yield csv.writer(Echo()).writerow(CSV_COLUMNS)
+    for chunk in iter_chunks(rows, chunk_size):
+        yield format_chunk(serialize_shipments(chunk))
+
+
+def format_csv_chunk(shipments: list) -> str:
+    writer = csv.writer(Echo())
+    lines = []
+    for shipment in shipments:
+        shipment_columns = [
+            shipment['tracking_number'], shipment['carrier'], shipment['sender_address'], shipment['receiver_address'],
+        ]
+        status = STATUS_LABELS.get(shipment['status'], shipment['status'])
+        for article in shipment['articles']:
+            lines.append(writer.writerow(
+                shipment_columns + [article['name'], article['quantity'], article['price'], article['sku'], status]
+            ))
+        if not shipment['articles']:
+            lines.append(writer.writerow(shipment_columns + ['', '', '', '', status]))
+    return ''.join(lines)
+
+
+def format_ndjson_chunk(shipments: list) -> str:
+    renderer = FastJSONRenderer()
+    return ''.join(renderer.render(shipment).decode() + '\n' for shipment in shipments)
@@ -0,0 +1,185 @@
+import csv
+from collections import Counter
+from decimal import Decimal
+from itertools import islice
+from typing import Iterable, Iterator, NamedTuple
+
+from django.db import transaction
+
+from .models import Article, Shipment, ArticleShipmentItem
+from .shipment_stats import get_counter_key, update_shipment_counters
+from .summaries import update_article_shipment_summaries, update_shipment_summaries
+from .tracking_cache import invalidate_tracking_cache
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# The carrier feeds use the status labels ("in-transit"), the model stores the values ("IN_TRANSIT")
+STATUS_BY_LABEL = {label: value for value, label in Shipment.ShipmentStatus.choices}
+
+
+def normalize_status(status: str) -> str:
+    return STATUS_BY_LABEL.get(status, status)
+
+
+def iter_chunks(rows: Iterable[dict], chunk_size: int) -> Iterator[list]:
+    """ Split the rows into lists of at most `chunk_size` rows without reading everything into memory """
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def iter_csv_chunks(csv_file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list]:
+    """ Stream a shipment csv file as chunks of rows """
+    with open(csv_file_path, 'r', newline='') as file:
+        yield from iter_chunks(csv.DictReader(file), chunk_size)
+
+
+def import_chunk(rows: list, update_articles: bool = True) -> int:
+    """
+    Import a chunk of csv rows with a constant number of queries, whatever the chunk size.
+    Articles are upserted by SKU (see upsert_articles), the last row of a SKU wins. Shipments and
+    ArticleShipmentItems are deduplicated within the chunk, existing rows are resolved with one `IN` query
+    per model and the missing ones are inserted with `bulk_create`. Same semantics as `get_or_create`:
+    existing shipments and items are not updated.
+
+    Args:
+        rows (list): csv rows in the `data.csv` column layout.
+        update_articles (bool): If False, the articles must exist already (e.g. upserted by
+            parallel_importer.import_files), they are only looked up.
+
+    Returns:
+        int: Number of imported rows.
+    """
+    with transaction.atomic():
+        articles = {row['SKU']: article_values(row) for row in rows if has_article(row)}
+        if update_articles:
+            article_ids = upsert_articles(articles).ids
+        else:
+            article_ids = dict(Article.objects.filter(sku__in=articles).values_list('sku', 'pk'))
+        shipments = _get_or_create_shipments(rows)
+
+        items = {}
+        for row in rows:
+            if not has_article(row):
+                continue
+            article_id = article_ids[row['SKU']]
+            shipment = shipments[(row['carrier'], row['tracking_number'])]
+            items.setdefault((article_id, shipment.pk), ArticleShipmentItem(
+                article_id=article_id,
+                shipment=shipment,
+                quantity=row['article_quantity'],
+            ))
+        ArticleShipmentItem.objects.bulk_create(items.values(), ignore_conflicts=True)
+        # bulk_create does not send the signals that update the summaries and invalidate the public tracking responses
+        update_shipment_summaries(shipment.pk for shipment in shipments.values())
+        invalidate_tracking_cache(shipments.keys())
+
+    return len(rows)
+
+
+def has_article(row: dict) -> bool:
+    """ Shipments without articles are exported (see exporter.py) as a row with empty article columns """
+    return bool(row['SKU'])
+
+
+def article_values(row: dict) -> tuple:
+    return row['article_name'], Decimal(row['article_price'])
+
+
+class UpsertedArticles(NamedTuple):
+    # Primary keys of all the articles, keyed by SKU
+    ids: dict
+    # SKUs of the inserted and of the updated articles, the others were unchanged
+    created: set
+    updated: set
+
+
+def upsert_articles(articles: dict, batch_size: int = DEFAULT_CHUNK_SIZE) -> UpsertedArticles:
+    """
+    Create or update articles by SKU, in batches of one select and one `INSERT ... ON CONFLICT (sku) DO UPDATE`.
+    Unchanged articles are not written, and the tracking responses of the shipments of the updated ones
+    are invalidated. Call it in a transaction.
+
+    Args:
+        articles (dict): `(name, price)` keyed by SKU.
+        batch_size (int): SKUs per batch.
+
+    Returns:
+        UpsertedArticles: The ids and the created and updated SKUs.
+    """
+    upserted = UpsertedArticles({}, set(), set())
+    # Sorted, concurrent upserts lock the rows in the same order and can not deadlock
+    for skus in iter_chunks(sorted(articles), batch_size):
+        stored = {
+            sku: (pk, (name, price))
+            for pk, sku, name, price in Article.objects.filter(sku__in=skus).values_list('pk', 'sku', 'name', 'price')
+        }
+        changed = [
+            Article(sku=sku, name=articles[sku][0], price=articles[sku][1])
+            for sku in skus if sku not in stored or stored[sku][1] != articles[sku]
+        ]
+        # A SKU inserted concurrently since the select is updated rather than failing
+        Article.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['sku'], update_fields=['name', 'price'],
+        )
+
+        upserted.ids.update((sku, pk) for sku, (pk, _) in stored.items())
+        for article in changed:
+            upserted.ids[article.sku] = article.pk
+            (upserted.updated if article.sku in stored else upserted.created).add(article.sku)
+
+    if upserted.updated:
+        # bulk_create does not send the signals that update the summaries and invalidate the public tracking responses
+        update_article_shipment_summaries(Article.objects.filter(sku__in=upserted.updated))
+        invalidate_tracking_cache(
+            Shipment.objects.filter(articles__sku__in=upserted.updated)
+            .values_list('carrier', 'tracking_number').distinct()
+        )
+    return upserted
+
+
+def _get_or_create_shipments(rows: list) -> dict:
+    new_shipments = {}
+    for row in rows:
+        key = (row['carrier'], row['tracking_number'])
+        if key not in new_shipments:
+            new_shipments[key] = Shipment(
+                tracking_number=row['tracking_number'],
+                carrier=row['carrier'],
+                sender_address=row['sender_address'],
+                receiver_address=row['receiver_address'],
+                status=normalize_status(row['status']),
+            )
+            # bulk_create does not call save()
+            new_shipments[key].set_locations()
+
+    shipments = select_shipments(new_shipments)
+    missing = [shipment for key, shipment in new_shipments.items() if key not in shipments]
+    if missing:
+        # Rows inserted concurrently by someone else are skipped by the constraint and picked up by the select below
+        Shipment.objects.bulk_create(missing, ignore_conflicts=True)
+        shipments.update(select_shipments({get_tracking_key(shipment) for shipment in missing}))
+        # bulk_create does not send the signals that count the shipments. A row inserted concurrently is counted
+        # twice, until reconcile_shipment_counters
+        update_shipment_counters(Counter(get_counter_key(shipment) for shipment in missing))
+    return shipments
+
+
+def get_tracking_key(shipment: Shipment) -> tuple:
+    return shipment.carrier, shipment.tracking_number
+
+
+def select_shipments(tracking_keys: Iterable[tuple]) -> dict:
+    """
+    The stored shipments of `(carrier, tracking_number)` pairs. Filtered on both columns, the lookup is a range
+    scan of the (carrier, tracking_number) unique index; the few rows of the cross product are dropped here.
+    """
+    tracking_keys = set(tracking_keys)
+    return {
+        get_tracking_key(shipment): shipment
+        for shipment in Shipment.objects.filter(
+            carrier__in={carrier for carrier, _ in tracking_keys},
+            tracking_number__in={tracking_number for _, tracking_number in tracking_keys},
+        )
+        if get_tracking_key(shipment) in tracking_keys
+    }
@@ -0,0 +1,44 @@
+from typing import NamedTuple, Optional
+
+
+class Location(NamedTuple):
+    """ Where a shipment goes, at the granularity the weather is looked up and cached for """
+    postal_code: str
+    city: str
+    country: str
+
+    @property
+    def key(self) -> str:
+        """
+        Canonical `"<postal code> <city>, <country>"`, shared by all the addresses of the location.
+        Used as the weather cache key and API query: the street is never sent upstream.
+        """
+        return f'{self.postal_code} {self.city}, {self.country}'.casefold()
+
+
+def parse_address(address: str) -> Optional[Location]:
+    """
+    Parse an address in the `"<Street>, <Postal_Code City>, <Country>"` format, see
+    validators.validate_comma_separated_address.
+
+    Returns:
+        Optional[Location]: None if the address does not follow the format.
+    """
+    sections = address.split(',')
+    if len(sections) != 3:
+        return None
+
+    postal_code, _, city = sections[1].strip().partition(' ')
+    city, country = ' '.join(city.split()), ' '.join(sections[2].split())
+    if not postal_code or not city or not country:
+        return None
+    return Location(postal_code.upper(), city, country)
+
+
+def normalize_place(value: str) -> str:
+    """ Case and whitespace insensitive form of a city or a country, as stored in the shipment location columns """
+    return ' '.join(value.split()).casefold()
+
+
+def normalize_postal_code(value: str) -> str:
+    return value.strip().upper()
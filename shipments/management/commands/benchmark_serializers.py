@@ -0,0 +1,77 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from shipments.models import Article, ArticleShipmentItem, Shipment
+from shipments.rest.fast_serializers import SHIPMENT_FIELDS, FastJSONRenderer, serialize_shipments
+from shipments.rest.serializers import ShipmentSerializer
+from shipments.rest.views import ShipmentViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the DRF serializer and the fast path (values rows, orjson) on a page of shipments. '
+        'The shipments are created in a transaction rolled back at the end'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shipments', type=int, default=100, help='Shipments per page, like the page size')
+        parser.add_argument('--articles', type=int, default=5, help='Articles per shipment')
+        parser.add_argument('--rounds', type=int, default=20, help='Times each page is serialized')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_shipments(options['shipments'], options['articles'])
+            # Prefetched, the benchmark measures the serialization and not the weather client
+            weather = {
+                ShipmentSerializer.get_weather_location(address): {'temperature': 21.5, 'condition': 'Sunny'}
+                for address in Shipment.objects.values_list('receiver_address', flat=True)
+            }
+
+            def drf():
+                shipments = list(ShipmentViewSet.queryset.order_by('id'))
+                return JSONRenderer().render(ShipmentSerializer(shipments, many=True, context={'weather': weather}).data)
+
+            def fast():
+                rows = list(ShipmentViewSet.queryset.prefetch_related(None).values(*SHIPMENT_FIELDS).order_by('id'))
+                return FastJSONRenderer().render(serialize_shipments(rows, weather))
+
+            if drf() != fast():
+                self.stderr.write('The responses differ!')
+            drf_seconds = self.run(drf, options['rounds'])
+            fast_seconds = self.run(fast, options['rounds'])
+            transaction.set_rollback(True)
+
+        self.report('drf', options['rounds'], drf_seconds)
+        self.report('fast', options['rounds'], fast_seconds)
+        self.stdout.write(f"speedup: {drf_seconds / fast_seconds:.1f}x")
+
+    def create_shipments(self, shipments, articles):
+        articles = Article.objects.bulk_create(
+            Article(name=f'Article {i}', price=f'{i}.99', sku=f'BENCH{i:06d}') for i in range(articles)
+        )
+        shipments = Shipment.objects.bulk_create(
+            Shipment(
+                tracking_number=f'BENCH{i:08d}',
+                carrier='DHL',
+                sender_address='Street 1, 10115 Berlin, Germany',
+                receiver_address=f'Street {i}, 750{i % 20:02d} Paris, France',
+                status=Shipment.ShipmentStatus.IN_TRANSIT,
+            )
+            for i in range(shipments)
+        )
+        ArticleShipmentItem.objects.bulk_create(
+            ArticleShipmentItem(shipment=shipment, article=article, quantity=1)
+            for shipment in shipments for article in articles
+        )
+
+    @staticmethod
+    def run(serialize, rounds):
+        started_at = time.monotonic()
+        for _ in range(rounds):
+            serialize()
+        return time.monotonic() - started_at
+
+    def report(self, name, rounds, seconds):
+        self.stdout.write(f"{name}: {rounds} pages in {seconds:.2f}s ({seconds / rounds * 1000:.1f}ms per page)")
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+
+from shipments.weather_integration import DummyWeatherClient
+
+
+class SlowWeatherClient(DummyWeatherClient):
+    """ Dummy client with a simulated upstream latency, nothing is cached so every lookup is a miss """
+    latency = 0.1
+
+    def make_request(self, location: str) -> dict:
+        time.sleep(self.latency)
+        return super().make_request(location)
+
+    async def amake_request(self, location: str) -> dict:
+        await asyncio.sleep(self.latency)
+        return super().make_request(location)
+
+
+class Command(BaseCommand):
+    help = 'Compare sync and async weather lookup throughput under a simulated upstream latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Number of weather lookups')
+        parser.add_argument('--latency', type=float, default=0.1, help='Simulated upstream latency in seconds')
+        parser.add_argument(
+            '--threads', type=int, default=16,
+            help='Threads serving the sync lookups, like the threads of a WSGI worker',
+        )
+
+    def handle(self, *args, **options):
+        client = SlowWeatherClient()
+        client.latency = options['latency']
+        locations = [f'Street {i}, 10115 Berlin, Germany' for i in range(options['requests'])]
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(client.get_weather, locations))
+        self.report(f"sync ({options['threads']} threads)", len(locations), time.monotonic() - started_at)
+
+        async def run_async():
+            await asyncio.gather(*(client.aget_weather(location) for location in locations))
+
+        started_at = time.monotonic()
+        asyncio.run(run_async())
+        self.report('async (1 thread)', len(locations), time.monotonic() - started_at)
+
+    def report(self, name, requests, seconds):
+        self.stdout.write(f"{name}: {requests} lookups in {seconds:.2f}s ({requests / seconds:.0f} lookups/sec)")
@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+
+from shipments.models import TrackingEvent
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the monthly partitions of the tracking events ahead of time (PostgreSQL only), '
+        'run it periodically e.g. from cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3, help='Months to create from the current one')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f'Tracking events are not partitioned on {connection.vendor}, nothing to do')
+            return
+
+        table = TrackingEvent._meta.db_table
+        month = date.today().replace(day=1)
+        for _ in range(options['months']):
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            partition = f'{table}_y{month.year}m{month.month:02d}'
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(
+                        f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{month.isoformat()} 00:00+00') TO ('{next_month.isoformat()} 00:00+00')"
+                    )
+            except DatabaseError as exc:
+                # e.g. rows of this month already landed in the default partition
+                self.stderr.write(f'Failed to create {partition}: {exc}')
+            else:
+                self.stdout.write(f'{partition} ready')
+            month = next_month
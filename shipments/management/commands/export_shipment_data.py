@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand
+
+from shipments.exporter import EXPORT_FORMATS, iter_export
+from shipments.importer import normalize_status
+from shipments.models import Shipment
+
+
+class Command(BaseCommand):
+    help = 'Export shipment data as csv (the layout read by import_shipment_data) or NDJSON, with a flat memory usage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', help='Path of the file to write (defaults to the standard output)')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', dest='export_format')
+        parser.add_argument('--status', help='Only the shipments with this status (value or label, e.g. "in-transit")')
+        parser.add_argument('--carrier', help='Only the shipments of this carrier')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Shipments read from the cursor and serialized per batch (bounds the memory usage), '
+                 'defaults to the SHIPMENT_EXPORT_CHUNK_SIZE setting',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Shipment.objects.all()
+        if options['status']:
+            queryset = queryset.filter(status=normalize_status(options['status']))
+        if options['carrier']:
+            queryset = queryset.filter(carrier=options['carrier'])
+
+        started_at = time.monotonic()
+        pieces = iter_export(queryset, options['export_format'], options['chunk_size'])
+        if not options['output']:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+
+        with open(options['output'], 'w', newline='') as file:
+            file.writelines(pieces)
+        self.stdout.write(f"Data exported successfully to {options['output']} in {time.monotonic() - started_at:.2f}s")
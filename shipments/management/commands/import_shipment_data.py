@@ -1,42 +1,55 @@
-
-import csv
 import os
+import time
 from django.core.management.base import BaseCommand
 
-from shipments.models import Article, Shipment, ArticleShipmentItem
+from shipments.importer import DEFAULT_CHUNK_SIZE, import_chunk, iter_csv_chunks
+from shipments.parallel_importer import import_files
 
 class Command(BaseCommand):
     help = 'Load shipment data from a csv file'
 
-    def handle(self, *args, **options):
-        csv_file_name = 'data.csv'
+    def add_arguments(self, parser):
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_file_path = os.path.join(current_dir, csv_file_name)        
-        self.stdout.write(f"Attempting to open file at: {csv_file_path}")
+        parser.add_argument(
+            'csv_files', nargs='*', default=[os.path.join(current_dir, 'data.csv')],
+            help='Paths of the csv files to import (defaults to the bundled data.csv)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Number of rows read, deduplicated and inserted per batch (bounds the memory usage)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes. With more than one, the files are split by byte range '
+                 'and the rows are partitioned by (carrier, tracking_number) across the workers',
+        )
 
-        with open(csv_file_path, 'r') as file:
-            reader = csv.DictReader(file.read().splitlines())
-            for row in reader:
-                self.stdout.write(f"Importing: {row['tracking_number']}")
-                article, is_article_created = Article.objects.get_or_create(
-                    name=row['article_name'],
-                    price=row['article_price'],
-                    sku=row['SKU']
-                )
-                shipment, created = Shipment.objects.get_or_create(
-                    tracking_number=row['tracking_number'],
-                    carrier=row['carrier'],
-                    defaults={
-                        'sender_address': row['sender_address'],
-                        'receiver_address': row['receiver_address'],
-                        'status': row['status']
-                    }
-                )
-                ArticleShipmentItem.objects.get_or_create(
-                    article=article,
-                    shipment=shipment,
-                    defaults={
-                        'quantity': row['article_quantity']
-                    }
+    def handle(self, *args, **options):
+        for csv_file_path in options['csv_files']:
+            self.stdout.write(f"Attempting to open file at: {csv_file_path}")
+
+        if options['workers'] > 1:
+            stats = import_files(options['csv_files'], options['workers'], options['chunk_size'])
+            for pid, worker in stats['workers'].items():
+                self.stdout.write(
+                    f"Worker {pid}: {worker['parsed']} rows parsed, {worker['imported']} rows imported "
+                    f"in {worker['seconds']:.2f}s ({self.rate(worker['imported'], worker['seconds'])})"
                 )
-        self.stdout.write("Data imported successfully!")
+            imported, elapsed = stats['imported'], stats['seconds']
+        else:
+            started_at = time.monotonic()
+            imported = 0
+            for csv_file_path in options['csv_files']:
+                for chunk in iter_csv_chunks(csv_file_path, options['chunk_size']):
+                    imported += import_chunk(chunk)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"Imported {imported} rows")
+            elapsed = time.monotonic() - started_at
+
+        self.stdout.write(
+            f"Data imported successfully! {imported} rows in {elapsed:.2f}s ({self.rate(imported, elapsed)})"
+        )
+
+    @staticmethod
+    def rate(rows, seconds):
+        return f"{rows / seconds if seconds else 0:.0f} rows/sec"
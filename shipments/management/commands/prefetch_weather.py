@@ -0,0 +1,91 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from shipments.importer import iter_chunks
+from shipments.locations import parse_address
+from shipments.models import Shipment
+from shipments.weather_integration import get_cache_timeouts, get_client
+
+METRICS_CACHE_KEY = 'weather-prefetch:metrics'
+
+class Command(BaseCommand):
+    help = (
+        'Keep the weather cache of the active shipments warm: refresh the receiver locations of the '
+        'shipments not delivered yet before their weather gets stale, at a controlled rate'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single scan instead of looping')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between two scans')
+        parser.add_argument('--rate', type=float, default=5, help='Max weather API calls per second')
+        parser.add_argument(
+            '--refresh-ahead', type=float, default=60*10,
+            help='Refresh the locations whose weather gets stale within this many seconds',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Locations read from the cache at once')
+
+    def handle(self, *args, **options):
+        while True:
+            metrics = self.scan(options['rate'], options['refresh_ahead'], options['chunk_size'])
+            # Exposed to the other processes (e.g. a monitoring endpoint) as well
+            cache.set(METRICS_CACHE_KEY, metrics, timeout=None)
+            self.stdout.write(
+                f"{metrics['locations']} locations: hit ratio {metrics['hit_ratio']:.1%}, "
+                f"{metrics['refreshed']} refreshed, {metrics['failed']} failed, "
+                f"refresh lag max {metrics['max_refresh_lag']:.0f}s avg {metrics['avg_refresh_lag']:.0f}s "
+                f"in {metrics['seconds']:.2f}s"
+            )
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def scan(self, rate, refresh_ahead, chunk_size):
+        """
+        Returns:
+            dict: Scan metrics. `hit_ratio` is the share of active locations a request would have found fresh
+            in the cache, the refresh lag is how late (past the refresh-ahead deadline) a location was refreshed.
+        """
+        started_at = time.monotonic()
+        client = get_client()
+        soft_timeout, _ = get_cache_timeouts()
+        refresh_after = max(soft_timeout - refresh_ahead, 0)
+
+        addresses = (
+            Shipment.objects.exclude(status=Shipment.ShipmentStatus.DELIVERY)
+            .values_list('receiver_address', flat=True).distinct().iterator()
+        )
+        locations = {location.key for location in map(parse_address, addresses) if location}
+
+        hits, refreshed, failed, lags = 0, 0, 0, []
+        next_call_at = time.monotonic()
+        for chunk in iter_chunks(sorted(locations), chunk_size):
+            for location, entry in client.get_weather_cache_entries(chunk).items():
+                if entry.weather and not entry.is_stale:
+                    hits += 1
+                if entry.is_error:
+                    continue
+
+                now = time.time()
+                if entry.weather and entry.fetched_at is not None and now - entry.fetched_at < refresh_after:
+                    continue
+                if entry.fetched_at is not None:
+                    lags.append(max(now - entry.fetched_at - refresh_after, 0))
+
+                # Rate limit of the upstream calls
+                time.sleep(max(next_call_at - time.monotonic(), 0))
+                next_call_at = time.monotonic() + 1 / rate
+                if client.fetch_weather_once(location):
+                    refreshed += 1
+                else:
+                    failed += 1
+
+        return {
+            'locations': len(locations),
+            'hit_ratio': hits / len(locations) if locations else 1.0,
+            'refreshed': refreshed,
+            'failed': failed,
+            'max_refresh_lag': max(lags, default=0),
+            'avg_refresh_lag': sum(lags) / len(lags) if lags else 0,
+            'seconds': time.monotonic() - started_at,
+        }
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+
+from shipments.shipment_stats import reconcile_shipment_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount the shipments per carrier, status and country and correct the counters of the stats endpoint '
+        'that drifted, e.g. after writes that bypass the application'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single reconciliation instead of looping')
+        parser.add_argument('--interval', type=float, default=60*15, help='Seconds between two reconciliations')
+
+    def handle(self, *args, **options):
+        while True:
+            started_at = time.monotonic()
+            corrections = reconcile_shipment_counters()
+            self.stdout.write(
+                f"{len(corrections)} counters corrected ({sum(map(abs, corrections.values()))} shipments) "
+                f"in {time.monotonic() - started_at:.2f}s"
+            )
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+
+from shipments.db_router import aset_sticky, get_client_key, record_writes, set_sticky
+
+
+class ReadYourWritesMiddleware:
+    """
+    After a request that wrote to the primary, the reads of the same client stay on the primary for
+    DATABASE_REPLICA_STICKINESS seconds (see db_router.py): a client reading its own write back never gets
+    the stale row of a lagging replica. Runs in both modes, the async views are not adapted to sync.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with record_writes() as writes:
+            response = self.get_response(request)
+        if writes:
+            # After the view, DRF has set the user it authenticated on the request
+            set_sticky(get_client_key(request))
+        return response
+
+    async def __acall__(self, request):
+        with record_writes() as writes:
+            response = await self.get_response(request)
+        if writes:
+            user = getattr(request, 'user', None)
+            if type(user) is SimpleLazyObject:
+                # Not set by DRF, the session user is loaded without blocking the event loop
+                user = await request.auser()
+            await aset_sticky(get_client_key(request, user))
+        return response
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+PARTITION_TRACKING_EVENTS = """
+DROP TABLE shipments_trackingevent;
+CREATE TABLE shipments_trackingevent (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    shipment_id bigint NOT NULL REFERENCES shipments_shipment (id) DEFERRABLE INITIALLY DEFERRED,
+    status varchar(12) NOT NULL,
+    timestamp timestamp with time zone NOT NULL,
+    location varchar(255) NOT NULL,
+    payload jsonb NOT NULL,
+    -- The primary key of a partitioned table must include the partition key
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE INDEX tracking_event_shipment_index ON shipments_trackingevent (shipment_id, timestamp);
+-- Catches the events outside the monthly partitions, see the create_tracking_event_partitions command
+CREATE TABLE shipments_trackingevent_default PARTITION OF shipments_trackingevent DEFAULT;
+"""
+
+
+def partition_tracking_events(apps, schema_editor):
+    """ Range partitions by month on PostgreSQL, other databases keep the plain table """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(PARTITION_TRACKING_EVENTS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0002_alter_shipment_receiver_address_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='status_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TrackingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('IN_TRANSIT', 'in-transit'), ('INBOUND_SCAN', 'inbound-scan'), ('DELIVERY', 'delivery'), ('TRANSIT', 'transit'), ('SCANNED', 'scanned')], max_length=12)),
+                ('timestamp', models.DateTimeField()),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('shipment', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tracking_events', to='shipments.shipment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shipment', 'timestamp'], name='tracking_event_shipment_index')],
+            },
+        ),
+        migrations.RunPython(partition_tracking_events, migrations.RunPython.noop),
+    ]
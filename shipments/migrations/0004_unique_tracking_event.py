@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:43
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_events(apps, schema_editor):
+    """ Keep the first copy of the events ingested more than once """
+    TrackingEvent = apps.get_model('shipments', 'TrackingEvent')
+    duplicates = (
+        TrackingEvent.objects.values('shipment', 'timestamp', 'status')
+        .annotate(first_id=Min('id'), count=Count('id')).filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        TrackingEvent.objects.filter(
+            shipment=duplicate['shipment'], timestamp=duplicate['timestamp'], status=duplicate['status'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0003_tracking_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_events, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trackingevent',
+            constraint=models.UniqueConstraint(fields=('shipment', 'timestamp', 'status'), name='unique_tracking_event'),
+        ),
+        migrations.RemoveIndex(
+            model_name='trackingevent',
+            name='tracking_event_shipment_index',
+        ),
+    ]
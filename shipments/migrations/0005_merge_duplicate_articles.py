@@ -0,0 +1,42 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:12
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_articles(apps, schema_editor):
+    """
+    Keep the first article of each SKU, with the name and price of the latest one (the importer created a
+    new article on every price change), and move the items of the others to it.
+    """
+    Article = apps.get_model('shipments', 'Article')
+    ArticleShipmentItem = apps.get_model('shipments', 'ArticleShipmentItem')
+    duplicates = Article.objects.values('sku').annotate(count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        kept, *others = Article.objects.filter(sku=duplicate['sku']).order_by('id')
+        kept.name, kept.price = others[-1].name, others[-1].price
+        kept.save(update_fields=['name', 'price'])
+
+        kept_items = {item.shipment_id: item for item in ArticleShipmentItem.objects.filter(article=kept)}
+        for item in ArticleShipmentItem.objects.filter(article__in=others).order_by('id'):
+            if item.shipment_id in kept_items:
+                # The same article twice in a shipment, at two prices
+                kept_items[item.shipment_id].quantity += item.quantity
+                kept_items[item.shipment_id].save(update_fields=['quantity'])
+                item.delete()
+            else:
+                item.article = kept
+                item.save(update_fields=['article'])
+                kept_items[item.shipment_id] = item
+        Article.objects.filter(id__in=[article.id for article in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0004_unique_tracking_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_articles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from 0005: PostgreSQL does not alter a table with pending constraint checks in the same transaction
+
+    dependencies = [
+        ('shipments', '0005_merge_duplicate_articles'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='sku',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:20
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def compute_summaries(apps, schema_editor):
+    """ Same as summaries.update_shipment_summaries, for all the shipments at once """
+    Shipment = apps.get_model('shipments', 'Shipment')
+    ArticleShipmentItem = apps.get_model('shipments', 'ArticleShipmentItem')
+    items = ArticleShipmentItem.objects.filter(shipment=OuterRef('pk')).order_by().values('shipment')
+    Shipment.objects.update(
+        item_count=Coalesce(
+            Subquery(items.annotate(total=Sum('quantity')).values('total')),
+            0, output_field=models.PositiveIntegerField(),
+        ),
+        total_value=Coalesce(
+            Subquery(items.annotate(total=Sum(F('quantity') * F('article__price'))).values('total')),
+            Decimal(0), output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0006_unique_article_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='total_value',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(compute_summaries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['item_count', 'id'], name='item_count_index'),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['total_value', 'id'], name='total_value_index'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+from shipments.locations import normalize_place, normalize_postal_code, parse_address
+
+
+# Backs the `search` parameter: `icontains` is `UPPER(column) LIKE UPPER('%term%')` on PostgreSQL
+CREATE_TRIGRAM_INDEXES = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX shipment_tracking_number_trgm ON shipments_shipment USING gin (UPPER(tracking_number) gin_trgm_ops);
+CREATE INDEX shipment_receiver_address_trgm ON shipments_shipment USING gin (UPPER(receiver_address) gin_trgm_ops);
+CREATE INDEX shipment_sender_address_trgm ON shipments_shipment USING gin (UPPER(sender_address) gin_trgm_ops);
+"""
+DROP_TRIGRAM_INDEXES = """
+DROP INDEX IF EXISTS shipment_tracking_number_trgm;
+DROP INDEX IF EXISTS shipment_receiver_address_trgm;
+DROP INDEX IF EXISTS shipment_sender_address_trgm;
+"""
+
+
+def set_locations(apps, schema_editor):
+    """ Same as Shipment.set_locations, in batches """
+    Shipment = apps.get_model('shipments', 'Shipment')
+    fields = ['receiver_postal_code', 'receiver_city', 'receiver_country', 'sender_postal_code', 'sender_city', 'sender_country']
+    shipments = []
+    for shipment in Shipment.objects.only('receiver_address', 'sender_address').iterator(chunk_size=2000):
+        for prefix, address in (('receiver', shipment.receiver_address), ('sender', shipment.sender_address)):
+            location = parse_address(address)
+            setattr(shipment, f'{prefix}_postal_code', normalize_postal_code(location.postal_code) if location else '')
+            setattr(shipment, f'{prefix}_city', normalize_place(location.city) if location else '')
+            setattr(shipment, f'{prefix}_country', normalize_place(location.country) if location else '')
+        shipments.append(shipment)
+        if len(shipments) == 2000:
+            Shipment.objects.bulk_update(shipments, fields)
+            shipments = []
+    Shipment.objects.bulk_update(shipments, fields)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """ PostgreSQL only, the other databases scan the table """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGRAM_INDEXES)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGRAM_INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0007_shipment_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='receiver_city',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='receiver_country',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='receiver_postal_code',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='sender_city',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='sender_country',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='sender_postal_code',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+        migrations.RunPython(set_locations, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
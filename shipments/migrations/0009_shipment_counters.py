@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:50
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_shipments(apps, schema_editor):
+    """ Initial counters, see shipment_stats.reconcile_shipment_counters """
+    Shipment = apps.get_model('shipments', 'Shipment')
+    ShipmentCounter = apps.get_model('shipments', 'ShipmentCounter')
+    ShipmentCounter.objects.bulk_create(
+        ShipmentCounter(carrier=carrier, status=status, country=country, count=count)
+        for carrier, status, country, count in Shipment.objects.order_by()
+        .values_list('carrier', 'status', 'receiver_country').annotate(count=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0008_shipment_locations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShipmentCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('carrier', models.CharField(max_length=32)),
+                ('status', models.CharField(choices=[('IN_TRANSIT', 'in-transit'), ('INBOUND_SCAN', 'inbound-scan'), ('DELIVERY', 'delivery'), ('TRANSIT', 'transit'), ('SCANNED', 'scanned')], max_length=12)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('carrier', 'status', 'country'), name='unique_shipment_counter')],
+            },
+        ),
+        migrations.RunPython(count_shipments, migrations.RunPython.noop),
+    ]
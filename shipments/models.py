@@ -1,11 +1,12 @@
 from django.db import models
 
+from .locations import normalize_place, normalize_postal_code, parse_address
 from .validators import validate_comma_separated_address
 
 class Article(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    sku = models.CharField(max_length=100)
+    sku = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return self.name
@@ -25,14 +26,55 @@ class Shipment(models.Model):
         TRANSIT = 'TRANSIT', 'transit'
         SCANNED = 'SCANNED', 'scanned'
 
+    # Allowed status changes: a shipment goes back and forth between the hubs until it is delivered
+    STATUS_TRANSITIONS = {
+        ShipmentStatus.SCANNED: {
+            ShipmentStatus.INBOUND_SCAN, ShipmentStatus.IN_TRANSIT, ShipmentStatus.TRANSIT, ShipmentStatus.DELIVERY,
+        },
+        ShipmentStatus.INBOUND_SCAN: {
+            ShipmentStatus.SCANNED, ShipmentStatus.IN_TRANSIT, ShipmentStatus.TRANSIT, ShipmentStatus.DELIVERY,
+        },
+        ShipmentStatus.IN_TRANSIT: {
+            ShipmentStatus.SCANNED, ShipmentStatus.INBOUND_SCAN, ShipmentStatus.TRANSIT, ShipmentStatus.DELIVERY,
+        },
+        ShipmentStatus.TRANSIT: {
+            ShipmentStatus.SCANNED, ShipmentStatus.INBOUND_SCAN, ShipmentStatus.IN_TRANSIT, ShipmentStatus.DELIVERY,
+        },
+        ShipmentStatus.DELIVERY: set(),
+    }
+
+    # Lifecycle order, breaks the tie between events of the same time: the further status wins whatever their order
+    STATUS_RANK = {
+        status: rank for rank, status in enumerate([
+            ShipmentStatus.SCANNED, ShipmentStatus.INBOUND_SCAN, ShipmentStatus.IN_TRANSIT, ShipmentStatus.TRANSIT,
+            ShipmentStatus.DELIVERY,
+        ])
+    }
+
     status = models.CharField(max_length=12, choices=ShipmentStatus.choices)
+    # Time of the tracking event `status` comes from, older events do not overwrite it
+    status_updated_at = models.DateTimeField(null=True, blank=True)
+    # Parsed from the addresses on save for the filters (see set_locations), empty if an address is not valid
+    receiver_postal_code = models.CharField(max_length=32, blank=True, default='', db_index=True)
+    receiver_city = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    receiver_country = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    sender_postal_code = models.CharField(max_length=32, blank=True, default='', db_index=True)
+    sender_city = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    sender_country = models.CharField(max_length=100, blank=True, default='', db_index=True)
+
+    # Total quantity and value of the articles, maintained on write (see summaries.py)
+    item_count = models.PositiveIntegerField(default=0)
+    total_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     class Meta:
         indexes = [
             models.Index(
                 fields=['carrier', 'tracking_number'],
                 name='carrier_tracking_number_index'
-            )
+            ),
+            # Keyset orderings of the list, see ShipmentPagination
+            models.Index(fields=['item_count', 'id'], name='item_count_index'),
+            models.Index(fields=['total_value', 'id'], name='total_value_index'),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -44,6 +86,63 @@ class Shipment(models.Model):
     def __str__(self):
         return f'{self.carrier} - {self.tracking_number}'
 
+    LOCATION_FIELDS = [
+        'receiver_postal_code', 'receiver_city', 'receiver_country',
+        'sender_postal_code', 'sender_city', 'sender_country',
+    ]
+
+    # Written by QuerySet.update only (see summaries.py): the UPDATE of a save() leaves them out, the instance may
+    # hold the values it was loaded with, older than a concurrent change of the items
+    SUMMARY_FIELDS = ['item_count', 'total_value']
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.set_locations()
+        elif {'sender_address', 'receiver_address'} & set(update_fields):
+            self.set_locations()
+            kwargs['update_fields'] = set(update_fields) | set(self.LOCATION_FIELDS)
+        if self.pk is None:
+            # A new row, e.g. a copy (`pk = None`), has no items yet
+            self.item_count, self.total_value = 0, 0
+        super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Only the UPDATE: a save() still inserts the row if it is new or was deleted concurrently, like for any model
+        values = [value for value in values if value[0].name not in self.SUMMARY_FIELDS]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+    def set_locations(self):
+        """ Call it before saving with `bulk_create` or `bulk_update`, which do not call save() """
+        for prefix, address in (('receiver', self.receiver_address), ('sender', self.sender_address)):
+            location = parse_address(address or '')
+            setattr(self, f'{prefix}_postal_code', normalize_postal_code(location.postal_code) if location else '')
+            setattr(self, f'{prefix}_city', normalize_place(location.city) if location else '')
+            setattr(self, f'{prefix}_country', normalize_place(location.country) if location else '')
+
+    @classmethod
+    def can_transition(cls, status, status_updated_at, new_status, timestamp) -> bool:
+        """
+        Whether an event moves a shipment forward: a different, allowed status, from a newer event or from an
+        event of the same time with a further status (see STATUS_RANK)
+        """
+        if status_updated_at is not None:
+            if timestamp < status_updated_at:
+                return False
+            is_further = cls.STATUS_RANK.get(new_status, -1) > cls.STATUS_RANK.get(status, -1)
+            if timestamp == status_updated_at and not is_further:
+                return False
+        return new_status in cls.STATUS_TRANSITIONS.get(status, set(cls.ShipmentStatus) - {status})
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered to invalidate the cache of the old public URL if they are edited, see signals.py
+        instance._loaded_tracking_key = (instance.__dict__.get('carrier'), instance.__dict__.get('tracking_number'))
+        # And to move the shipment between the counters of ShipmentCounter
+        instance._loaded_counter_key = tuple(instance.__dict__.get(field) for field in ('carrier', 'status', 'receiver_country'))
+        return instance
+
 
 class ArticleShipmentItem(models.Model):
     article = models.ForeignKey(Article, on_delete=models.CASCADE)
@@ -58,3 +157,57 @@ class ArticleShipmentItem(models.Model):
                 name='unique_article_shipment'
             )
         ]
+
+
+class ShipmentCounter(models.Model):
+    """
+    Number of shipments per carrier, status and destination country, maintained on write and reconciled
+    periodically (see shipment_stats.py): the statistics never aggregate the shipments table.
+    """
+    carrier = models.CharField(max_length=32)
+    status = models.CharField(max_length=12, choices=Shipment.ShipmentStatus.choices)
+    # Shipment.receiver_country, empty if the address is not valid
+    country = models.CharField(max_length=100, blank=True)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('carrier', 'status', 'country'),
+                name='unique_shipment_counter'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.carrier} - {self.status} - {self.country}: {self.count}'
+
+
+class TrackingEvent(models.Model):
+    """
+    Append-only history of the carrier scans of a shipment, `Shipment.status` is the latest applied one.
+    On PostgreSQL the table is partitioned by month on `timestamp` (see migration 0003 and the
+    create_tracking_event_partitions command), so writes only touch the index of the current partition.
+    """
+    # Covered by the (shipment, timestamp) index
+    shipment = models.ForeignKey(Shipment, on_delete=models.CASCADE, related_name='tracking_events', db_index=False)
+    status = models.CharField(max_length=12, choices=Shipment.ShipmentStatus.choices)
+    timestamp = models.DateTimeField()
+    location = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            # Retried events are dropped. Also serves the (shipment, timestamp) lookups of the timeline
+            models.UniqueConstraint(
+                fields=('shipment', 'timestamp', 'status'),
+                name='unique_tracking_event'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.shipment_id} - {self.status} at {self.timestamp}'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Tracking events are append-only')
+        super().save(*args, **kwargs)
@@ -0,0 +1,132 @@
+"""
+Change notifications of the shipments, for the subscription stream (see async_views.shipment_events).
+
+The write paths publish the (carrier, tracking_number) of the changed shipments once committed, next to the
+tracking cache invalidation. Each process keeps a single subscription to the broker and wakes up its own
+subscribers, so an idle stream costs nothing but a heartbeat.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable
+
+from django.conf import settings
+
+from .two_tier_cache import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'shipment-changes'
+
+_brokers = {}
+
+
+def get_broker():
+    """
+    Entry Point: Get the broker based on the configuration (`SHIPMENT_EVENTS_BROKER`: "redis" or "local").
+    The broker is created once per process and reused.
+    """
+    if getattr(settings, 'SHIPMENT_EVENTS_BROKER', 'redis') == 'local':
+        broker_class = LocalBroker
+    else:
+        broker_class = RedisBroker
+
+    if broker_class not in _brokers:
+        _brokers[broker_class] = broker_class()
+    return _brokers[broker_class]
+
+
+class LocalBroker:
+    """ Notifies the subscribers of this process only, for tests and single process deployments """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, tracking_keys: Iterable[tuple]):
+        self.dispatch(tracking_keys)
+
+    def dispatch(self, tracking_keys: Iterable[tuple]):
+        """ Wake up the subscribers of the changed shipments, from any thread """
+        with self._lock:
+            subscribers = [
+                subscriber for tracking_key in tracking_keys for subscriber in self._subscribers.get(tuple(tracking_key), ())
+            ]
+        for loop, changes in subscribers:
+            try:
+                loop.call_soon_threadsafe(notify, changes)
+            except RuntimeError:
+                # The event loop of the subscriber is closed, it unsubscribes on its way out
+                pass
+
+    @contextmanager
+    def subscribe(self, tracking_key: tuple):
+        """
+        Yields:
+            asyncio.Queue: Gets an item when the shipment changed, changes in a row are coalesced.
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=1))
+        with self._lock:
+            self._subscribers[tracking_key].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[tracking_key].discard(subscriber)
+                if not self._subscribers[tracking_key]:
+                    del self._subscribers[tracking_key]
+
+
+def notify(changes: asyncio.Queue):
+    if changes.empty():
+        changes.put_nowait(True)
+
+
+class RedisBroker(LocalBroker):
+    """ Publishes the changes on a Redis channel, every process listens to it with one connection """
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, tracking_keys: Iterable[tuple]):
+        client = get_redis_client()
+        if client is None:
+            # Not deployed with Redis, the subscribers of this process are still notified
+            return super().publish(tracking_keys)
+        try:
+            client.publish(CHANNEL, json.dumps(list(tracking_keys)))
+        except Exception as exc:
+            logger.error(f"Failed to publish shipment changes: {exc}")
+
+    @contextmanager
+    def subscribe(self, tracking_key: tuple):
+        self.start_listener()
+        with super().subscribe(tracking_key) as changes:
+            yield changes
+
+    def start_listener(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            client = get_redis_client()
+            if client is None:
+                return
+            self._listener = threading.Thread(target=self.listen, args=(client,), name='shipment-changes', daemon=True)
+            self._listener.start()
+
+    def listen(self, client):
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    self.dispatch(json.loads(message['data']))
+            except Exception as exc:
+                logger.error(f"Shipment changes listener failed, reconnecting: {exc}")
+                time.sleep(1)
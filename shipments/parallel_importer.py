@@ -0,0 +1,168 @@
+"""
+Parallel import of shipment csv files across worker processes.
+
+1. Every input file is split into byte ranges aligned on line boundaries. The ranges are parsed in a
+   process pool and each row is spooled to the shard owning its `(carrier, tracking_number)`.
+2. The distinct articles are upserted once, in the parent process, so workers never race on them.
+3. Every shard is imported by one worker with `importer.import_chunk`. A shipment belongs to exactly one
+   shard, so workers never contend on the same `Shipment` / `ArticleShipmentItem` rows.
+
+Records must not contain embedded newlines (true for the carrier feeds), as ranges are split on lines.
+
+This module does not import the models at the top level: with the `spawn` start method the workers
+import it before Django is set up.
+"""
+import csv
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+
+def shard_of(carrier: str, tracking_number: str, shards: int) -> int:
+    """ Stable across processes, unlike `hash()` which is salted per interpreter """
+    return zlib.crc32(f'{carrier}\0{tracking_number}'.encode()) % shards
+
+
+def split_file(csv_file_path: str, parts: int) -> tuple:
+    """
+    Split a csv file into at most `parts` byte ranges. Each range owns the lines starting inside it.
+
+    Returns:
+        tuple: The header fieldnames and the list of `(path, start, end)` ranges.
+    """
+    with open(csv_file_path, 'rb') as file:
+        header = file.readline()
+        data_start = file.tell()
+        size = os.fstat(file.fileno()).st_size
+
+    fieldnames = next(csv.reader([header.decode()]))
+    step = max((size - data_start) // parts, 1)
+    bounds = list(range(data_start, size, step))[:parts] + [size]
+    ranges = [(csv_file_path, start, end) for start, end in zip(bounds, bounds[1:])]
+    return fieldnames, ranges
+
+
+def iter_range_lines(csv_file_path: str, start: int, end: int) -> Iterator[str]:
+    with open(csv_file_path, 'rb') as file:
+        file.seek(start - 1)
+        # The previous range owns the line we are in the middle of, unless it ends right before `start`
+        if file.read(1) != b'\n':
+            file.readline()
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            yield line.decode()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _partition_range(task: tuple) -> dict:
+    from .importer import article_values, has_article
+
+    (csv_file_path, start, end), fieldnames, index, spool_dir, shards = task
+    started_at = time.monotonic()
+
+    spools, writers, articles, rows = [], {}, {}, 0
+    try:
+        for row in csv.DictReader(iter_range_lines(csv_file_path, start, end), fieldnames=fieldnames):
+            shard = shard_of(row['carrier'], row['tracking_number'], shards)
+            if shard not in writers:
+                spools.append(open(os.path.join(spool_dir, f'{shard}-{index}.csv'), 'w', newline=''))
+                writers[shard] = csv.DictWriter(spools[-1], fieldnames=fieldnames)
+            writers[shard].writerow(row)
+            if has_article(row):
+                articles[row['SKU']] = article_values(row)
+            rows += 1
+    finally:
+        for spool in spools:
+            spool.close()
+
+    return {'pid': os.getpid(), 'parsed': rows, 'seconds': time.monotonic() - started_at, 'articles': articles}
+
+
+def _import_shard(task: tuple) -> dict:
+    from .importer import import_chunk, iter_chunks
+
+    shard, fieldnames, spool_dir, chunk_size = task
+    started_at = time.monotonic()
+
+    rows = 0
+    for name in sorted(os.listdir(spool_dir)):
+        if name.startswith(f'{shard}-'):
+            with open(os.path.join(spool_dir, name), newline='') as file:
+                for chunk in iter_chunks(csv.DictReader(file, fieldnames=fieldnames), chunk_size):
+                    rows += import_chunk(chunk, update_articles=False)
+
+    return {'pid': os.getpid(), 'imported': rows, 'seconds': time.monotonic() - started_at}
+
+
+def import_files(csv_file_paths: list, workers: int, chunk_size: int, shards: Optional[int] = None) -> dict:
+    """
+    Import many csv files (or one large file) in parallel.
+
+    Args:
+        csv_file_paths (list): csv files in the `data.csv` column layout, they must share the same header.
+        workers (int): Size of the process pool, with 1 everything runs in the current process.
+        chunk_size (int): Rows per `import_chunk` batch.
+        shards (Optional[int]): Number of `(carrier, tracking_number)` partitions, defaults to `workers`.
+
+    Returns:
+        dict: Per-worker stats keyed by pid (`parsed`, `imported` rows and busy `seconds`) and the totals.
+    """
+    from django.db import connections, transaction
+    from .importer import upsert_articles
+
+    shards = shards or workers
+    ranges, fieldnames = [], None
+    for csv_file_path in csv_file_paths:
+        fieldnames, file_ranges = split_file(csv_file_path, workers)
+        ranges += file_ranges
+
+    started_at = time.monotonic()
+    spool_dir = tempfile.mkdtemp(prefix='import_shipment_data_')
+    if workers > 1:
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        map_ = executor.map
+    else:
+        executor, map_ = None, map
+
+    try:
+        partitions = list(map_(_partition_range, [
+            (task_range, fieldnames, index, spool_dir, shards) for index, task_range in enumerate(ranges)
+        ]))
+        # In the order of the ranges, the last row of a SKU wins like in a sequential import
+        articles = {}
+        for partition in partitions:
+            articles.update(partition.pop('articles'))
+        with transaction.atomic():
+            upsert_articles(articles, chunk_size)
+        imports = list(map_(_import_shard, [
+            (shard, fieldnames, spool_dir, chunk_size) for shard in range(shards)
+        ]))
+    finally:
+        if executor:
+            executor.shutdown()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    per_worker = defaultdict(lambda: {'parsed': 0, 'imported': 0, 'seconds': 0.0})
+    for stats in partitions + imports:
+        worker = per_worker[stats.pop('pid')]
+        for key, value in stats.items():
+            worker[key] += value
+
+    return {
+        'workers': dict(per_worker),
+        'imported': sum(stats['imported'] for stats in imports),
+        'seconds': time.monotonic() - started_at,
+    }
@@ -0,0 +1,118 @@
+import asyncio
+import json
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+
+from shipments.db_router import ais_sticky, get_client_key, replica_reads
+from shipments.notifications import get_broker
+from shipments.tracking_cache import aget_tracking_cache, aset_tracking_cache, get_cache_key, tracking_local_cache
+from .fast_serializers import SHIPMENT_FIELDS, serialize_shipments
+from .serializers import ShipmentSerializer
+from .views import ShipmentViewSet, get_etag, get_version, is_not_modified
+
+
+# Seconds between two keep-alive comments of an idle stream, and before a stream is closed to be reopened
+DEFAULT_EVENTS_HEARTBEAT = 15
+DEFAULT_EVENTS_MAX_DURATION = 60*60
+
+
+async def aget_tracking_data(carrier: str, tracking_number: str) -> Optional[dict]:
+    """ Tracking response of a shipment without the weather, from the cache or else the database """
+    data = await aget_tracking_cache(carrier, tracking_number)
+    if data is None:
+        row = await ShipmentViewSet.queryset.prefetch_related(None).values(*SHIPMENT_FIELDS).filter(
+            carrier=carrier, tracking_number=tracking_number,
+        ).afirst()
+        if row is None:
+            return None
+
+        # The weather is looked up by the caller, without blocking the event loop
+        data = (await sync_to_async(serialize_shipments)([row], timeline=True))[0]
+        await aset_tracking_cache(carrier, tracking_number, data)
+    return data
+
+
+async def track_shipment(request, carrier, tracking_number):
+    """
+    Async variant of ShipmentViewSet.get_shipment, same response, cache and ETag handling.
+    Served by an ASGI worker, a slow weather upstream does not hold a thread: one worker can keep
+    thousands of tracking requests in flight.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    # Read from a replica like get_shipment. Not the event streams: they reload a shipment right after its change
+    with replica_reads(sticky=await ais_sticky(get_client_key(request, await request.auser()))):
+        data = await aget_tracking_data(carrier, tracking_number)
+    if data is None:
+        return JsonResponse({'detail': 'No Shipment matches the given query.'}, status=404)
+    data['weather'] = await ShipmentSerializer.aget_weather_for_address(data['receiver_address'])
+
+    etag = get_etag(data)
+    if is_not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(data)
+    response['ETag'] = etag
+    return response
+
+
+async def shipment_events(request, carrier, tracking_number):
+    """
+    Server-sent events stream of a shipment, instead of polling track_shipment: a `shipment` event with the
+    tracking response when the stream opens, then every time the status, the articles or the timeline change.
+    The changes are pushed by the write paths (see notifications.py), an idle stream only sends heartbeats.
+
+    The id of an event is the version of the shipment: a client reconnecting with it (`Last-Event-ID` header,
+    or `version` parameter) only gets an event if the shipment changed in the meantime.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    if await aget_tracking_data(carrier, tracking_number) is None:
+        return JsonResponse({'detail': 'No Shipment matches the given query.'}, status=404)
+
+    last_version = request.headers.get('Last-Event-ID') or request.GET.get('version')
+    return StreamingHttpResponse(
+        stream_shipment_events(carrier, tracking_number, last_version),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def stream_shipment_events(carrier: str, tracking_number: str, last_version: Optional[str]):
+    heartbeat = getattr(settings, 'SHIPMENT_EVENTS_HEARTBEAT', DEFAULT_EVENTS_HEARTBEAT)
+    closes_at = asyncio.get_running_loop().time() + getattr(
+        settings, 'SHIPMENT_EVENTS_MAX_DURATION', DEFAULT_EVENTS_MAX_DURATION,
+    )
+
+    # Subscribed before reading the shipment, a change in between is not missed
+    with get_broker().subscribe((carrier, tracking_number)) as changes:
+        yield f'retry: {int(heartbeat * 1000)}\n\n'
+        while True:
+            data = await aget_tracking_data(carrier, tracking_number)
+            if data is None:
+                yield 'event: deleted\ndata: {}\n\n'
+                return
+
+            version = get_version(data)
+            if version != last_version:
+                data['weather'] = await ShipmentSerializer.aget_weather_for_address(data['receiver_address'])
+                yield f'id: {version}\nevent: shipment\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+                last_version = version
+
+            while True:
+                timeout = min(heartbeat, closes_at - asyncio.get_running_loop().time())
+                if timeout <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(changes.get(), timeout=timeout)
+                    break
+                except asyncio.TimeoutError:
+                    yield ': heartbeat\n\n'
+
+            # The entry of this process may outlive the invalidation, the shared cache is up to date
+            tracking_local_cache.delete_many([get_cache_key(carrier, tracking_number)], publish=False)
@@ -0,0 +1,121 @@
+"""
+Read-only serialization of the shipments from `.values()` rows, with the output of ShipmentSerializer and
+ShipmentTrackingSerializer but without their per-field and per-row costs. Used by the list, retrieve and
+get_shipment actions, test_fast_serializers.py checks the equivalence with the DRF serializers.
+"""
+import math
+from collections import defaultdict
+from typing import Optional
+
+import orjson
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from shipments.models import ArticleShipmentItem, TrackingEvent
+from shipments.tracking_events import DEFAULT_TIMELINE_LIMIT
+from .serializers import ShipmentSerializer
+
+
+# Columns of the `.values()` rows, in the order of the serializer
+SHIPMENT_FIELDS = [field for field in ShipmentSerializer.Meta.fields if field not in ('articles', 'weather')]
+
+
+def serialize_shipments(rows: list, weather: Optional[dict] = None, timeline: bool = False) -> list:
+    """
+    Args:
+        rows (list[dict]): Shipments as `.values(*SHIPMENT_FIELDS)` rows.
+        weather (Optional[dict]): Weather keyed by location (see ShipmentViewSet.get_weathers), left out if None.
+        timeline (bool): Add the latest tracking events, like ShipmentTrackingSerializer.
+
+    Returns:
+        list[dict]: The serialized shipments, in the order of the rows. One query for the articles of all the rows,
+        and one for their timelines.
+    """
+    shipment_ids = [row['id'] for row in rows]
+    articles = get_articles(shipment_ids)
+    timelines = get_timelines(shipment_ids) if timeline else None
+
+    data = []
+    for row in rows:
+        shipment = {**row, 'total_value': f"{row['total_value']:f}", 'articles': articles.get(row['id'], [])}
+        if timelines is not None:
+            shipment['timeline'] = timelines.get(row['id'], [])
+        if weather is not None:
+            shipment['weather'] = ShipmentSerializer.get_weather_for_address(row['receiver_address'], weather)
+        data.append(shipment)
+    return data
+
+
+def get_articles(shipment_ids: list) -> dict:
+    articles = defaultdict(list)
+    items = ArticleShipmentItem.objects.filter(shipment_id__in=shipment_ids).order_by('id').values_list(
+        'shipment_id', 'id', 'article__name', 'article__price', 'article__sku', 'quantity',
+    )
+    for shipment_id, item_id, name, price, sku, quantity in items:
+        # The database returns the prices with their 2 decimal places, no need to quantize them again
+        articles[shipment_id].append({'id': item_id, 'name': name, 'price': f'{price:f}', 'sku': sku, 'quantity': quantity})
+    return articles
+
+
+def get_timelines(shipment_ids: list) -> dict:
+    """ Latest `TRACKING_TIMELINE_LIMIT` events of each shipment, newest first """
+    limit = getattr(settings, 'TRACKING_TIMELINE_LIMIT', DEFAULT_TIMELINE_LIMIT)
+    events = (
+        TrackingEvent.objects.filter(shipment_id__in=shipment_ids)
+        .annotate(row_number=Window(
+            RowNumber(), partition_by=F('shipment_id'), order_by=[F('timestamp').desc(), F('id').desc()],
+        ))
+        .filter(row_number__lte=limit)
+        .order_by('shipment_id', '-timestamp', '-id')
+        .values_list('shipment_id', 'status', 'timestamp', 'location')
+    )
+    timelines = defaultdict(list)
+    for shipment_id, status, timestamp, location in events:
+        timelines[shipment_id].append({'status': status, 'timestamp': format_datetime(timestamp), 'location': location})
+    return timelines
+
+
+def format_datetime(value) -> str:
+    """ Same as serializers.DateTimeField (ISO 8601 in the current timezone, "Z" for UTC) """
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def has_non_finite_float(data) -> bool:
+    """ Whether NaN or an infinity is nested in `data`, orjson would write them as null """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if type(value) is dict:
+            stack.extend(value.values())
+        elif type(value) in (list, tuple):
+            stack.extend(value)
+        elif type(value) is float and not math.isfinite(value):
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer output (compact, unicode) encoded with orjson. Only floats with an exponent are written
+    differently (e.g. 1e-7 instead of 1e-07). The datetimes, decimals and the other types that are not native
+    to JSON are converted by the encoder of JSONRenderer (e.g. "Z" for UTC datetimes), NaN and the
+    infinities are rendered by JSONRenderer itself: they are an error with STRICT_JSON, as there.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) or has_non_finite_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped by JSONRenderer, they are line terminators in JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
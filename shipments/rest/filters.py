@@ -0,0 +1,35 @@
+from django_filters import rest_framework as filters
+
+from shipments.locations import normalize_place, normalize_postal_code
+from shipments.models import Shipment
+
+
+class NormalizedCharFilter(filters.CharFilter):
+    """ Matches the location columns, stored normalized (see Shipment.set_locations), on their index """
+
+    def __init__(self, *args, normalize, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.normalize = normalize
+
+    def filter(self, qs, value):
+        return super().filter(qs, self.normalize(value) if value else value)
+
+
+class ShipmentFilterSet(filters.FilterSet):
+    receiver_postal_code = NormalizedCharFilter(normalize=normalize_postal_code)
+    receiver_city = NormalizedCharFilter(normalize=normalize_place)
+    receiver_country = NormalizedCharFilter(normalize=normalize_place)
+    sender_postal_code = NormalizedCharFilter(normalize=normalize_postal_code)
+    sender_city = NormalizedCharFilter(normalize=normalize_place)
+    sender_country = NormalizedCharFilter(normalize=normalize_place)
+
+    class Meta:
+        model = Shipment
+        fields = {
+            'status': ['exact'],
+            'tracking_number': ['exact'],
+            'carrier': ['exact'],
+            # Denormalized columns, e.g. `?total_value__gte=100&ordering=total_value`
+            'item_count': ['exact', 'gte', 'lte'],
+            'total_value': ['exact', 'gte', 'lte'],
+        }
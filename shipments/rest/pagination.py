@@ -0,0 +1,161 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (a.k.a. cursor) pagination on a unique, indexed ordering.
+
+    Unlike DRF's CursorPagination it supports composite keys, e.g. `(carrier, tracking_number)`, without
+    falling back on offsets: every page is a `WHERE key > last_key ORDER BY key LIMIT n` range scan, so deep
+    pages cost the same as the first one and rows inserted meanwhile never shift or repeat the iteration.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Name exposed in the `ordering` query param -> unique combination of (indexed) fields
+    orderings = {'id': ('id',)}
+    default_ordering = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering, position, self.reverse = self.decode_cursor(request, queryset.model)
+        fields = self.orderings[self.ordering]
+
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(fields, position, self.reverse))
+        queryset = queryset.order_by(*(f'-{field}' if self.reverse else field for field in fields))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not self.reverse else position is not None
+        self.has_previous = position is not None if not self.reverse else has_more
+        return self.page
+
+    @staticmethod
+    def keyset_filter(fields, position, reverse):
+        """ Expand `(f1, f2, ...) > (v1, v2, ...)` into a filter the database can serve from the index """
+        lookup = 'lt' if reverse else 'gt'
+        condition = Q()
+        for index, field in enumerate(fields):
+            # (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ...
+            condition |= Q(**dict(zip(fields[:index], position)), **{f'{field}__{lookup}': position[index]})
+        # Redundant bound on the leading column, so the planner can use an index range scan
+        return Q(**{f'{fields[0]}__{lookup}e': position[0]}) & condition
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, model):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering not in self.orderings:
+            ordering = self.default_ordering
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return ordering, None, False
+
+        fields = self.orderings[ordering]
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor['p'], bool(cursor['r'])
+            if cursor.get('o') != ordering or not isinstance(position, list) or len(position) != len(fields):
+                raise ValueError('Cursor of another ordering')
+            # The cursor comes from the client, its values reach the filter as the types of the fields
+            position = [model._meta.get_field(field).to_python(value) for field, value in zip(fields, position)]
+            if None in position:
+                raise ValueError('Null position')
+        except (TypeError, ValueError, KeyError, AttributeError, BinasciiError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return ordering, position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        # Pages of model instances or of `.values()` rows (see fast_serializers.py)
+        if isinstance(instance, dict):
+            position = [instance[field] for field in self.orderings[self.ordering]]
+        else:
+            position = [getattr(instance, field) for field in self.orderings[self.ordering]]
+        cursor = json.dumps(
+            {'o': self.ordering, 'p': position, 'r': int(reverse)}, separators=(',', ':'), cls=DjangoJSONEncoder,
+        )
+        return replace_query_param(self.base_url, self.cursor_query_param, urlsafe_b64encode(cursor.encode()).decode())
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param, 'required': False, 'in': 'query',
+                'description': 'The pagination cursor value.', 'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param, 'required': False, 'in': 'query',
+                'description': 'Number of results to return per page.', 'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.ordering_query_param, 'required': False, 'in': 'query',
+                'description': 'Which field to use when ordering the results.',
+                'schema': {'type': 'string', 'enum': list(self.orderings)},
+            },
+        ]
+
+
+class ShipmentPagination(KeysetPagination):
+    # Backed by the `id` primary key, `carrier_tracking_number_index`, `item_count_index` and `total_value_index`
+    orderings = {
+        'id': ('id',),
+        'carrier_tracking_number': ('carrier', 'tracking_number'),
+        'item_count': ('item_count', 'id'),
+        'total_value': ('total_value', 'id'),
+    }
@@ -0,0 +1,37 @@
+import csv
+from io import StringIO
+
+from rest_framework.renderers import BaseRenderer
+
+from shipments.exporter import CONTENT_TYPES
+from .fast_serializers import FastJSONRenderer
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Negotiates `text/csv` for the export, which streams its own content (see exporter.py). Only the responses
+    of the view, e.g. the errors, are rendered here: a header line with their keys and a line with their values.
+    """
+    media_type = CONTENT_TYPES['csv']
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        output = StringIO()
+        csv.writer(output).writerows([data.keys(), data.values()])
+        return output.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    """ Negotiates `application/x-ndjson` for the export, the responses of the view are rendered as one line """
+    media_type = CONTENT_TYPES['ndjson']
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return super().render(data, accepted_media_type, renderer_context) + b'\n'
@@ -1,6 +1,8 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .views import ArticleViewSet, ArticleShipmentItemViewSet, ShipmentViewSet
+from .async_views import shipment_events, track_shipment
+from .views import ArticleViewSet, ArticleShipmentItemViewSet, CacheStatsView, ShipmentViewSet
 
 router = DefaultRouter()
 
@@ -8,4 +10,8 @@ router.register(r'articles', ArticleViewSet)
 router.register(r'article_shipment_items', ArticleShipmentItemViewSet)
 router.register(r'shipments', ShipmentViewSet)
 
-urls = router.urls
+urls = router.urls + [
+    path('track/<str:carrier>/<str:tracking_number>/', track_shipment, name='track_shipment'),
+    path('track/<str:carrier>/<str:tracking_number>/events/', shipment_events, name='shipment_events'),
+    path('cache_stats/', CacheStatsView.as_view(), name='cache_stats'),
+]
@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
-from shipments.models import Article, ArticleShipmentItem, Shipment
+from shipments.importer import normalize_status
+from shipments.locations import parse_address
+from shipments.models import Article, ArticleShipmentItem, Shipment, TrackingEvent
 from shipments.weather_integration import get_client
 
 
@@ -9,6 +12,13 @@ class ArticleSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'price', 'sku']
 
 
+class ArticleUpsertSerializer(serializers.Serializer):
+    """ An article of the bulk upsert endpoint: an existing SKU is updated rather than rejected as a duplicate """
+    sku = serializers.CharField(max_length=100)
+    name = serializers.CharField(max_length=100)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
 class ArticleShipmentItemSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='article.name')
     price = serializers.DecimalField(source='article.price', max_digits=10, decimal_places=2)
@@ -19,6 +29,47 @@ class ArticleShipmentItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'price', 'sku', 'quantity']
 
 
+class TrackingEventSerializer(serializers.ModelSerializer):
+    """ The raw carrier payload is kept internal """
+    class Meta:
+        model = TrackingEvent
+        fields = ['status', 'timestamp', 'location']
+
+
+class TrackingEventIngestSerializer(serializers.Serializer):
+    """ A carrier scan pushed to the bulk ingestion endpoint, the status can also be a label (e.g. "in-transit") """
+    carrier = serializers.CharField(max_length=32)
+    tracking_number = serializers.CharField(max_length=100)
+    status = serializers.ChoiceField(choices=Shipment.ShipmentStatus.choices)
+    timestamp = serializers.DateTimeField()
+    location = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    payload = serializers.JSONField(required=False, default=dict)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict) and isinstance(data.get('status'), str):
+            data = {**data, 'status': normalize_status(data['status'])}
+        return super().to_internal_value(data)
+
+
+class TrackingKeySerializer(serializers.Serializer):
+    carrier = serializers.CharField(max_length=32)
+    tracking_number = serializers.CharField(max_length=100)
+
+
+# Pairs looked up by one batch tracking request
+DEFAULT_LOOKUP_MAX_SHIPMENTS = 500
+
+
+class TrackingLookupSerializer(serializers.Serializer):
+    shipments = TrackingKeySerializer(many=True, allow_empty=False)
+
+    def validate_shipments(self, shipments):
+        max_shipments = getattr(settings, 'TRACKING_LOOKUP_MAX_SHIPMENTS', DEFAULT_LOOKUP_MAX_SHIPMENTS)
+        if len(shipments) > max_shipments:
+            raise serializers.ValidationError(f'At most {max_shipments} shipments can be looked up at once.')
+        return shipments
+
+
 class ShipmentSerializer(serializers.ModelSerializer):
     articles = ArticleShipmentItemSerializer(many=True, source='articleshipmentitem_set', read_only=True)
     weather = serializers.SerializerMethodField(read_only=True)
@@ -27,11 +78,48 @@ class ShipmentSerializer(serializers.ModelSerializer):
         model = Shipment
         fields = [
             'id', 'tracking_number', 'carrier', 'sender_address',
-            'receiver_address', 'status', 'articles', 'weather',
+            'receiver_address', 'status', 'item_count', 'total_value', 'articles', 'weather',
         ]
+        # Maintained from the articles, see summaries.py
+        read_only_fields = ['item_count', 'total_value']
     
+    @staticmethod
+    def get_weather_location(address):
+        """ Key of the weather of an address: shipments to the same postal code share it """
+        location = parse_address(address)
+        return location.key if location else None
+
     def get_weather(self, obj):
-        reciever_address_sections = obj.receiver_address.split(',')
-        if len(reciever_address_sections) != 3:
+        return self.get_weather_for_address(obj.receiver_address, self.context.get('weather'))
+
+    @classmethod
+    def get_weather_for_address(cls, receiver_address, weather=None):
+        """
+        Args:
+            receiver_address (str): Receiver address of the shipment.
+            weather (Optional[dict]): Weather prefetched for a whole page keyed by location, see ShipmentViewSet.list
+        """
+        location = cls.get_weather_location(receiver_address)
+        if location is None:
             return 'Receiver address is not valid! Valid address format: "<Street>, <Postal_Code City>, <Country>"'
-        return get_client().get_weather(obj.receiver_address)
+
+        if weather is not None and location in weather:
+            return weather[location]
+        return get_client().get_weather(location)
+
+    @classmethod
+    async def aget_weather_for_address(cls, receiver_address):
+        """ Async variant of get_weather_for_address, pass its result in the `weather` context to serialize """
+        location = cls.get_weather_location(receiver_address)
+        if location is None:
+            return cls.get_weather_for_address(receiver_address)
+        return await get_client().aget_weather(location)
+
+
+class ShipmentTrackingSerializer(ShipmentSerializer):
+    """ Public tracking response, with the latest events (see tracking_events.get_timeline_prefetch) """
+    timeline = TrackingEventSerializer(many=True, read_only=True)
+
+    class Meta(ShipmentSerializer.Meta):
+        # Before the weather, which is added last to the cached responses
+        fields = ShipmentSerializer.Meta.fields[:-1] + ['timeline', 'weather']
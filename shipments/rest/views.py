@@ -1,17 +1,90 @@
-from rest_framework import viewsets, permissions
+import hashlib
+import json
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils.cache import parse_etags, quote_etag
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import viewsets, permissions, status
 from rest_framework.generics import get_object_or_404
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 
 
+from shipments import two_tier_cache
+from shipments.db_router import read_from_replicas
+from shipments.exporter import CONTENT_TYPES, EXPORT_FORMATS, iter_export
+from shipments.importer import upsert_articles
 from shipments.models import Article, Shipment, ArticleShipmentItem
-from .serializers import ArticleSerializer, ShipmentSerializer, ArticleShipmentItemSerializer
+from shipments.shipment_stats import get_shipment_stats
+from shipments.tracking_cache import get_tracking_cache, set_tracking_cache
+from shipments.tracking_events import get_timeline_prefetch, ingest_tracking_events
+from shipments.weather_integration import get_client
+from .fast_serializers import SHIPMENT_FIELDS, FastJSONRenderer, serialize_shipments
+from .filters import ShipmentFilterSet
+from .pagination import KeysetPagination, ShipmentPagination
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .serializers import (
+    ArticleSerializer, ArticleUpsertSerializer, ShipmentSerializer, ShipmentTrackingSerializer, ArticleShipmentItemSerializer,
+    TrackingEventIngestSerializer, TrackingLookupSerializer,
+)
 
 from rest_framework.views import APIView
 
+
+def get_version(data):
+    return hashlib.md5(json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()).hexdigest()
+
+
+def get_etag(data):
+    return quote_etag(get_version(data))
+
+
+def is_not_modified(request, etag):
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    return etag in if_none_match or '*' in if_none_match
+
+
 class ArticleViewSet(viewsets.ModelViewSet):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
+    pagination_class = KeysetPagination
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='bulk',
+        url_name='bulk',
+        serializer_class=ArticleUpsertSerializer,
+    )
+    def bulk(self, request):
+        """
+        Create or update many articles at once, keyed by SKU: `[{"sku", "name", "price"}, ...]`.
+        Applied in batches of `INSERT ... ON CONFLICT (sku) DO UPDATE` (see importer.upsert_articles),
+        the last item of a SKU wins. Nothing is written if an item is invalid.
+        """
+        serializer = ArticleUpsertSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        articles = {article['sku']: (article['name'], article['price']) for article in serializer.validated_data}
+        with transaction.atomic():
+            upserted = upsert_articles(articles)
+
+        return Response({
+            'received': len(serializer.validated_data),
+            'created': len(upserted.created),
+            'updated': len(upserted.updated),
+            'unchanged': len(articles) - len(upserted.created) - len(upserted.updated),
+        })
 
 
 class ArticleShipmentItemViewSet(viewsets.ModelViewSet):
@@ -20,10 +93,67 @@ class ArticleShipmentItemViewSet(viewsets.ModelViewSet):
 
 
 class ShipmentViewSet(viewsets.ModelViewSet):
-    queryset = Shipment.objects.prefetch_related('articleshipmentitem_set')
+    # ArticleShipmentItemSerializer reads the article fields, fetch them in the same prefetch query
+    queryset = Shipment.objects.prefetch_related(
+        Prefetch('articleshipmentitem_set', queryset=ArticleShipmentItem.objects.select_related('article').order_by('id'))
+    )
     serializer_class = ShipmentSerializer
+    pagination_class = ShipmentPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filterset_class = ShipmentFilterSet
+    # `?search=` matches any of them (substring, case insensitive), on trigram indexes on PostgreSQL
+    search_fields = ['tracking_number', 'receiver_address', 'sender_address']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('get_shipment', 'lookup'):
+            queryset = queryset.prefetch_related(get_timeline_prefetch())
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'get_shipment':
+            return ShipmentTrackingSerializer
+        return super().get_serializer_class()
+
+    def get_weathers(self, addresses):
+        """ Weather of the distinct locations of the receiver `addresses`, fetched in one batch """
+        locations = (ShipmentSerializer.get_weather_location(address) for address in addresses)
+        return get_client().get_weathers(location for location in locations if location)
+
+    def get_weather_context(self, shipments):
+        """ Serializer context with the weather of the distinct locations of `shipments` """
+        context = self.get_serializer_context()
+        context['weather'] = self.get_weathers(shipment.receiver_address for shipment in shipments)
+        return context
+
+    def get_rows(self, queryset):
+        """ The shipments as `.values()` rows for serialize_shipments, without the prefetches of the instances """
+        return queryset.prefetch_related(None).values(*SHIPMENT_FIELDS)
+
+    @read_from_replicas
+    def list(self, request, *args, **kwargs):
+        """
+        Same response as ModelViewSet.list, built from `.values()` rows (see fast_serializers.py). The weather
+        of the distinct locations of the page is fetched in one batch (one cache round trip, concurrent upstream
+        calls for the misses) before serializing.
+        """
+        queryset = self.get_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        rows = list(page if page is not None else queryset)
+        data = serialize_shipments(rows, self.get_weathers(row['receiver_address'] for row in rows))
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
-    filterset_fields = ['status', 'tracking_number', 'carrier']
+    @read_from_replicas
+    def retrieve(self, request, *args, **kwargs):
+        """ Same response as ModelViewSet.retrieve, built from a `.values()` row """
+        queryset = self.get_rows(self.filter_queryset(self.get_queryset()))
+        row = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]})
+        return Response(serialize_shipments([row], self.get_weathers([row['receiver_address']]))[0])
 
     @action(
         detail=False,
@@ -31,9 +161,142 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         url_name='get_shipment',
         permission_classes=[permissions.AllowAny],
     )
+    @read_from_replicas
     def get_shipment(self, request, carrier, tracking_number):
-        """ Get a single shipment by tracking number and carrier, without authentication. """
-        shipment = get_object_or_404(self.get_queryset(), tracking_number=tracking_number, carrier=carrier)
-        serializer = self.get_serializer(shipment)
-        return Response(serializer.data)
+        """
+        Get a single shipment by tracking number and carrier, without authentication.
+        The response includes the latest tracking events and is cached until the shipment, its articles
+        or its events change (see signals.py), only the weather is looked up on every request. Supports `If-None-Match` to answer unchanged polls with a 304.
+        """
+        data = get_tracking_cache(carrier, tracking_number)
+        if data is None:
+            row = get_object_or_404(self.get_rows(self.get_queryset()), tracking_number=tracking_number, carrier=carrier)
+            data = serialize_shipments([row], timeline=True)[0]
+            set_tracking_cache(carrier, tracking_number, data)
+        data['weather'] = ShipmentSerializer.get_weather_for_address(data['receiver_address'])
+
+        etag = get_etag(data)
+        if is_not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+    @action(detail=False, url_path='stats', url_name='stats')
+    @read_from_replicas
+    def stats(self, request):
+        """
+        Number of shipments per carrier and status, per destination country as well with `?by_country=true`.
+        Served from counters maintained on write (see shipment_stats.py), whatever the number of shipments.
+        """
+        by_country = request.query_params.get('by_country', '').lower() in ('1', 'true')
+        return Response(get_shipment_stats(by_country))
+
+    @action(
+        detail=False,
+        url_path='export',
+        url_name='export',
+        renderer_classes=[FastJSONRenderer, CSVRenderer, NDJSONRenderer],
+    )
+    def export(self, request):
+        """
+        Stream the shipments matching the filters and the search of the list as csv, in the layout
+        of `import_shipment_data`, or as NDJSON with `?export_format=ndjson` or `Accept: application/x-ndjson`.
+        Unlike the list, the export is not paginated and never held in memory: it is written while it is read
+        (see exporter.py).
+        """
+        accepted_format = request.accepted_renderer.format
+        export_format = request.query_params.get(
+            'export_format', accepted_format if accepted_format in EXPORT_FORMATS else 'csv',
+        )
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'detail': f'Unknown export format, expected one of: {", ".join(EXPORT_FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return StreamingHttpResponse(
+            iter_export(self.filter_queryset(self.get_queryset()), export_format),
+            content_type=CONTENT_TYPES[export_format],
+            headers={'Content-Disposition': f'attachment; filename="shipments.{export_format}"'},
+        )
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='lookup',
+        url_name='lookup',
+        permission_classes=[permissions.AllowAny],
+        serializer_class=TrackingLookupSerializer,
+    )
+    def lookup(self, request):
+        """
+        Track many shipments at once, without authentication: `{"shipments": [{"carrier", "tracking_number"}, ...]}`.
+        The shipments are read with one query on the (carrier, tracking_number) index plus the prefetches, and the
+        weather of their distinct locations in one batch. The results are keyed by "<carrier>/<tracking_number>"
+        in the order of the request, with `"found": false` for the unknown ones.
+        """
+        serializer = TrackingLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tracking_keys = list(dict.fromkeys(
+            (shipment['carrier'], shipment['tracking_number']) for shipment in serializer.validated_data['shipments']
+        ))
+
+        shipments = self.get_queryset().filter(reduce(or_, (
+            Q(carrier=carrier, tracking_number=tracking_number) for carrier, tracking_number in tracking_keys
+        )))
+        shipments = {(shipment.carrier, shipment.tracking_number): shipment for shipment in shipments}
+        data = ShipmentTrackingSerializer(
+            list(shipments.values()), many=True, context=self.get_weather_context(shipments.values()),
+        ).data
+        data = {(shipment['carrier'], shipment['tracking_number']): shipment for shipment in data}
+
+        return Response({
+            f'{carrier}/{tracking_number}': {
+                'found': (carrier, tracking_number) in data,
+                'shipment': data.get((carrier, tracking_number)),
+            }
+            for carrier, tracking_number in tracking_keys
+        })
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='events',
+        url_name='ingest_events',
+        parser_classes=[JSONParser, NDJSONParser],
+        serializer_class=TrackingEventIngestSerializer,
+    )
+    def ingest_events(self, request):
+        """
+        Bulk ingestion of carrier scan events, as a JSON array or as NDJSON (`Content-Type: application/x-ndjson`).
+        The valid events are applied in set-based batches (see tracking_events.ingest_tracking_events),
+        the response has a result for every item, in the same order.
+        """
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of events.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One serializer validates every item, binding its fields per item would cost more than applying the events
+        serializer = TrackingEventIngestSerializer()
+        validated, results = [], []
+        for item in request.data:
+            try:
+                validated.append(serializer.run_validation(item))
+                results.append(None)
+            except ValidationError as exc:
+                results.append({'result': 'invalid', 'errors': exc.detail})
+
+        ingested = iter(ingest_tracking_events(validated))
+        results = [result or {'result': next(ingested)} for result in results]
+        counts = Counter(result['result'] for result in results)
+        return Response({
+            'received': len(results),
+            **{name: counts[name] for name in ('updated', 'recorded', 'duplicate', 'not_found', 'invalid')},
+            'results': results,
+        })
+
+
+
+class CacheStatsView(APIView):
+    """ Hit ratios of the local and shared cache tiers, for the process serving the request """
+    permission_classes = [permissions.IsAdminUser]
 
+    def get(self, request):
+        return Response(two_tier_cache.get_stats())
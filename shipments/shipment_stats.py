@@ -0,0 +1,92 @@
+"""
+Shipment counts per carrier, status and destination country for the dashboards, served from ShipmentCounter
+in constant time instead of a `GROUP BY` over the shipments.
+
+The write paths apply their deltas in their own transaction, with one upsert: the signals of Shipment (see
+signals.py), the importer and the tracking event transitions. Writes that bypass them (raw SQL, other
+`QuerySet.update()` calls) are caught up by reconcile_shipment_counters, see the reconcile_shipment_stats command.
+"""
+from collections import Counter
+
+from django.db import connections, router, transaction
+from django.db.models import Count
+
+from .models import Shipment, ShipmentCounter
+
+
+UPSERT_COUNTERS = """
+INSERT INTO {table} (carrier, status, country, count) VALUES {values}
+ON CONFLICT (carrier, status, country) DO UPDATE SET count = {table}.count + EXCLUDED.count
+"""
+
+
+def get_counter_key(shipment: Shipment) -> tuple:
+    return shipment.carrier, shipment.status, shipment.receiver_country
+
+
+def update_shipment_counters(deltas: dict):
+    """
+    Args:
+        deltas (dict): Count changes keyed by `(carrier, status, country)`.
+    """
+    # Sorted, concurrent upserts lock the counters in the same order and can not deadlock
+    deltas = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if not deltas:
+        return
+
+    connection = connections[router.db_for_write(ShipmentCounter)]
+    sql = UPSERT_COUNTERS.format(
+        table=connection.ops.quote_name(ShipmentCounter._meta.db_table),
+        values=', '.join(['(%s, %s, %s, %s)'] * len(deltas)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for key, delta in deltas for value in (*key, delta)])
+
+
+def get_shipment_stats(by_country: bool = False) -> dict:
+    """
+    Returns:
+        dict: `total` and `counts` keyed by carrier then status (then country if `by_country`).
+    """
+    counts, total = {}, 0
+    for carrier, status, country, count in ShipmentCounter.objects.filter(count__gt=0).order_by(
+        'carrier', 'status', 'country',
+    ).values_list('carrier', 'status', 'country', 'count'):
+        total += count
+        statuses = counts.setdefault(carrier, {})
+        if by_country:
+            statuses.setdefault(status, {})[country] = count
+        else:
+            statuses[status] = statuses.get(status, 0) + count
+    return {'total': total, 'counts': counts}
+
+
+def reconcile_shipment_counters() -> dict:
+    """
+    Recount the shipments and correct the counters that drifted. On PostgreSQL the counters are locked
+    (the stats stay readable) while recounting: the writers committed before are in the recount, the others
+    apply their deltas after it, none is counted twice or missed.
+
+    Returns:
+        dict: The corrections applied, keyed by `(carrier, status, country)`.
+    """
+    using = router.db_for_write(ShipmentCounter)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {connection.ops.quote_name(ShipmentCounter._meta.db_table)} IN EXCLUSIVE MODE')
+
+        actual = Counter({
+            (carrier, status, country): count
+            for carrier, status, country, count in Shipment.objects.using(using).order_by()
+            .values_list('carrier', 'status', 'receiver_country').annotate(count=Count('id'))
+        })
+        stored = Counter({
+            (carrier, status, country): count
+            for carrier, status, country, count in ShipmentCounter.objects.using(using)
+            .values_list('carrier', 'status', 'country', 'count')
+        })
+        corrections = {key: actual[key] - stored[key] for key in actual.keys() | stored.keys() if actual[key] != stored[key]}
+        update_shipment_counters(corrections)
+    return corrections
@@ -0,0 +1,83 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Article, ArticleShipmentItem, Shipment, TrackingEvent
+from .shipment_stats import get_counter_key, update_shipment_counters
+from .summaries import update_article_shipment_summaries, update_shipment_summaries
+from .tracking_cache import invalidate_tracking_cache
+
+
+def invalidate_shipments(**filters):
+    invalidate_tracking_cache(Shipment.objects.filter(**filters).values_list('carrier', 'tracking_number'))
+
+
+def get_loaded_counter_key(instance):
+    """ Counter of the shipment as loaded, None if unknown (fields deferred): reconcile_shipment_counters catches up """
+    loaded_key = getattr(instance, '_loaded_counter_key', None)
+    return loaded_key if loaded_key is not None and None not in loaded_key else None
+
+
+@receiver(post_save, sender=Shipment)
+def count_shipment(sender, instance, created, **kwargs):
+    key, loaded_key = get_counter_key(instance), get_loaded_counter_key(instance)
+    if created:
+        update_shipment_counters({key: 1})
+    elif loaded_key is not None and loaded_key != key:
+        update_shipment_counters({loaded_key: -1, key: 1})
+    instance._loaded_counter_key = key
+
+
+@receiver(post_delete, sender=Shipment)
+def uncount_shipment(sender, instance, **kwargs):
+    update_shipment_counters({get_loaded_counter_key(instance) or get_counter_key(instance): -1})
+
+
+@receiver(post_save, sender=Shipment)
+@receiver(post_delete, sender=Shipment)
+def invalidate_shipment(sender, instance, **kwargs):
+    tracking_keys = {(instance.carrier, instance.tracking_number)}
+    # The public URL changes if the carrier or the tracking number is edited
+    tracking_keys.add(getattr(instance, '_loaded_tracking_key', (instance.carrier, instance.tracking_number)))
+    invalidate_tracking_cache(tracking_keys)
+
+
+@receiver(post_save, sender=ArticleShipmentItem)
+@receiver(post_delete, sender=ArticleShipmentItem)
+def invalidate_article_shipment_item(sender, instance, **kwargs):
+    # Also sent for the items of a deleted article or shipment, the latter has no summary to update
+    update_shipment_summaries([instance.shipment_id])
+    invalidate_shipments(pk=instance.shipment_id)
+
+
+@receiver(post_save, sender=TrackingEvent)
+def invalidate_tracking_event(sender, instance, **kwargs):
+    """ The tracking response includes the timeline, see also tracking_events.record_tracking_events """
+    invalidate_shipments(pk=instance.shipment_id)
+
+
+@receiver(post_save, sender=Article)
+def invalidate_article(sender, instance, created, **kwargs):
+    # Deleting an article cascades to its items, which invalidate their shipments
+    if not created:
+        update_article_shipment_summaries([instance.pk])
+        invalidate_shipments(articles=instance)
+
+
+@receiver(m2m_changed, sender=Shipment.articles.through)
+def invalidate_shipment_articles(sender, instance, action, reverse, pk_set, **kwargs):
+    """ `shipment.articles.add()` and friends bypass the ArticleShipmentItem save signals """
+    if action == 'pre_clear' and reverse:
+        # Gone once cleared
+        instance._cleared_shipment_ids = set(instance.shipments.values_list('pk', flat=True))
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        update_shipment_summaries([instance.pk])
+        invalidate_tracking_cache([(instance.carrier, instance.tracking_number)])
+    elif action == 'post_clear':
+        shipment_ids = instance.__dict__.pop('_cleared_shipment_ids', set())
+        update_shipment_summaries(shipment_ids)
+        invalidate_shipments(pk__in=shipment_ids)
+    else:
+        update_shipment_summaries(pk_set)
+        invalidate_shipments(pk__in=pk_set)
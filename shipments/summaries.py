@@ -0,0 +1,47 @@
+"""
+Denormalized summary of the articles of a shipment (`Shipment.item_count`, `Shipment.total_value`), so that
+lists and dashboards filter and order on indexed columns instead of aggregating the items.
+
+Every write path of the items and of the prices calls update_shipment_summaries in its transaction:
+the signals (see signals.py), the importer and the article upsert.
+"""
+from decimal import Decimal
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, PositiveIntegerField, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import ArticleShipmentItem, Shipment
+
+
+def update_shipment_summaries(shipment_ids: Iterable[int]):
+    """
+    Recompute the summary of the shipments from their items, with one locking select and one UPDATE.
+    The shipments are locked first, in id order: a concurrent writer of the same shipment waits and then
+    recomputes from the committed items, rather than overwriting them with the ones it saw.
+    """
+    shipment_ids = sorted(set(shipment_ids))
+    if not shipment_ids:
+        return
+
+    items = ArticleShipmentItem.objects.filter(shipment=OuterRef('pk')).order_by().values('shipment')
+    with transaction.atomic(savepoint=False):
+        list(Shipment.objects.select_for_update().filter(pk__in=shipment_ids).order_by('pk').values_list('pk'))
+        Shipment.objects.filter(pk__in=shipment_ids).update(
+            item_count=Coalesce(
+                Subquery(items.annotate(total=Sum('quantity')).values('total')),
+                0, output_field=PositiveIntegerField(),
+            ),
+            total_value=Coalesce(
+                Subquery(items.annotate(total=Sum(F('quantity') * F('article__price'))).values('total')),
+                Decimal(0), output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
+
+def update_article_shipment_summaries(articles):
+    """ After a price change: the shipments of the articles (a queryset, instances or primary keys) """
+    update_shipment_summaries(
+        ArticleShipmentItem.objects.filter(article__in=articles).values_list('shipment_id', flat=True).distinct()
+    )
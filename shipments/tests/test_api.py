@@ -9,6 +9,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase, force_authenticate
 
 from shipments.models import Shipment, Article, ArticleShipmentItem
+from shipments.tests.utils import QueryCountAssertionsMixin
 
 class ShipmentViewSetTestCase(APITestCase):
     def setUp(self):
@@ -45,6 +46,24 @@ class ShipmentViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+    def test_list_shipments_with_batched_weather(self):
+        Shipment.objects.create(
+            tracking_number="TN12345679",
+            carrier="DHL",
+            sender_address="Street 1, 10115 Berlin, Germany",
+            receiver_address="Street 10, 75001 Paris, France",
+            status="IN_TRANSIT"
+        )
+        self.client.force_authenticate(user=self.super_user)
+        response = self.client.get(reverse('shipment-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(len(results), 2)
+        self.assertIn('Dummy', results[0]['weather']['condition'])
+        self.assertEqual(results[0]['weather'], results[1]['weather'])
+
+
     def test_get_shipment(self):
         response = self.client.get(f'/v1/shipments/{self.shipment.carrier}/{self.shipment.tracking_number}/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -55,8 +74,8 @@ class ShipmentViewSetTestCase(APITestCase):
         self.client.force_authenticate(user=self.super_user)
         response = self.client.get(reverse('shipment-list'), {'status': 'IN_TRANSIT'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['status'], 'IN_TRANSIT')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['status'], 'IN_TRANSIT')
 
 
     def test_get_shipment_by_tracking_number_and_carrier(self):
@@ -100,3 +119,57 @@ class ShipmentViewSetTestCase(APITestCase):
         self.assertEqual(Shipment.objects.count(), 1)
         self.assertIn('sender_address', response.data)
         self.assertNotIn('receiver_address', response.data)
+
+
+class ShipmentQueryCountTestCase(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        self.super_user = get_user_model().objects.create_superuser('admin', 'random_pass')
+        self.client.force_authenticate(user=self.super_user)
+        self.shipment = self.create_shipment()
+
+    def create_shipment(self, articles=2):
+        index = Shipment.objects.count()
+        shipment = Shipment.objects.create(
+            tracking_number=f"TN{index}",
+            carrier="DHL",
+            sender_address="Street 1, 10115 Berlin, Germany",
+            receiver_address="Street 10, 75001 Paris, France",
+            status="IN_TRANSIT"
+        )
+        self.add_articles(shipment, articles)
+        return shipment
+
+    def add_articles(self, shipment, count):
+        for _ in range(count):
+            index = Article.objects.count()
+            shipment.articles.add(Article.objects.create(name=f"Article {index}", price=10, sku=f"SKU{index}"))
+
+
+    def test_list_shipments_query_count(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(reverse('shipment-list')),
+            lambda: [self.create_shipment(articles=3) for _ in range(3)],
+        )
+
+
+    def test_retrieve_shipment_query_count(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(reverse('shipment-detail', args=[self.shipment.pk])),
+            lambda: self.add_articles(self.shipment, 3),
+        )
+
+
+    def test_get_shipment_query_count(self):
+        url = reverse('shipment-get_shipment', args=[self.shipment.carrier, self.shipment.tracking_number])
+        self.client.force_authenticate(user=None)
+        self.assertConstantQueries(
+            lambda: self.client.get(url),
+            lambda: self.add_articles(self.shipment, 3),
+        )
+
+
+    def test_list_article_shipment_items_query_count(self):
+        self.assertConstantQueries(
+            lambda: self.client.get(reverse('articleshipmentitem-list')),
+            lambda: self.create_shipment(articles=3),
+        )
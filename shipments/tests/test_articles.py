@@ -0,0 +1,139 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from shipments.importer import import_chunk, upsert_articles
+from shipments.models import Article, ArticleShipmentItem
+from .test_tracking_cache import ShipmentFixtureMixin
+
+
+class UpsertArticlesTestCase(ShipmentFixtureMixin, TestCase):
+    def test_upsert(self):
+        upserted = upsert_articles({
+            'LP123': ('Laptop', Decimal('1200.00')),
+            'MO456': ('Mouse', Decimal('25')),
+        })
+        self.assertEqual((upserted.created, upserted.updated), ({'MO456'}, set()))
+        self.assertEqual(upserted.ids, dict(Article.objects.values_list('sku', 'pk')))
+
+        upserted = upsert_articles({'LP123': ('Laptop Pro', Decimal('1500')), 'MO456': ('Mouse', Decimal('25.00'))})
+        self.assertEqual((upserted.created, upserted.updated), (set(), {'LP123'}))
+        self.assertEqual(Article.objects.count(), 2)
+        self.article.refresh_from_db()
+        self.assertEqual((self.article.name, self.article.price), ('Laptop Pro', Decimal('1500')))
+
+    def test_queries_per_batch(self):
+        articles = {f'SKU{i}': (f'Article {i}', Decimal(i)) for i in range(10)}
+        # A select and an upsert per batch
+        with self.assertNumQueries(6):
+            upsert_articles(articles, batch_size=4)
+        # Nothing to write
+        with self.assertNumQueries(3):
+            upsert_articles(articles, batch_size=4)
+
+    def test_invalidates_tracking_cache(self):
+        self.client.get(self.url)
+        upsert_articles({'LP123': ('Laptop', Decimal('1000'))})
+        self.assertEqual(self.client.get(self.url).data['articles'][0]['price'], '1000.00')
+
+    def test_import_updates_price(self):
+        row = {
+            'tracking_number': 'TN1', 'carrier': 'DHL',
+            'sender_address': 'Street 1, 10115 Berlin, Germany',
+            'receiver_address': 'Street 10, 75001 Paris, France',
+            'article_name': 'Laptop', 'article_quantity': 1, 'article_price': '999', 'SKU': 'LP123', 'status': 'transit',
+        }
+        import_chunk([row, {**row, 'tracking_number': 'TN2', 'article_price': '1100'}])
+        self.assertEqual(Article.objects.get().price, Decimal('1100'))
+        self.assertEqual(ArticleShipmentItem.objects.filter(article=self.article).count(), 3)
+
+
+class ArticleBulkViewTestCase(ShipmentFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        self.bulk_url = reverse('article-bulk')
+
+    def test_bulk(self):
+        response = self.client.post(self.bulk_url, [
+            {'sku': 'LP123', 'name': 'Laptop', 'price': '1200.00'},
+            {'sku': 'MO456', 'name': 'Mouse', 'price': '20'},
+            {'sku': 'MO456', 'name': 'Mouse', 'price': '25'},
+            {'sku': 'KB012', 'name': 'Keyboard', 'price': '50'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'received': 4, 'created': 2, 'updated': 0, 'unchanged': 1})
+        self.assertEqual(Article.objects.get(sku='MO456').price, Decimal('25'))
+
+        response = self.client.post(self.bulk_url, [{'sku': 'KB012', 'name': 'Keyboard', 'price': '55'}], format='json')
+        self.assertEqual(response.data, {'received': 1, 'created': 0, 'updated': 1, 'unchanged': 0})
+
+    def test_invalid_item(self):
+        response = self.client.post(self.bulk_url, [
+            {'sku': 'MO456', 'name': 'Mouse', 'price': '25'},
+            {'sku': 'KB012', 'name': 'Keyboard', 'price': 'free'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('price', response.data[1])
+        self.assertFalse(Article.objects.filter(sku='MO456').exists())
+
+    def test_duplicate_sku_is_rejected_by_create(self):
+        response = self.client.post(reverse('article-list'), {'sku': 'LP123', 'name': 'Laptop', 'price': '1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('sku', response.data)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.post(self.bulk_url, [], format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class MergeDuplicateArticlesMigrationTestCase(TransactionTestCase):
+    before = [('shipments', '0004_unique_tracking_event')]
+    after = [('shipments', '0006_unique_article_sku')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_merge(self):
+        apps = self.migrate(self.before)
+        Article = apps.get_model('shipments', 'Article')
+        Shipment = apps.get_model('shipments', 'Shipment')
+        ArticleShipmentItem = apps.get_model('shipments', 'ArticleShipmentItem')
+
+        first = Article.objects.create(name='Laptop', price=800, sku='LP123')
+        second = Article.objects.create(name='Laptop', price=900, sku='LP123')
+        third = Article.objects.create(name='Laptop 2024', price=950, sku='LP123')
+        other = Article.objects.create(name='Mouse', price=25, sku='MO456')
+        shipments = [
+            Shipment.objects.create(
+                tracking_number=f'TN{i}', carrier='DHL', sender_address='Street 1, 10115 Berlin, Germany',
+                receiver_address='Street 10, 75001 Paris, France', status='IN_TRANSIT',
+            )
+            for i in range(2)
+        ]
+        ArticleShipmentItem.objects.create(shipment=shipments[0], article=first, quantity=1)
+        ArticleShipmentItem.objects.create(shipment=shipments[0], article=second, quantity=2)
+        ArticleShipmentItem.objects.create(shipment=shipments[1], article=third, quantity=3)
+        ArticleShipmentItem.objects.create(shipment=shipments[1], article=other, quantity=1)
+
+        self.migrate(self.after)
+        merged = Article.objects.get(sku='LP123')
+        self.assertEqual((merged.pk, merged.name, merged.price), (first.pk, 'Laptop 2024', Decimal('950')))
+        self.assertEqual(Article.objects.count(), 2)
+        self.assertEqual(
+            set(ArticleShipmentItem.objects.values_list('shipment_id', 'article__sku', 'quantity')),
+            {(shipments[0].pk, 'LP123', 3), (shipments[1].pk, 'LP123', 3), (shipments[1].pk, 'MO456', 1)},
+        )
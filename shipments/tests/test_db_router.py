@@ -0,0 +1,172 @@
+import base64
+import os
+import tempfile
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from shipments import two_tier_cache
+from shipments.db_router import ais_sticky, get_client_key, replica_reads
+from shipments.models import Shipment, ShipmentCounter
+from shipments.tracking_cache import get_timeout
+
+
+def build_shipment(tracking_number):
+    shipment = Shipment(
+        tracking_number=tracking_number, carrier='DHL', sender_address='Street 1, 10115 Berlin, Germany',
+        receiver_address='Street 10, 75001 Paris, France', status=Shipment.ShipmentStatus.IN_TRANSIT,
+    )
+    shipment.set_locations()
+    return shipment
+
+
+class ReplicaDatabaseMixin:
+    """
+    Adds a `replica` alias, a separate SQLite database with the schema of the shipments app: unlike a
+    test mirror, it only holds what the test writes to it, the tests see which database served a read.
+    Added once the test runner set up its databases, it is rolled back after each test like the primary.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        cls.replica_file.close()
+        connections.settings['replica'] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {},
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_file.name},
+        })['replica']
+        with connections['replica'].schema_editor() as editor:
+            for model in apps.get_app_config('shipments').get_models():
+                editor.create_model(model)
+        cls.databases = {DEFAULT_DB_ALIAS, 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        os.remove(cls.replica_file.name)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(ReplicaDatabaseMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.user = get_user_model().objects.create_superuser('admin', 'random_pass')
+        # Without signals, they would write the counters of the replica rows to the primary
+        self.primary = Shipment.objects.bulk_create([build_shipment('TN-PRIMARY')])[0]
+        Shipment.objects.using('replica').bulk_create([build_shipment('TN-REPLICA')])
+        ShipmentCounter.objects.using('replica').create(carrier='DHL', status='IN_TRANSIT', country='france', count=7)
+
+    def get_listed(self):
+        response = self.client.get(reverse('shipment-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [shipment['tracking_number'] for shipment in response.data['results']]
+
+    def get_tracking_status(self, tracking_number):
+        return self.client.get(reverse('shipment-get_shipment', args=['DHL', tracking_number])).status_code
+
+    def test_reads_go_to_replica(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.get_listed(), ['TN-REPLICA'])
+        self.assertEqual(self.client.get(reverse('shipment-stats')).data['total'], 7)
+
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.get_tracking_status('TN-REPLICA'), status.HTTP_200_OK)
+        self.assertEqual(self.get_tracking_status('TN-PRIMARY'), status.HTTP_404_NOT_FOUND)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.get_listed(), ['TN-PRIMARY'])
+        self.assertEqual(self.get_tracking_status('TN-PRIMARY'), status.HTTP_200_OK)
+
+    def test_read_your_writes(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.patch(
+            reverse('shipment-detail', args=[self.primary.pk]), {'status': 'DELIVERY'}, format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Shipment.objects.get(pk=self.primary.pk).status, 'DELIVERY')
+
+        # The writer reads from the primary until the window is over
+        self.assertEqual(self.get_listed(), ['TN-PRIMARY'])
+        self.assertEqual(self.client.get(reverse('shipment-stats')).data['counts'], {'DHL': {'DELIVERY': 1}})
+        # The other clients still read from the replica
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.get_tracking_status('TN-REPLICA'), status.HTTP_200_OK)
+
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.get_listed(), ['TN-REPLICA'])
+
+    def test_reads_do_not_stick(self):
+        self.client.force_authenticate(user=self.user)
+        self.get_listed()
+        # Read-only POST, served by the primary
+        response = self.client.post(
+            reverse('shipment-lookup'), {'shipments': [{'carrier': 'DHL', 'tracking_number': 'TN-PRIMARY'}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['DHL/TN-PRIMARY']['found'])
+        self.assertEqual(self.get_listed(), ['TN-REPLICA'])
+
+    @override_settings(DATABASE_REPLICA_STICKINESS=0)
+    def test_stickiness_disabled(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.patch(reverse('shipment-detail', args=[self.primary.pk]), {'status': 'DELIVERY'}, format='json')
+        self.assertEqual(self.get_listed(), ['TN-REPLICA'])
+
+    def test_other_reads_and_writes_go_to_primary(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('shipment-export'), {'export_format': 'ndjson'})
+        self.assertIn(b'TN-PRIMARY', b''.join(response.streaming_content))
+
+        with replica_reads() as alias:
+            self.assertEqual(alias, 'replica')
+            self.assertEqual(router.db_for_read(Shipment), 'replica')
+            replica_shipment = Shipment.objects.get(tracking_number='TN-REPLICA')
+            self.assertEqual(router.db_for_write(Shipment, instance=replica_shipment), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_read(Shipment), DEFAULT_DB_ALIAS)
+
+        self.assertTrue(router.allow_migrate(DEFAULT_DB_ALIAS, 'shipments'))
+        self.assertFalse(router.allow_migrate('replica', 'shipments'))
+
+    def test_replica_responses_cached_shortly(self):
+        with self.settings(TRACKING_CACHE_TIMEOUT=3600, TRACKING_CACHE_REPLICA_TIMEOUT=10):
+            self.assertEqual(get_timeout(), 3600)
+            with replica_reads():
+                self.assertEqual(get_timeout(), 10)
+            with replica_reads(sticky=True):
+                self.assertEqual(get_timeout(), 3600)
+
+    async def test_track_shipment(self):
+        response = await self.async_client.get(reverse('track_shipment', args=['DHL', 'TN-REPLICA']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(reverse('track_shipment', args=['DHL', 'TN-PRIMARY']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(DEBUG=True)
+    async def test_async_requests_are_not_adapted(self):
+        self.user.set_password('random_pass')
+        await self.user.asave()
+        credentials = base64.b64encode(b'admin:random_pass').decode()
+        # In debug, Django logs each sync-only middleware it adapts to the async handler
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            response = await self.async_client.get(reverse('track_shipment', args=['DHL', 'TN-REPLICA']))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = await self.async_client.patch(
+                reverse('shipment-detail', args=[self.primary.pk]), {'status': 'DELIVERY'},
+                content_type='application/json', headers={'Authorization': f'Basic {credentials}'},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(await ais_sticky(get_client_key(None, self.user)))
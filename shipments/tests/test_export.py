@@ -0,0 +1,158 @@
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from shipments.exporter import CSV_COLUMNS, iter_export
+from shipments.importer import import_chunk
+from shipments.models import Article, ArticleShipmentItem, Shipment
+
+
+class ExportDataMixin:
+    def setUp(self):
+        call_command('import_shipment_data', stdout=StringIO())
+        # A shipment without articles
+        Shipment.objects.create(
+            tracking_number='TN_EMPTY', carrier='UPS', sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address='Street 2, 75001 Paris, France', status=Shipment.ShipmentStatus.SCANNED,
+        )
+
+    def get_content(self):
+        return sorted(
+            (shipment.carrier, shipment.tracking_number, shipment.sender_address, shipment.receiver_address,
+             shipment.status, tuple(sorted(shipment.articleshipmentitem_set.values_list(
+                 'article__name', 'article__price', 'article__sku', 'quantity',
+             ))))
+            for shipment in Shipment.objects.all()
+        )
+
+
+class ExporterTestCase(ExportDataMixin, TestCase):
+    def test_csv_round_trip(self):
+        content = self.get_content()
+        rows = list(csv.DictReader(StringIO(''.join(iter_export(Shipment.objects.all(), 'csv', chunk_size=2)))))
+        self.assertEqual(list(rows[0]), CSV_COLUMNS)
+        self.assertEqual(len(rows), ArticleShipmentItem.objects.count() + 1)
+        self.assertIn('in-transit', {row['status'] for row in rows})
+
+        Shipment.objects.all().delete()
+        Article.objects.all().delete()
+        import_chunk(rows)
+        self.assertEqual(self.get_content(), content)
+
+    def test_ndjson(self):
+        lines = ''.join(iter_export(Shipment.objects.filter(carrier='UPS'), 'ndjson')).splitlines()
+        shipments = [json.loads(line) for line in lines]
+        self.assertEqual(len(shipments), Shipment.objects.filter(carrier='UPS').count())
+        self.assertEqual(shipments[-1]['tracking_number'], 'TN_EMPTY')
+        self.assertEqual(shipments[-1]['articles'], [])
+        self.assertNotIn('weather', shipments[-1])
+
+    def test_articles_are_joined_per_chunk(self):
+        def count_queries(chunk_size):
+            with CaptureQueriesContext(connection) as context:
+                for _ in iter_export(Shipment.objects.all(), 'csv', chunk_size=chunk_size):
+                    pass
+            return len(context.captured_queries)
+
+        shipments = Shipment.objects.count()
+        # The shipments (a single cursor on PostgreSQL) plus one articles query per chunk
+        self.assertEqual(count_queries(chunk_size=shipments) + 1, count_queries(chunk_size=shipments - 1))
+
+    def test_command(self):
+        file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+        call_command('export_shipment_data', file.name, '--status', 'in-transit', '--carrier', 'DHL', stdout=out)
+        self.assertIn('exported successfully', out.getvalue())
+
+        with open(file.name, newline='') as exported:
+            rows = list(csv.DictReader(exported))
+        self.assertTrue(rows)
+        self.assertEqual({(row['carrier'], row['status']) for row in rows}, {('DHL', 'in-transit')})
+
+        out = StringIO()
+        call_command('export_shipment_data', '--format', 'ndjson', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), Shipment.objects.count())
+
+    def test_command_chunk_size_setting(self):
+        def count_queries(*args):
+            with CaptureQueriesContext(connection) as context:
+                call_command('export_shipment_data', *args, stdout=StringIO())
+            return len(context.captured_queries)
+
+        shipments = Shipment.objects.count()
+        with override_settings(SHIPMENT_EXPORT_CHUNK_SIZE=shipments):
+            in_one_chunk = count_queries()
+        with override_settings(SHIPMENT_EXPORT_CHUNK_SIZE=shipments - 1):
+            self.assertEqual(count_queries(), in_one_chunk + 1)
+            # The option wins over the setting
+            self.assertEqual(count_queries('--chunk-size', str(shipments)), in_one_chunk)
+
+
+class ExportViewTestCase(ExportDataMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        self.url = reverse('shipment-export')
+
+    def test_export_csv(self):
+        response = self.client.get(self.url, {'carrier': 'UPS'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual({row['carrier'] for row in rows}, {'UPS'})
+        self.assertIn('TN_EMPTY', {row['tracking_number'] for row in rows})
+
+    def test_export_ndjson(self):
+        response = self.client.get(self.url, {'export_format': 'ndjson', 'status': Shipment.ShipmentStatus.SCANNED, 'carrier': 'UPS'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['tracking_number'] for line in lines], ['TN_EMPTY'])
+
+    def test_accept_header(self):
+        response = self.client.get(self.url, {'carrier': 'UPS'}, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertIn('TN_EMPTY', {row['tracking_number'] for row in rows})
+
+        response = self.client.get(self.url, {'carrier': 'UPS'}, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertIn('TN_EMPTY', {json.loads(line)['tracking_number'] for line in lines})
+
+        self.assertEqual(
+            self.client.get(self.url, HTTP_ACCEPT='application/xml').status_code, status.HTTP_406_NOT_ACCEPTABLE,
+        )
+
+    def test_errors_in_accepted_format(self):
+        response = self.client.get(self.url, {'export_format': 'xml'}, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Unknown export format', json.loads(response.content)['detail'])
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(self.url, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(list(csv.DictReader(StringIO(response.content.decode())))[0]['detail'],
+                         'Authentication credentials were not provided.')
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.url, {'export_format': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
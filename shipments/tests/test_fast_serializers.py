@@ -0,0 +1,180 @@
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from shipments import two_tier_cache
+from shipments.models import Article, ArticleShipmentItem, Shipment, TrackingEvent
+from shipments.rest.fast_serializers import SHIPMENT_FIELDS, FastJSONRenderer, serialize_shipments
+from shipments.rest.serializers import ShipmentSerializer, ShipmentTrackingSerializer
+from shipments.rest.views import ShipmentViewSet
+from shipments.tracking_events import get_timeline_prefetch
+
+
+WEATHER = {'temperature': 21.5, 'condition': 'Sunny   ☀', 'humidity': 40}
+
+
+class ShipmentDataMixin:
+    """ Prices, unicode, quotes, invalid addresses, shipments with and without articles or events """
+
+    def setUp(self):
+        articles = [
+            Article.objects.create(name='Laptop', price='1200.00', sku='LP123'),
+            Article.objects.create(name='Écran "4K"', price='0.50', sku='ÉC 001'),
+            Article.objects.create(name='Cable', price='9.99', sku='CB001'),
+        ]
+        self.shipments = [
+            Shipment.objects.create(
+                tracking_number=f'TN{index:08d}',
+                carrier='DHL',
+                sender_address='Straße 1, 10115 Berlin, Germany',
+                receiver_address=f'Rue {index}, 7500{index} Paris, France' if index else 'Not an address',
+                status=Shipment.ShipmentStatus.IN_TRANSIT,
+            )
+            for index in range(3)
+        ]
+        for index, shipment in enumerate(self.shipments):
+            # Articles added out of their id order, and none for the last shipment
+            for article in reversed(articles[:2 - index]):
+                ArticleShipmentItem.objects.create(shipment=shipment, article=article, quantity=index + 2)
+
+        timestamp = datetime(2024, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        for minutes in (0, 5, 3):
+            TrackingEvent.objects.create(
+                shipment=self.shipments[0], status=Shipment.ShipmentStatus.TRANSIT,
+                timestamp=timestamp + timedelta(minutes=minutes), location='Hub Köln',
+            )
+
+    def get_weather(self):
+        return {ShipmentSerializer.get_weather_location(shipment.receiver_address): WEATHER for shipment in self.shipments}
+
+    def get_rows(self):
+        return list(ShipmentViewSet.queryset.prefetch_related(None).values(*SHIPMENT_FIELDS).order_by('id'))
+
+
+
+class FastSerializersTestCase(ShipmentDataMixin, TestCase):
+    """ The fast path must render the same bytes as the DRF serializers """
+
+    def assertSameRendering(self, expected, data):
+        expected = JSONRenderer().render(expected)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        self.assertEqual(JSONRenderer().render(data), expected)
+
+    def test_shipments(self):
+        weather = self.get_weather()
+        shipments = ShipmentViewSet.queryset.order_by('id')
+        self.assertSameRendering(
+            ShipmentSerializer(shipments, many=True, context={'weather': weather}).data,
+            serialize_shipments(self.get_rows(), weather),
+        )
+
+    def test_tracking(self):
+        shipments = ShipmentViewSet.queryset.prefetch_related(get_timeline_prefetch()).order_by('id')
+        weather = self.get_weather()
+        self.assertSameRendering(
+            ShipmentTrackingSerializer(shipments, many=True, context={'weather': weather}).data,
+            serialize_shipments(self.get_rows(), weather, timeline=True),
+        )
+
+    @override_settings(TRACKING_TIMELINE_LIMIT=2, TIME_ZONE='Europe/Berlin')
+    def test_timeline_limit(self):
+        shipments = ShipmentViewSet.queryset.prefetch_related(get_timeline_prefetch()).order_by('id')
+        data = serialize_shipments(self.get_rows(), timeline=True)
+        self.assertEqual(len(data[0]['timeline']), 2)
+        self.assertEqual(data[0]['timeline'][0]['timestamp'], '2024-01-01T13:35:15.123456+01:00')
+        self.assertSameRendering(
+            [{key: value for key, value in shipment.items() if key != 'weather'} for shipment in
+             ShipmentTrackingSerializer(shipments, many=True, context={'weather': self.get_weather()}).data],
+            data,
+        )
+
+    def test_renderer_fallback(self):
+        # Not JSON types for orjson, rendered by JSONRenderer
+        data = {'price': Decimal('1.50'), 'separators': '\u2028\u2029'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+        self.assertEqual(
+            FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+            JSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+        )
+
+    def test_renderer_types(self):
+        # Not pre-formatted, converted like JSONRenderer does
+        data = {
+            'utc': datetime(2024, 11, 1, 8, 30, 15, 123456, tzinfo=timezone.utc),
+            'offset': [datetime(2024, 11, 1, 8, tzinfo=timezone(timedelta(hours=2)))],
+            'naive': datetime(2024, 11, 1, 8),
+            'date': date(2024, 11, 1),
+            'uuid': uuid.UUID(int=1),
+            'nested': {'price': Decimal('1.50'), 'temperature': 21.5},
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertIn(b'"2024-11-01T08:30:15.123456Z"', FastJSONRenderer().render(data))
+
+    def test_renderer_non_finite_floats(self):
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.subTest(value=value):
+                data = {'weather': {'temperature': value}}
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render(data)
+                with self.assertRaises(ValueError):
+                    FastJSONRenderer().render(data)
+
+    def test_benchmark(self):
+        stdout = StringIO()
+        call_command('benchmark_serializers', shipments=5, articles=2, rounds=1, stdout=stdout, stderr=stdout)
+        self.assertIn('speedup', stdout.getvalue())
+        self.assertNotIn('differ', stdout.getvalue())
+        self.assertEqual(Shipment.objects.count(), 3)
+
+
+class FastSerializersViewsTestCase(ShipmentDataMixin, APITestCase):
+    """ Same responses as the previous DRF views """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        patcher = patch('shipments.rest.serializers.get_client')
+        patcher.start().return_value.get_weather.return_value = WEATHER
+        self.addCleanup(patcher.stop)
+        patcher = patch('shipments.rest.views.get_client')
+        patcher.start().return_value.get_weathers.side_effect = lambda locations: {location: WEATHER for location in locations}
+        self.addCleanup(patcher.stop)
+
+    def test_list(self):
+        response = self.client.get(reverse('shipment-list'), {'page_size': 2})
+        shipments = ShipmentViewSet.queryset.order_by('id')[:2]
+        expected = ShipmentSerializer(shipments, many=True, context={'weather': self.get_weather()}).data
+        self.assertEqual(response.content, JSONRenderer().render({
+            'next': response.data['next'], 'previous': None, 'results': expected,
+        }))
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([shipment['id'] for shipment in response.data['results']], [self.shipments[2].id])
+
+    def test_retrieve(self):
+        shipment = self.shipments[0]
+        response = self.client.get(reverse('shipment-detail', args=[shipment.id]))
+        expected = ShipmentSerializer(ShipmentViewSet.queryset.get(pk=shipment.pk), context={'weather': self.get_weather()}).data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+        self.assertEqual(self.client.get(reverse('shipment-detail', args=[0])).status_code, 404)
+
+    def test_get_shipment(self):
+        shipment = ShipmentViewSet.queryset.prefetch_related(get_timeline_prefetch()).get(pk=self.shipments[0].pk)
+        expected = JSONRenderer().render(ShipmentTrackingSerializer(shipment, context={'weather': self.get_weather()}).data)
+        url = reverse('shipment-get_shipment', args=[shipment.carrier, shipment.tracking_number])
+        # From the database, then from the cache
+        self.assertEqual(self.client.get(url).content, expected)
+        self.assertEqual(self.client.get(url).content, expected)
@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from shipments.importer import import_chunk
+from shipments.models import Shipment
+
+
+def create_shipment(tracking_number, receiver_address, sender_address='Street 1, 10115 Berlin, Germany', **kwargs):
+    return Shipment.objects.create(
+        tracking_number=tracking_number, carrier='DHL', sender_address=sender_address,
+        receiver_address=receiver_address, status=kwargs.pop('status', Shipment.ShipmentStatus.IN_TRANSIT), **kwargs,
+    )
+
+
+class ShipmentLocationsTestCase(TestCase):
+    def test_set_on_save(self):
+        shipment = create_shipment('TN1', 'Rue 1, 75001  Paris , France')
+        shipment.refresh_from_db()
+        self.assertEqual(
+            (shipment.receiver_postal_code, shipment.receiver_city, shipment.receiver_country),
+            ('75001', 'paris', 'france'),
+        )
+        self.assertEqual((shipment.sender_city, shipment.sender_country), ('berlin', 'germany'))
+
+        shipment.receiver_address = 'Not an address'
+        shipment.save(update_fields=['receiver_address'])
+        shipment.refresh_from_db()
+        self.assertEqual((shipment.receiver_postal_code, shipment.receiver_city, shipment.receiver_country), ('', '', ''))
+
+    def test_set_on_import(self):
+        import_chunk([{
+            'tracking_number': 'TN1', 'carrier': 'DHL',
+            'sender_address': 'Street 1, 10115 Berlin, Germany',
+            'receiver_address': 'Street 10, 1016 Amsterdam, Netherlands',
+            'article_name': 'Laptop', 'article_quantity': 1, 'article_price': '800', 'SKU': 'LP123', 'status': 'transit',
+        }])
+        self.assertEqual(Shipment.objects.get().receiver_city, 'amsterdam')
+
+
+class ShipmentFiltersTestCase(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        create_shipment('TN00000001', 'Rue 1, 75001 Paris, France')
+        create_shipment('TN00000002', 'Rue 2, 75002 Paris, France', status=Shipment.ShipmentStatus.DELIVERY)
+        create_shipment('TN00000003', 'Street 5, 28013 Madrid, Spain', sender_address='Street 3, 80331 Munich, Germany')
+        create_shipment('XY00000004', 'Street 15, 1050 Copenhagen, Denmark')
+
+    def get_tracking_numbers(self, params):
+        response = self.client.get(reverse('shipment-list'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [shipment['tracking_number'] for shipment in response.data['results']]
+
+    def test_location_filters(self):
+        self.assertEqual(self.get_tracking_numbers({'receiver_city': 'PARIS '}), ['TN00000001', 'TN00000002'])
+        self.assertEqual(
+            self.get_tracking_numbers({'receiver_city': 'paris', 'status': Shipment.ShipmentStatus.IN_TRANSIT}),
+            ['TN00000001'],
+        )
+        self.assertEqual(self.get_tracking_numbers({'receiver_country': 'spain'}), ['TN00000003'])
+        self.assertEqual(self.get_tracking_numbers({'receiver_postal_code': '75002'}), ['TN00000002'])
+        self.assertEqual(self.get_tracking_numbers({'sender_city': 'Munich'}), ['TN00000003'])
+        self.assertEqual(len(self.get_tracking_numbers({'sender_country': 'Germany'})), 4)
+        self.assertEqual(self.get_tracking_numbers({'receiver_city': 'Lyon'}), [])
+
+    def test_search(self):
+        self.assertEqual(self.get_tracking_numbers({'search': 'xy0000'}), ['XY00000004'])
+        self.assertEqual(self.get_tracking_numbers({'search': 'copenhagen'}), ['XY00000004'])
+        self.assertEqual(self.get_tracking_numbers({'search': 'munich'}), ['TN00000003'])
+        # Every term must match
+        self.assertEqual(self.get_tracking_numbers({'search': 'rue paris 75002'}), ['TN00000002'])
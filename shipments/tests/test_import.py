@@ -0,0 +1,131 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from shipments.importer import import_chunk, select_shipments
+from shipments.models import Shipment, Article, ArticleShipmentItem
+from shipments.parallel_importer import import_files, iter_range_lines, shard_of, split_file
+
+
+class CsvFileMixin:
+    header = 'tracking_number,carrier,sender_address,receiver_address,article_name,article_quantity,article_price,SKU,status\n'
+    row = 'TN1,DHL,"Street 1, 10115 Berlin, Germany","Street 10, 75001 Paris, France",{name},{quantity},{price},{sku},in-transit\n'
+
+    def write_csv(self, *rows):
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        file.write(self.header + ''.join(rows))
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+
+class ImportShipmentDataTestCase(CsvFileMixin, TestCase):
+    def import_csv(self, *args):
+        out = StringIO()
+        call_command('import_shipment_data', *args, stdout=out)
+        return out.getvalue()
+
+
+    def test_import_bundled_data(self):
+        output = self.import_csv('--chunk-size', '3')
+        self.assertIn('rows/sec', output)
+        self.assertEqual(Shipment.objects.count(), 5)
+        self.assertEqual(Article.objects.count(), 8)
+        self.assertEqual(ArticleShipmentItem.objects.count(), 9)
+        self.assertEqual(Shipment.objects.get(tracking_number='TN12345678').status, Shipment.ShipmentStatus.IN_TRANSIT)
+
+
+    def test_import_is_idempotent(self):
+        self.import_csv()
+        self.import_csv('--chunk-size', '2')
+        self.assertEqual(Shipment.objects.count(), 5)
+        self.assertEqual(Article.objects.count(), 8)
+        self.assertEqual(ArticleShipmentItem.objects.count(), 9)
+
+
+    def test_import_deduplicates_within_chunk(self):
+        path = self.write_csv(
+            self.row.format(name='Laptop', quantity=1, price=800, sku='LP123'),
+            self.row.format(name='Laptop', quantity=3, price='800.00', sku='LP123'),
+            self.row.format(name='Mouse', quantity=2, price=25, sku='MO456'),
+        )
+        self.import_csv(path)
+        self.assertEqual(Shipment.objects.count(), 1)
+        self.assertEqual(Article.objects.count(), 2)
+        self.assertEqual(
+            dict(ArticleShipmentItem.objects.values_list('article__sku', 'quantity')),
+            {'LP123': 1, 'MO456': 2},
+        )
+
+
+    def test_import_chunk_query_count_is_constant(self):
+        rows = [
+            {
+                'tracking_number': f'TN{i}', 'carrier': 'DHL',
+                'sender_address': 'Street 1, 10115 Berlin, Germany',
+                'receiver_address': 'Street 10, 75001 Paris, France',
+                'article_name': f'Article {i}', 'article_quantity': 1,
+                'article_price': 10, 'SKU': f'SKU{i}', 'status': 'transit',
+            }
+            for i in range(50)
+        ]
+        # savepoint, select + insert articles, select + insert + select shipments, count shipments,
+        # insert items, lock + update shipment summaries, release
+        with self.assertNumQueries(11):
+            self.assertEqual(import_chunk(rows), 50)
+        self.assertEqual(ArticleShipmentItem.objects.count(), 50)
+
+
+    def test_select_shipments_on_carrier_and_tracking_number(self):
+        for carrier, tracking_number in [('DHL', 'TN1'), ('UPS', 'TN1'), ('UPS', 'TN2'), ('GLS', 'TN1')]:
+            Shipment.objects.create(
+                tracking_number=tracking_number, carrier=carrier, sender_address='Street 1, 10115 Berlin, Germany',
+                receiver_address='Street 10, 75001 Paris, France', status=Shipment.ShipmentStatus.TRANSIT,
+            )
+        with CaptureQueriesContext(connection) as context:
+            shipments = select_shipments({('DHL', 'TN1'), ('UPS', 'TN2')})
+        self.assertEqual(set(shipments), {('DHL', 'TN1'), ('UPS', 'TN2')})
+        # Both columns of the (carrier, tracking_number) index are constrained
+        where = context.captured_queries[0]['sql'].split('WHERE')[1]
+        self.assertIn('"carrier" IN', where)
+        self.assertIn('"tracking_number" IN', where)
+
+
+class ParallelImportTestCase(CsvFileMixin, TestCase):
+    bundled_csv = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'management', 'commands', 'data.csv')
+
+    def test_split_file_covers_every_line_once(self):
+        with open(self.bundled_csv) as file:
+            expected = file.readlines()[1:]
+
+        for parts in (1, 2, 3, 7, 1000):
+            fieldnames, ranges = split_file(self.bundled_csv, parts)
+            self.assertEqual(fieldnames[:2], ['tracking_number', 'carrier'])
+            self.assertLessEqual(len(ranges), parts)
+            lines = [line for _, start, end in ranges for line in iter_range_lines(self.bundled_csv, start, end)]
+            self.assertEqual(lines, expected)
+
+
+    def test_shard_of_is_stable(self):
+        self.assertEqual(shard_of('DHL', 'TN1', 7), shard_of('DHL', 'TN1', 7))
+        self.assertEqual({shard_of('DHL', f'TN{i}', 4) for i in range(100)}, {0, 1, 2, 3})
+
+
+    def test_import_files_sharded(self):
+        path = self.write_csv(
+            self.row.format(name='Laptop', quantity=1, price=800, sku='LP123'),
+            self.row.format(name='Mouse', quantity=2, price=25, sku='MO456'),
+        )
+        # In process: the test database is not visible to worker processes
+        stats = import_files([self.bundled_csv, path], workers=1, chunk_size=2, shards=3)
+
+        self.assertEqual(stats['imported'], 11)
+        self.assertEqual(sum(worker['parsed'] for worker in stats['workers'].values()), 11)
+        self.assertEqual(Shipment.objects.count(), 6)
+        self.assertEqual(Article.objects.count(), 8)
+        self.assertEqual(ArticleShipmentItem.objects.count(), 11)
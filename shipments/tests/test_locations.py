@@ -0,0 +1,85 @@
+import responses
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from shipments import two_tier_cache
+from shipments.locations import Location, parse_address
+from shipments.models import Shipment
+
+
+class ParseAddressTestCase(TestCase):
+    def test_parse_address(self):
+        self.assertEqual(
+            parse_address('Street 10, 75001 Paris, France'),
+            Location(postal_code='75001', city='Paris', country='France'),
+        )
+        self.assertEqual(
+            parse_address('Street 1,  60311   Frankfurt am Main ,Germany '),
+            Location(postal_code='60311', city='Frankfurt am Main', country='Germany'),
+        )
+        self.assertEqual(parse_address('Street 1, ec1a 1bb London, UK').postal_code, 'EC1A')
+
+
+    def test_parse_invalid_address(self):
+        self.assertIsNone(parse_address('Street 1 10115 Berlin Germany'))
+        self.assertIsNone(parse_address('Street 1, 10115, Germany'))
+        self.assertIsNone(parse_address('Street 1, 10115 Berlin, '))
+        self.assertIsNone(parse_address('Street 1, 10115 Berlin, Germany, Earth'))
+
+
+    def test_key_is_shared_by_the_streets_of_a_location(self):
+        self.assertEqual(
+            parse_address('Street 10, 75001 Paris, France').key,
+            parse_address('Other street 3,75001 PARIS, france').key,
+        )
+        self.assertNotEqual(
+            parse_address('Street 10, 75001 Paris, France').key,
+            parse_address('Street 10, 75002 Paris, France').key,
+        )
+        self.assertNotIn('Street', parse_address('Street 10, 75001 Paris, France').key)
+
+
+@override_settings(WEATHER_API_KEY='test_test_test')
+class LocationWeatherTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        for index, receiver_address in enumerate([
+            'Street 10, 75001 Paris, France',
+            'Other street 3, 75001 Paris, France',
+            'Street 5, 28013 Madrid, Spain',
+        ]):
+            Shipment.objects.create(
+                tracking_number=f'TN{index}',
+                carrier='DHL',
+                sender_address='Street 1, 10115 Berlin, Germany',
+                receiver_address=receiver_address,
+                status='IN_TRANSIT',
+            )
+
+
+    @responses.activate
+    def test_weather_is_looked_up_per_location(self):
+        paris = responses.get(
+            'https://api.weatherapi.com/v1/current.json?key=test_test_test&q=75001 paris, france',
+            json={'weather': 'good!'},
+        )
+        madrid = responses.get(
+            'https://api.weatherapi.com/v1/current.json?key=test_test_test&q=28013 madrid, spain',
+            json={'weather': 'sunny!'},
+        )
+
+        response = self.client.get(reverse('shipment-list'))
+        self.assertEqual(
+            [shipment['weather'] for shipment in response.data['results']],
+            [{'weather': 'good!'}, {'weather': 'good!'}, {'weather': 'sunny!'}],
+        )
+        self.assertEqual(paris.call_count, 1)
+        self.assertEqual(madrid.call_count, 1)
+
+        self.client.get(reverse('shipment-get_shipment', args=['DHL', 'TN1']))
+        self.assertEqual(len(responses.calls), 2)
@@ -0,0 +1,80 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from shipments import two_tier_cache
+from shipments.models import Article, Shipment
+from .utils import QueryCountAssertionsMixin
+
+
+class TrackingLookupTestCase(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.article = Article.objects.create(name='Laptop', price=1200.00, sku='LP123')
+        self.shipments = [self.create_shipment(index) for index in range(3)]
+        self.url = reverse('shipment-lookup')
+
+    def create_shipment(self, index):
+        shipment = Shipment.objects.create(
+            tracking_number=f'TN{index:08d}',
+            carrier='DHL' if index % 2 else 'UPS',
+            sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address=f'Street {index}, 7500{index % 3} Paris, France',
+            status=Shipment.ShipmentStatus.IN_TRANSIT,
+        )
+        shipment.articles.add(self.article)
+        return shipment
+
+    def lookup(self, pairs):
+        return self.client.post(self.url, {
+            'shipments': [{'carrier': carrier, 'tracking_number': tracking_number} for carrier, tracking_number in pairs],
+        }, format='json')
+
+
+    def test_lookup(self):
+        first, second, _ = self.shipments
+        response = self.lookup([
+            (second.carrier, second.tracking_number),
+            ('DHL', 'TN_UNKNOWN'),
+            (first.carrier, first.tracking_number),
+            # The tracking number of `first` with the wrong carrier
+            (second.carrier, first.tracking_number),
+            (second.carrier, second.tracking_number),
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data), [
+            f'{second.carrier}/{second.tracking_number}',
+            'DHL/TN_UNKNOWN',
+            f'{first.carrier}/{first.tracking_number}',
+            f'{second.carrier}/{first.tracking_number}',
+        ])
+        self.assertEqual(response.data['DHL/TN_UNKNOWN'], {'found': False, 'shipment': None})
+        self.assertFalse(response.data[f'{second.carrier}/{first.tracking_number}']['found'])
+
+        # Same response as the single tracking endpoint
+        result = response.data[f'{first.carrier}/{first.tracking_number}']
+        self.assertTrue(result['found'])
+        single = self.client.get(reverse('shipment-get_shipment', args=[first.carrier, first.tracking_number]))
+        self.assertEqual(result['shipment'], single.data)
+
+
+    def test_invalid(self):
+        self.assertEqual(self.lookup([]).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'shipments': [{'carrier': 'DHL'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with override_settings(TRACKING_LOOKUP_MAX_SHIPMENTS=2):
+            response = self.lookup((shipment.carrier, shipment.tracking_number) for shipment in self.shipments)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_constant_queries(self):
+        def grow():
+            self.shipments += [self.create_shipment(len(self.shipments) + index) for index in range(5)]
+
+        self.assertConstantQueries(
+            lambda: self.lookup((shipment.carrier, shipment.tracking_number) for shipment in self.shipments), grow,
+        )
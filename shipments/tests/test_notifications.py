@@ -0,0 +1,102 @@
+import json
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from shipments.models import Shipment
+from shipments.notifications import LocalBroker, get_broker
+from .test_tracking_cache import ShipmentFixtureMixin
+
+
+@override_settings(SHIPMENT_EVENTS_BROKER='local', SHIPMENT_EVENTS_HEARTBEAT=0.05)
+class ShipmentEventsTestCase(ShipmentFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.events_url = reverse('shipment_events', args=[self.shipment.carrier, self.shipment.tracking_number])
+
+    def deliver(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shipment.status = Shipment.ShipmentStatus.DELIVERY
+            self.shipment.save()
+
+    def open_stream(self, response):
+        return (chunk.decode() async for chunk in response.streaming_content)
+
+    async def read_event(self, stream):
+        """ Next event of the stream, skipping the heartbeats """
+        while (chunk := await anext(stream)).startswith(':'):
+            pass
+        return dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+
+
+    def test_published_on_commit(self):
+        with patch.object(LocalBroker, 'publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.shipment.save()
+            publish.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+        publish.assert_called_once_with([(self.shipment.carrier, self.shipment.tracking_number)])
+
+
+    async def test_stream(self):
+        response = await self.async_client.get(self.events_url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = self.open_stream(response)
+        self.assertTrue((await anext(stream)).startswith('retry:'))
+
+        event = await self.read_event(stream)
+        self.assertEqual(event['event'], 'shipment')
+        data = json.loads(event['data'])
+        self.assertEqual(data['status'], 'IN_TRANSIT')
+        self.assertIn('Dummy', data['weather']['condition'])
+
+        # Nothing is sent for an invalidation without change
+        await sync_to_async(get_broker().publish)([(self.shipment.carrier, self.shipment.tracking_number)])
+        self.assertTrue((await anext(stream)).startswith(':'))
+
+        await sync_to_async(self.deliver)()
+        changed = await self.read_event(stream)
+        self.assertEqual(json.loads(changed['data'])['status'], 'DELIVERY')
+        self.assertNotEqual(changed['id'], event['id'])
+        await stream.aclose()
+
+
+    async def test_resume(self):
+        stream = self.open_stream(await self.async_client.get(self.events_url))
+        await anext(stream)
+        version = (await self.read_event(stream))['id']
+        await stream.aclose()
+
+        with self.settings(SHIPMENT_EVENTS_MAX_DURATION=0.2):
+            response = await self.async_client.get(self.events_url, headers={'Last-Event-ID': version})
+            chunks = [chunk async for chunk in self.open_stream(response)]
+        # Up to date: only heartbeats until the stream is closed
+        self.assertTrue(chunks[0].startswith('retry:'))
+        self.assertTrue(all(chunk.startswith(':') for chunk in chunks[1:]))
+
+        await sync_to_async(self.deliver)()
+        stream = self.open_stream(await self.async_client.get(f'{self.events_url}?version={version}'))
+        await anext(stream)
+        self.assertEqual(json.loads((await self.read_event(stream))['data'])['status'], 'DELIVERY')
+        await stream.aclose()
+
+
+    async def test_broker(self):
+        broker = LocalBroker()
+        with broker.subscribe(('DHL', 'TN1')) as changes:
+            await sync_to_async(broker.publish)([('DHL', 'TN1'), ('DHL', 'TN2')])
+            await sync_to_async(broker.publish)([('DHL', 'TN1')])
+            self.assertTrue(await changes.get())
+            # Coalesced
+            self.assertTrue(changes.empty())
+        self.assertEqual(broker._subscribers, {})
+
+
+    async def test_not_found(self):
+        response = await self.async_client.get(reverse('shipment_events', args=['InvalidCarrier', 'TN0']))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,108 @@
+import json
+from base64 import urlsafe_b64encode
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from shipments.models import Shipment, Article
+
+
+class KeysetPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.super_user = get_user_model().objects.create_superuser('admin', 'random_pass')
+        self.client.force_authenticate(user=self.super_user)
+        for carrier, tracking_number in [('UPS', 'TN1'), ('DHL', 'TN3'), ('DHL', 'TN1'), ('GLS', 'TN2'), ('DHL', 'TN2')]:
+            Shipment.objects.create(
+                tracking_number=tracking_number,
+                carrier=carrier,
+                sender_address="Street 1, 10115 Berlin, Germany",
+                receiver_address="Street 10, 75001 Paris, France",
+                status="IN_TRANSIT"
+            )
+
+    def collect(self, url, params=None, link='next'):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([(shipment['carrier'], shipment['tracking_number']) for shipment in response.data['results']])
+            if not response.data[link]:
+                return pages, response
+            response = self.client.get(response.data[link])
+
+
+    def test_paginate_by_id(self):
+        pages, last = self.collect(reverse('shipment-list'), {'page_size': 2})
+        self.assertEqual(pages, [
+            [('UPS', 'TN1'), ('DHL', 'TN3')],
+            [('DHL', 'TN1'), ('GLS', 'TN2')],
+            [('DHL', 'TN2')],
+        ])
+        self.assertIsNotNone(last.data['previous'])
+
+        previous_pages, _ = self.collect(last.data['previous'], link='previous')
+        self.assertEqual(previous_pages, pages[-2::-1])
+
+
+    def test_paginate_by_carrier_and_tracking_number(self):
+        pages, _ = self.collect(reverse('shipment-list'), {'page_size': 2, 'ordering': 'carrier_tracking_number'})
+        self.assertEqual(pages, [
+            [('DHL', 'TN1'), ('DHL', 'TN2')],
+            [('DHL', 'TN3'), ('GLS', 'TN2')],
+            [('UPS', 'TN1')],
+        ])
+
+
+    def test_pagination_is_stable_with_inserts(self):
+        first = self.client.get(reverse('shipment-list'), {'page_size': 2, 'ordering': 'carrier_tracking_number'})
+        Shipment.objects.create(
+            tracking_number='TN0', carrier='DHL', sender_address="Street 1, 10115 Berlin, Germany",
+            receiver_address="Street 10, 75001 Paris, France", status="IN_TRANSIT"
+        )
+        second = self.client.get(first.data['next'])
+        self.assertEqual([shipment['tracking_number'] for shipment in second.data['results']], ['TN3', 'TN2'])
+
+
+    def test_deep_page_uses_keyset_not_offset(self):
+        first = self.client.get(reverse('shipment-list'), {'page_size': 2})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(first.data['next'])
+        self.assertFalse([query for query in context.captured_queries if 'OFFSET' in query['sql']])
+
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('shipment-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        first = self.client.get(reverse('shipment-list'), {'page_size': 2})
+        response = self.client.get(first.data['next'] + '&ordering=carrier_tracking_number')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_malformed_cursor(self):
+        for ordering, cursor in [
+            ('id', {'o': 'id', 'p': 5, 'r': 0}),
+            ('id', {'o': 'id', 'p': ['abc'], 'r': 0}),
+            ('id', {'o': 'id', 'p': [None], 'r': 0}),
+            ('id', {'o': 'id', 'p': [[1]], 'r': 0}),
+            ('id', ['not', 'a', 'dict']),
+            ('total_value', {'o': 'total_value', 'p': ['x', 1], 'r': 0}),
+            ('item_count', {'o': 'item_count', 'p': [{}, 1], 'r': 0}),
+        ]:
+            with self.subTest(cursor=cursor):
+                encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+                response = self.client.get(reverse('shipment-list'), {'cursor': encoded, 'ordering': ordering})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_paginate_articles(self):
+        for index in range(3):
+            Article.objects.create(name=f"Article {index}", price=10, sku=f"SKU{index}")
+        response = self.client.get(reverse('article-list'), {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([article['sku'] for article in response.data['results']], ['SKU2'])
+        self.assertIsNone(response.data['next'])
@@ -0,0 +1,78 @@
+import time
+from io import StringIO
+
+import responses
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from shipments import two_tier_cache
+from shipments.management.commands.prefetch_weather import METRICS_CACHE_KEY
+from shipments.models import Shipment
+from shipments.weather_integration import get_fetched_at_key
+
+
+@override_settings(WEATHER_API_KEY='test_test_test', WEATHER_CACHE_TIMEOUT=60*60)
+class PrefetchWeatherTestCase(TestCase):
+    paris = '75001 paris, france'
+    url = f'https://api.weatherapi.com/v1/current.json?key=test_test_test&q={paris}'
+
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        for index, (receiver_address, status) in enumerate([
+            ('Street 10, 75001 Paris, France', Shipment.ShipmentStatus.IN_TRANSIT),
+            ('Street 20, 75001 Paris, France', Shipment.ShipmentStatus.SCANNED),
+            ('Street 5, 28013 Madrid, Spain', Shipment.ShipmentStatus.DELIVERY),
+            ('Invalid address', Shipment.ShipmentStatus.TRANSIT),
+        ]):
+            Shipment.objects.create(
+                tracking_number=f'TN{index}',
+                carrier='DHL',
+                sender_address='Street 1, 10115 Berlin, Germany',
+                receiver_address=receiver_address,
+                status=status,
+            )
+
+    def prefetch(self, *args):
+        call_command('prefetch_weather', '--once', '--rate', '1000', *args, stdout=StringIO())
+        return cache.get(METRICS_CACHE_KEY)
+
+
+    @responses.activate
+    def test_prefetch_active_locations(self):
+        response = responses.get(self.url, json={'weather': 'good!'})
+
+        metrics = self.prefetch()
+        self.assertEqual(response.call_count, 1)
+        self.assertEqual(cache.get(self.paris), {'weather': 'good!'})
+        self.assertEqual(metrics['locations'], 1)
+        self.assertEqual(metrics['hit_ratio'], 0)
+        self.assertEqual(metrics['refreshed'], 1)
+
+        metrics = self.prefetch()
+        self.assertEqual(response.call_count, 1)
+        self.assertEqual(metrics['hit_ratio'], 1)
+        self.assertEqual(metrics['refreshed'], 0)
+
+
+    @responses.activate
+    def test_refresh_ahead_of_expiry(self):
+        response = responses.get(self.url, json={'weather': 'good!'})
+        cache.set_many({self.paris: {'weather': 'rainy!'}, get_fetched_at_key(self.paris): time.time() - 55*60})
+
+        metrics = self.prefetch('--refresh-ahead', '600')
+        self.assertEqual(response.call_count, 1)
+        self.assertEqual(cache.get(self.paris), {'weather': 'good!'})
+        self.assertEqual(metrics['hit_ratio'], 1)
+        self.assertAlmostEqual(metrics['max_refresh_lag'], 5*60, delta=5)
+
+
+    @responses.activate
+    def test_failed_refresh(self):
+        response = responses.get(self.url, json={'error': 'bad!'}, status=400)
+
+        self.assertEqual(self.prefetch()['failed'], 1)
+        # Negatively cached
+        self.assertEqual(self.prefetch()['failed'], 0)
+        self.assertEqual(response.call_count, 1)
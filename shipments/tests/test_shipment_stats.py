@@ -0,0 +1,103 @@
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from shipments.models import Shipment, ShipmentCounter, TrackingEvent
+from shipments.shipment_stats import get_shipment_stats, reconcile_shipment_counters
+from shipments.tracking_events import record_tracking_events
+
+
+IN_TRANSIT, DELIVERY = Shipment.ShipmentStatus.IN_TRANSIT, Shipment.ShipmentStatus.DELIVERY
+
+
+def create_shipment(tracking_number, carrier='DHL', receiver_address='Street 10, 75001 Paris, France', status=IN_TRANSIT):
+    return Shipment.objects.create(
+        tracking_number=tracking_number, carrier=carrier, sender_address='Street 1, 10115 Berlin, Germany',
+        receiver_address=receiver_address, status=status,
+    )
+
+
+class ShipmentCountersTestCase(TestCase):
+    def assertCountersReconciled(self):
+        """ The counters maintained on write match a recount """
+        self.assertEqual(reconcile_shipment_counters(), {})
+
+    def test_save_and_delete(self):
+        shipment = create_shipment('TN1')
+        create_shipment('TN2', receiver_address='Street 5, 28013 Madrid, Spain')
+        create_shipment('TN3', carrier='UPS', status=DELIVERY)
+        self.assertEqual(get_shipment_stats(), {'total': 3, 'counts': {'DHL': {IN_TRANSIT: 2}, 'UPS': {DELIVERY: 1}}})
+        self.assertEqual(
+            get_shipment_stats(by_country=True)['counts']['DHL'], {IN_TRANSIT: {'france': 1, 'spain': 1}},
+        )
+
+        shipment.status = DELIVERY
+        shipment.save()
+        # Saved twice, moved once
+        shipment.save()
+        Shipment.objects.get(pk=shipment.pk).save()
+        self.assertEqual(get_shipment_stats()['counts']['DHL'], {IN_TRANSIT: 1, DELIVERY: 1})
+
+        shipment.delete()
+        self.assertEqual(get_shipment_stats()['counts']['DHL'], {IN_TRANSIT: 1})
+        self.assertCountersReconciled()
+
+    def test_deferred_fields(self):
+        shipment = create_shipment('TN1')
+        shipment = Shipment.objects.only('id', 'tracking_number').get(pk=shipment.pk)
+        shipment.status = DELIVERY
+        shipment.save()
+        self.assertEqual(reconcile_shipment_counters(), {('DHL', IN_TRANSIT, 'france'): -1, ('DHL', DELIVERY, 'france'): 1})
+        self.assertCountersReconciled()
+
+    def test_import(self):
+        call_command('import_shipment_data', stdout=StringIO())
+        call_command('import_shipment_data', stdout=StringIO())
+        self.assertEqual(get_shipment_stats()['total'], 5)
+        self.assertCountersReconciled()
+
+    def test_tracking_events(self):
+        shipments = [create_shipment(f'TN{index}') for index in range(3)]
+        timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        record_tracking_events([
+            TrackingEvent(shipment=shipment, status=DELIVERY, timestamp=timestamp) for shipment in shipments[:2]
+        ] + [TrackingEvent(shipment=shipments[2], status=IN_TRANSIT, timestamp=timestamp)])
+        self.assertEqual(get_shipment_stats()['counts']['DHL'], {IN_TRANSIT: 1, DELIVERY: 2})
+        self.assertCountersReconciled()
+
+    def test_reconcile(self):
+        create_shipment('TN1')
+        Shipment.objects.update(status=DELIVERY)
+        ShipmentCounter.objects.create(carrier='GLS', status=IN_TRANSIT, country='', count=3)
+        out = StringIO()
+        call_command('reconcile_shipment_stats', '--once', stdout=out)
+        self.assertIn('3 counters corrected (5 shipments)', out.getvalue())
+        self.assertEqual(get_shipment_stats(), {'total': 1, 'counts': {'DHL': {DELIVERY: 1}}})
+
+
+class ShipmentStatsViewTestCase(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        self.url = reverse('shipment-stats')
+        for index in range(3):
+            create_shipment(f'TN{index}', receiver_address='Not an address' if index else 'Street 10, 75001 Paris, France')
+
+    def test_stats(self):
+        # Read from the counters only
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'total': 3, 'counts': {'DHL': {IN_TRANSIT: 3}}})
+
+        response = self.client.get(self.url, {'by_country': 'true'})
+        self.assertEqual(response.data['counts'], {'DHL': {IN_TRANSIT: {'': 2, 'france': 1}}})
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,146 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from shipments.importer import import_chunk, upsert_articles
+from shipments.models import Article, ArticleShipmentItem, Shipment
+from .test_tracking_cache import ShipmentFixtureMixin
+
+
+class ShipmentSummariesTestCase(ShipmentFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.mouse = Article.objects.create(name='Mouse', price='25.50', sku='MO456')
+
+    def assertSummary(self, item_count, total_value, shipment=None):
+        shipment = shipment or self.shipment
+        shipment.refresh_from_db()
+        self.assertEqual((shipment.item_count, shipment.total_value), (item_count, Decimal(total_value)))
+
+    def test_items(self):
+        self.assertSummary(1, '1200.00')
+        item = ArticleShipmentItem.objects.create(shipment=self.shipment, article=self.mouse, quantity=2)
+        self.assertSummary(3, '1251.00')
+        item.quantity = 4
+        item.save()
+        self.assertSummary(5, '1302.00')
+        item.delete()
+        self.assertSummary(1, '1200.00')
+
+    def test_save_keeps_summary(self):
+        # self.shipment was loaded before its articles were added, it still holds (0, 0)
+        ArticleShipmentItem.objects.create(shipment=self.shipment, article=self.mouse, quantity=2)
+        self.shipment.status = Shipment.ShipmentStatus.DELIVERY
+        self.shipment.save()
+        self.assertSummary(3, '1251.00')
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.DELIVERY)
+
+        # Deferred fields are left alone as well
+        shipment = Shipment.objects.only('id', 'carrier', 'tracking_number').get(pk=self.shipment.pk)
+        shipment.tracking_number = 'TN2'
+        shipment.save()
+        self.assertSummary(3, '1251.00', shipment)
+        self.assertEqual(shipment.status, Shipment.ShipmentStatus.DELIVERY)
+
+    def test_copy_and_insert(self):
+        ArticleShipmentItem.objects.create(shipment=self.shipment, article=self.mouse, quantity=2)
+        self.shipment.refresh_from_db()
+        original_pk = self.shipment.pk
+
+        # Copy idiom: a new row, without items
+        self.shipment.pk = None
+        self.shipment.tracking_number = 'TN-COPY'
+        self.shipment.save()
+        self.assertNotEqual(self.shipment.pk, original_pk)
+        self.assertSummary(0, '0')
+        self.assertSummary(3, '1251.00', Shipment.objects.get(pk=original_pk))
+
+        # Deleted concurrently: saved again as a new row, like any model
+        stale = Shipment.objects.get(pk=original_pk)
+        Shipment.objects.filter(pk=original_pk).delete()
+        stale.status = Shipment.ShipmentStatus.DELIVERY
+        stale.save()
+        self.assertEqual(Shipment.objects.get(pk=original_pk).status, Shipment.ShipmentStatus.DELIVERY)
+
+        # Explicit inserts and update_fields saves keep working
+        Shipment(
+            tracking_number='TN-NEW', carrier='UPS', sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address='Street 10, 75001 Paris, France', status='IN_TRANSIT',
+        ).save(force_insert=True)
+        stale.carrier = 'GLS'
+        stale.save(update_fields=['carrier'])
+        self.assertEqual(Shipment.objects.get(pk=original_pk).carrier, 'GLS')
+
+    def test_m2m(self):
+        self.shipment.articles.add(self.mouse, through_defaults={'quantity': 3})
+        self.assertSummary(4, '1276.50')
+        self.shipment.articles.remove(self.article)
+        self.assertSummary(3, '76.50')
+        self.shipment.articles.clear()
+        self.assertSummary(0, '0')
+
+    def test_reverse_m2m(self):
+        other = Shipment.objects.create(
+            tracking_number='TN2', carrier='UPS', sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address='Street 10, 75001 Paris, France', status='IN_TRANSIT',
+        )
+        self.mouse.shipments.add(self.shipment, other)
+        self.assertSummary(2, '1225.50')
+        self.assertSummary(1, '25.50', other)
+        self.mouse.shipments.clear()
+        self.assertSummary(1, '1200.00')
+        self.assertSummary(0, '0', other)
+
+    def test_article_changes(self):
+        self.shipment.articles.add(self.mouse, through_defaults={'quantity': 2})
+        self.mouse.price = 10
+        self.mouse.save()
+        self.assertSummary(3, '1220.00')
+        upsert_articles({'LP123': ('Laptop', Decimal('1000'))})
+        self.assertSummary(3, '1020.00')
+        self.mouse.delete()
+        self.assertSummary(1, '1000.00')
+
+    def test_import(self):
+        row = {
+            'tracking_number': 'TN1', 'carrier': 'DHL',
+            'sender_address': 'Street 1, 10115 Berlin, Germany',
+            'receiver_address': 'Street 10, 75001 Paris, France',
+            'article_name': 'Laptop', 'article_quantity': 2, 'article_price': '1200', 'SKU': 'LP123', 'status': 'transit',
+        }
+        import_chunk([row, {**row, 'article_name': 'Mouse', 'article_quantity': 1, 'article_price': '25.50', 'SKU': 'MO456'}])
+        self.assertSummary(3, '2425.50', Shipment.objects.get(tracking_number='TN1'))
+
+
+class ShipmentSummariesViewTestCase(ShipmentFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        for index in range(4):
+            shipment = Shipment.objects.create(
+                tracking_number=f'TN{index}', carrier='UPS', sender_address='Street 1, 10115 Berlin, Germany',
+                receiver_address='Not an address', status='IN_TRANSIT',
+            )
+            shipment.articles.add(self.article, through_defaults={'quantity': 4 - index})
+
+    def get_tracking_numbers(self, response):
+        return [shipment['tracking_number'] for shipment in response.data['results']]
+
+    def test_response(self):
+        response = self.client.get(reverse('shipment-detail', args=[self.shipment.pk]))
+        self.assertEqual((response.data['item_count'], response.data['total_value']), (1, '1200.00'))
+
+    def test_filters(self):
+        response = self.client.get(reverse('shipment-list'), {'total_value__gte': '2000', 'item_count__lte': 3})
+        self.assertEqual(self.get_tracking_numbers(response), ['TN1', 'TN2'])
+
+    def test_ordering(self):
+        response = self.client.get(reverse('shipment-list'), {'ordering': 'total_value', 'page_size': 2})
+        self.assertEqual(self.get_tracking_numbers(response), ['TN12345678', 'TN3'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.get_tracking_numbers(response), ['TN2', 'TN1'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.get_tracking_numbers(response), ['TN0'])
@@ -0,0 +1,133 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from shipments import two_tier_cache
+from shipments.models import Shipment, Article, ArticleShipmentItem
+from shipments.tracking_cache import get_tracking_cache
+
+
+class ShipmentFixtureMixin:
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.shipment = Shipment.objects.create(
+            tracking_number="TN12345678",
+            carrier="DHL",
+            sender_address="Street 1, 10115 Berlin, Germany",
+            receiver_address="Street 10, 75001 Paris, France",
+            status="IN_TRANSIT"
+        )
+        self.article = Article.objects.create(name="Laptop", price=1200.00, sku="LP123")
+        self.shipment.articles.add(self.article)
+        self.url = reverse('shipment-get_shipment', args=[self.shipment.carrier, self.shipment.tracking_number])
+
+
+class TrackingCacheTestCase(ShipmentFixtureMixin, APITestCase):
+    def assertCached(self, cached=True):
+        self.assertEqual(get_tracking_cache(self.shipment.carrier, self.shipment.tracking_number) is not None, cached)
+
+
+    def test_response_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertCached()
+        self.assertNotIn('weather', get_tracking_cache(self.shipment.carrier, self.shipment.tracking_number))
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(self.url)
+        self.assertEqual(cached_response.data, response.data)
+        self.assertIn('Dummy', cached_response.data['weather']['condition'])
+
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('ETag'))
+
+        not_modified = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        self.shipment.status = Shipment.ShipmentStatus.DELIVERY
+        self.shipment.save()
+        modified = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(modified.status_code, status.HTTP_200_OK)
+        self.assertEqual(modified.data['status'], 'DELIVERY')
+
+
+    def test_invalidated_by_shipment_change(self):
+        self.client.get(self.url)
+        Shipment.objects.get(pk=self.shipment.pk).save()
+        self.assertCached(False)
+
+
+    def test_invalidated_by_tracking_number_change(self):
+        self.client.get(self.url)
+        shipment = Shipment.objects.get(pk=self.shipment.pk)
+        shipment.tracking_number = 'TN0'
+        shipment.save()
+        self.assertCached(False)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_invalidated_by_item_change(self):
+        self.client.get(self.url)
+        item = ArticleShipmentItem.objects.get()
+        item.quantity = 3
+        item.save()
+        self.assertCached(False)
+        self.assertEqual(self.client.get(self.url).data['articles'][0]['quantity'], 3)
+
+        item.delete()
+        self.assertCached(False)
+        self.assertEqual(self.client.get(self.url).data['articles'], [])
+
+
+    def test_invalidated_by_article_change(self):
+        self.client.get(self.url)
+        self.article.price = 1000
+        self.article.save()
+        self.assertCached(False)
+        self.assertEqual(self.client.get(self.url).data['articles'][0]['price'], '1000.00')
+
+
+    def test_invalidated_by_m2m_change(self):
+        self.client.get(self.url)
+        self.shipment.articles.add(Article.objects.create(name="Mouse", price=25, sku="MO456"))
+        self.assertCached(False)
+
+        self.client.get(self.url)
+        self.article.shipments.clear()
+        self.assertCached(False)
+        self.assertEqual(len(self.client.get(self.url).data['articles']), 1)
+
+
+class AsyncTrackShipmentTestCase(ShipmentFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_url = reverse('track_shipment', args=[self.shipment.carrier, self.shipment.tracking_number])
+
+
+    async def test_track_shipment(self):
+        response = await self.async_client.get(self.async_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['tracking_number'], self.shipment.tracking_number)
+        self.assertEqual(response.json()['articles'][0]['sku'], 'LP123')
+        self.assertIn('Dummy', response.json()['weather']['condition'])
+
+
+    async def test_track_shipment_same_as_sync(self):
+        sync_response = await sync_to_async(self.client.get)(self.url)
+        response = await self.async_client.get(self.async_url)
+        self.assertEqual(response.json(), sync_response.json())
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+
+        not_modified = await self.async_client.get(self.async_url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+    async def test_track_shipment_not_found(self):
+        response = await self.async_client.get(reverse('track_shipment', args=['InvalidCarrier', 'TN0']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,347 @@
+import json
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from shipments import two_tier_cache
+from shipments.models import Shipment, TrackingEvent
+from shipments.tracking_events import (
+    MAX_TRANSITION_ATTEMPTS, TRANSITION_UPDATE_SIZE, ingest_tracking_events, record_tracking_events, replay_events,
+)
+from .utils import QueryCountAssertionsMixin
+
+
+class TrackingEventsTestCase(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.shipment = Shipment.objects.create(
+            tracking_number='TN12345678',
+            carrier='DHL',
+            sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address='Street 10, 75001 Paris, France',
+            status=Shipment.ShipmentStatus.IN_TRANSIT,
+        )
+        self.url = reverse('shipment-get_shipment', args=[self.shipment.carrier, self.shipment.tracking_number])
+        self.started_at = datetime(2024, 11, 1, 8, tzinfo=timezone.utc)
+
+    def event(self, status, hours, **kwargs):
+        return TrackingEvent(shipment=self.shipment, status=status, timestamp=self.started_at + timedelta(hours=hours), **kwargs)
+
+
+    def test_status_follows_latest_event(self):
+        record_tracking_events([
+            self.event(Shipment.ShipmentStatus.INBOUND_SCAN, 1, location='Berlin', payload={'scan': 1}),
+            self.event(Shipment.ShipmentStatus.TRANSIT, 2),
+        ])
+        self.shipment.refresh_from_db()
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.TRANSIT)
+        self.assertEqual(self.shipment.status_updated_at, self.started_at + timedelta(hours=2))
+
+        # Stored, but older than the current status
+        record_tracking_events([self.event(Shipment.ShipmentStatus.SCANNED, 0)])
+        self.shipment.refresh_from_db()
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.TRANSIT)
+        self.assertEqual(self.shipment.tracking_events.count(), 3)
+
+
+    def test_append_only(self):
+        record_tracking_events([self.event(Shipment.ShipmentStatus.SCANNED, 1)])
+        event = TrackingEvent.objects.get()
+        event.status = Shipment.ShipmentStatus.DELIVERY
+        with self.assertRaises(ValueError):
+            event.save()
+
+
+    def test_timeline(self):
+        self.client.get(self.url)
+        record_tracking_events([
+            self.event(Shipment.ShipmentStatus.INBOUND_SCAN, 1, location='Berlin', payload={'scan': 1}),
+            self.event(Shipment.ShipmentStatus.DELIVERY, 2, location='Paris'),
+        ])
+
+        # The cached response was invalidated
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['status'], 'DELIVERY')
+        self.assertEqual(
+            [(event['status'], event['location']) for event in response.data['timeline']],
+            [('DELIVERY', 'Paris'), ('INBOUND_SCAN', 'Berlin')],
+        )
+        self.assertNotIn('payload', response.data['timeline'][0])
+
+
+    @override_settings(TRACKING_TIMELINE_LIMIT=10)
+    def test_timeline_is_bounded(self):
+        hours = iter(range(1000))
+
+        def grow():
+            record_tracking_events([self.event(Shipment.ShipmentStatus.TRANSIT, next(hours)) for _ in range(50)])
+
+        self.assertConstantQueries(lambda: self.client.get(self.url), grow)
+        timeline = self.client.get(self.url).data['timeline']
+        self.assertEqual(len(timeline), 10)
+        self.assertEqual(timeline[0]['timestamp'], (self.started_at + timedelta(hours=99)).isoformat().replace('+00:00', 'Z'))
+
+
+class CreateTrackingEventPartitionsTestCase(TestCase):
+    def test_create_partitions(self):
+        out = StringIO()
+        call_command('create_tracking_event_partitions', months=2, stdout=out)
+        if connection.vendor == 'postgresql':
+            self.assertEqual(out.getvalue().count('ready'), 2)
+        else:
+            self.assertIn('nothing to do', out.getvalue())
+
+
+class IngestEventsTestCase(QueryCountAssertionsMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        self.shipments = [self.create_shipment(index) for index in range(2)]
+        self.url = reverse('shipment-ingest_events')
+
+    def create_shipment(self, index):
+        return Shipment.objects.create(
+            tracking_number=f'TN{index:08d}',
+            carrier='DHL',
+            sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address='Street 10, 75001 Paris, France',
+            status=Shipment.ShipmentStatus.IN_TRANSIT,
+        )
+
+    def item(self, shipment, status, timestamp, **kwargs):
+        return {
+            'carrier': shipment.carrier, 'tracking_number': shipment.tracking_number,
+            'status': status, 'timestamp': timestamp, **kwargs,
+        }
+
+
+    def test_ingest(self):
+        first, second = self.shipments
+        response = self.client.post(self.url, [
+            self.item(first, 'TRANSIT', '2024-11-01T10:00:00Z', location='Berlin'),
+            self.item(first, 'inbound-scan', '2024-11-01T09:00:00Z'),
+            self.item(second, 'delivery', '2024-11-01T11:00:00Z', payload={'signed_by': 'J. Doe'}),
+            {'carrier': 'DHL', 'tracking_number': 'TN_UNKNOWN', 'status': 'TRANSIT', 'timestamp': '2024-11-01T10:00:00Z'},
+            self.item(first, 'LOST', '2024-11-01T12:00:00Z'),
+            'not an event',
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [result['result'] for result in response.data['results']],
+            ['updated', 'recorded', 'updated', 'not_found', 'invalid', 'invalid'],
+        )
+        self.assertIn('status', response.data['results'][4]['errors'])
+        self.assertEqual(
+            {name: response.data[name] for name in ('received', 'updated', 'recorded', 'not_found', 'invalid')},
+            {'received': 6, 'updated': 2, 'recorded': 1, 'not_found': 1, 'invalid': 2},
+        )
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, Shipment.ShipmentStatus.TRANSIT)
+        self.assertEqual(second.status, Shipment.ShipmentStatus.DELIVERY)
+        self.assertEqual(first.tracking_events.count(), 2)
+        self.assertEqual(second.tracking_events.get().payload, {'signed_by': 'J. Doe'})
+
+
+    def test_ingest_ndjson(self):
+        first, second = self.shipments
+        body = '\n'.join(json.dumps(self.item(shipment, 'SCANNED', '2024-11-01T10:00:00Z')) for shipment in self.shipments)
+        response = self.client.post(self.url, body + '\n', content_type='application/x-ndjson')
+        self.assertEqual(response.data['updated'], 2)
+
+        response = self.client.post(self.url, '{"carrier": "DHL"\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 1', response.data['detail'])
+
+
+    def test_not_a_list(self):
+        response = self.client.post(self.url, self.item(self.shipments[0], 'SCANNED', '2024-11-01T10:00:00Z'), format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+    @override_settings(TRACKING_EVENTS_BATCH_SIZE=3)
+    def test_batches(self):
+        items = [
+            self.item(shipment, status, f'2024-11-01T{hour:02d}:00:00Z')
+            for hour, status in enumerate(['SCANNED', 'INBOUND_SCAN', 'TRANSIT', 'DELIVERY']) for shipment in self.shipments
+        ]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.data['updated'] + response.data['recorded'], 8)
+        self.assertEqual(TrackingEvent.objects.count(), 8)
+        for shipment in self.shipments:
+            shipment.refresh_from_db()
+            self.assertEqual(shipment.status, Shipment.ShipmentStatus.DELIVERY)
+            self.assertEqual(shipment.status_updated_at, datetime(2024, 11, 1, 3, tzinfo=timezone.utc))
+
+
+    def test_constant_queries(self):
+        items = []
+
+        def grow():
+            for _ in range(10):
+                shipment = self.create_shipment(Shipment.objects.count())
+                items.append(self.item(shipment, 'TRANSIT', '2024-11-01T10:00:00Z'))
+
+        grow()
+        self.assertConstantQueries(lambda: self.client.post(self.url, items, format='json'), grow)
+
+
+class StatusTransitionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.shipment = Shipment.objects.create(
+            tracking_number='TN12345678',
+            carrier='DHL',
+            sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address='Street 10, 75001 Paris, France',
+            status=Shipment.ShipmentStatus.SCANNED,
+        )
+        self.started_at = datetime(2024, 11, 1, 8, tzinfo=timezone.utc)
+
+    def item(self, status, hours):
+        return {
+            'carrier': 'DHL', 'tracking_number': 'TN12345678',
+            'status': status, 'timestamp': self.started_at + timedelta(hours=hours),
+        }
+
+    def ingest(self, *items):
+        with CaptureQueriesContext(connection) as context:
+            results = ingest_tracking_events(list(items))
+        self.writes = [query['sql'] for query in context.captured_queries if query['sql'].startswith(('UPDATE', 'INSERT'))]
+        self.shipment.refresh_from_db()
+        return results
+
+
+    def test_can_transition(self):
+        status = Shipment.ShipmentStatus
+        self.assertTrue(Shipment.can_transition(status.TRANSIT, None, status.INBOUND_SCAN, self.started_at))
+        self.assertFalse(Shipment.can_transition(status.DELIVERY, None, status.INBOUND_SCAN, self.started_at))
+        self.assertFalse(Shipment.can_transition(status.TRANSIT, None, status.TRANSIT, self.started_at))
+        # Same time: only towards a further status
+        self.assertTrue(Shipment.can_transition(status.TRANSIT, self.started_at, status.DELIVERY, self.started_at))
+        self.assertFalse(Shipment.can_transition(status.TRANSIT, self.started_at, status.SCANNED, self.started_at))
+        self.assertFalse(Shipment.can_transition(status.TRANSIT, self.started_at, status.TRANSIT, self.started_at))
+
+
+    def test_delivery_is_final(self):
+        self.assertEqual(self.ingest(self.item('DELIVERY', 1), self.item('INBOUND_SCAN', 2)), ['updated', 'recorded'])
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.DELIVERY)
+
+        self.assertEqual(self.ingest(self.item('TRANSIT', 3)), ['recorded'])
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.DELIVERY)
+        self.assertEqual(self.shipment.status_updated_at, self.started_at + timedelta(hours=1))
+
+
+    def test_events_of_the_same_time_do_not_depend_on_order(self):
+        for first, second in [('TRANSIT', 'DELIVERY'), ('DELIVERY', 'TRANSIT')]:
+            for batches in [[(first, second)], [(first,), (second,)]]:
+                with self.subTest(order=(first, second), batches=len(batches)):
+                    TrackingEvent.objects.all().delete()
+                    Shipment.objects.filter(pk=self.shipment.pk).update(
+                        status=Shipment.ShipmentStatus.SCANNED, status_updated_at=None,
+                    )
+                    for batch in batches:
+                        self.ingest(*(self.item(status, 1) for status in batch))
+                    self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.DELIVERY)
+                    self.assertEqual(self.shipment.status_updated_at, self.started_at + timedelta(hours=1))
+
+        TrackingEvent.objects.all().delete()
+        Shipment.objects.filter(pk=self.shipment.pk).update(status=Shipment.ShipmentStatus.SCANNED, status_updated_at=None)
+        self.assertEqual(self.ingest(self.item('TRANSIT', 1), self.item('DELIVERY', 1)), ['recorded', 'updated'])
+        self.assertEqual(self.ingest(self.item('IN_TRANSIT', 1)), ['recorded'])
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.DELIVERY)
+
+    def test_large_batch(self):
+        # Over the 1000 expressions SQLite accepts in one WHERE, the compare-and-set is chunked
+        shipments = Shipment.objects.bulk_create([
+            Shipment(
+                tracking_number=f'TN{index}', carrier='UPS', sender_address=self.shipment.sender_address,
+                receiver_address=self.shipment.receiver_address, status=Shipment.ShipmentStatus.SCANNED,
+            )
+            for index in range(1200)
+        ])
+        items = [
+            {'carrier': 'UPS', 'tracking_number': shipment.tracking_number, 'status': 'DELIVERY',
+             'timestamp': self.started_at}
+            for shipment in shipments
+        ]
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(ingest_tracking_events(items), ['updated'] * 1200)
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE "shipments_shipment"')]
+        self.assertEqual(len(updates), -(-1200 // TRANSITION_UPDATE_SIZE))
+        self.assertEqual(
+            Shipment.objects.filter(carrier='UPS', status=Shipment.ShipmentStatus.DELIVERY).count(), 1200,
+        )
+
+    def test_duplicates_are_not_written(self):
+        self.assertEqual(self.ingest(self.item('TRANSIT', 1), self.item('TRANSIT', 1)), ['updated', 'duplicate'])
+        self.assertEqual(self.ingest(self.item('TRANSIT', 1)), ['duplicate'])
+        self.assertEqual(self.writes, [])
+        self.assertEqual(self.shipment.tracking_events.count(), 1)
+
+
+    def test_stale_and_repeated_events_do_not_update(self):
+        self.ingest(self.item('TRANSIT', 2))
+
+        self.assertEqual(self.ingest(self.item('INBOUND_SCAN', 1)), ['recorded'])
+        self.assertEqual(self.ingest(self.item('TRANSIT', 3)), ['recorded'])
+        # The events are appended to the history, the shipment is not written
+        self.assertEqual(len(self.writes), 1)
+        self.assertTrue(self.writes[0].startswith('INSERT'))
+        self.assertIn('shipments_trackingevent', self.writes[0])
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.TRANSIT)
+        self.assertEqual(self.shipment.status_updated_at, self.started_at + timedelta(hours=2))
+
+
+    def test_concurrent_update_is_not_overwritten(self):
+        def delivered_meanwhile(status, status_updated_at, events):
+            # Another worker applies a delivery between the read and the compare-and-set of this one
+            if not Shipment.objects.filter(status=Shipment.ShipmentStatus.DELIVERY).exists():
+                Shipment.objects.filter(pk=self.shipment.pk).update(
+                    status=Shipment.ShipmentStatus.DELIVERY, status_updated_at=self.started_at + timedelta(hours=5),
+                )
+            return replay_events(status, status_updated_at, events)
+
+        with patch('shipments.tracking_events.replay_events', delivered_meanwhile):
+            self.assertEqual(self.ingest(self.item('TRANSIT', 1)), ['recorded'])
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.DELIVERY)
+
+
+    def test_contended_shipment_is_locked(self):
+        locked, interferences = [], []
+        select_for_update = QuerySet.select_for_update
+
+        def lock(queryset, *args, **kwargs):
+            locked.append(True)
+            return select_for_update(queryset, *args, **kwargs)
+
+        def updated_meanwhile(status, status_updated_at, events):
+            # Another worker scans the shipment between every read and compare-and-set, until it is locked
+            if not locked:
+                interferences.append(True)
+                scan = Shipment.ShipmentStatus.INBOUND_SCAN if len(interferences) % 2 else Shipment.ShipmentStatus.SCANNED
+                Shipment.objects.filter(pk=self.shipment.pk).update(
+                    status=scan, status_updated_at=self.started_at + timedelta(hours=len(interferences)),
+                )
+            return replay_events(status, status_updated_at, events)
+
+        with patch('shipments.tracking_events.replay_events', updated_meanwhile), \
+                patch.object(QuerySet, 'select_for_update', lock):
+            self.assertEqual(self.ingest(self.item('DELIVERY', 10)), ['updated'])
+        self.assertEqual(len(interferences), MAX_TRANSITION_ATTEMPTS - 1)
+        self.assertEqual(self.shipment.status, Shipment.ShipmentStatus.DELIVERY)
+        self.assertEqual(self.shipment.status_updated_at, self.started_at + timedelta(hours=10))
@@ -0,0 +1,143 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from shipments import two_tier_cache
+from shipments.models import Shipment
+from shipments.tracking_cache import get_cache_key, get_tracking_cache, tracking_local_cache
+from shipments.two_tier_cache import TwoTierCache
+from shipments.weather_integration import WeatherAPIClient, weather_local_cache
+
+
+class TwoTierCacheTestCase(TestCase):
+    def setUp(self):
+        self.local_cache = TwoTierCache('test')
+        self.remote = {'a': 1, 'b': 2, 'c': 3}
+        self.remote_calls = []
+
+    def fetch_remote(self, keys):
+        self.remote_calls.append(keys)
+        return {key: self.remote[key] for key in keys if key in self.remote}
+
+
+    def test_local_hits(self):
+        self.assertEqual(self.local_cache.get_many(['a', 'b', 'x'], self.fetch_remote), {'a': 1, 'b': 2})
+        self.assertEqual(self.local_cache.get_many(['a', 'b', 'x'], self.fetch_remote), {'a': 1, 'b': 2})
+        # Only the miss goes to the remote tier again
+        self.assertEqual(self.remote_calls, [['a', 'b', 'x'], ['x']])
+
+        stats = self.local_cache.stats()
+        self.assertEqual(stats['local'], {'hits': 2, 'misses': 4, 'hit_ratio': 2 / 6})
+        self.assertEqual(stats['remote'], {'hits': 2, 'misses': 2, 'hit_ratio': 0.5})
+        self.assertIn('test', two_tier_cache.get_stats())
+
+
+    @override_settings(LOCAL_CACHE_MAX_ENTRIES=2)
+    def test_lru_eviction(self):
+        self.local_cache.get_many(['a', 'b'], self.fetch_remote)
+        self.local_cache.get_many(['a'], self.fetch_remote)
+        self.local_cache.get_many(['c'], self.fetch_remote)
+
+        # 'b' was the least recently used
+        self.assertEqual(self.local_cache.get_local(['a', 'b', 'c']), ({'a': 1, 'c': 3}, ['b']))
+
+
+    @override_settings(LOCAL_CACHE_TIMEOUT=0.05)
+    def test_expiry(self):
+        self.local_cache.get_many(['a'], self.fetch_remote)
+        self.remote['a'] = 10
+        self.assertEqual(self.local_cache.get_many(['a'], self.fetch_remote), {'a': 1})
+
+        time.sleep(0.1)
+        self.assertEqual(self.local_cache.get_many(['a'], self.fetch_remote), {'a': 10})
+
+
+    def test_delete(self):
+        self.local_cache.get_many(['a'], self.fetch_remote)
+        self.remote['a'] = 10
+        self.local_cache.delete_many(['a'])
+        self.assertEqual(self.local_cache.get_many(['a'], self.fetch_remote), {'a': 10})
+
+
+    @override_settings(LOCAL_CACHE_PUBSUB=True)
+    def test_broadcast_invalidation(self):
+        broadcast_cache = TwoTierCache('test-broadcast', broadcast=True)
+        redis_client = MagicMock()
+        with patch('shipments.two_tier_cache.get_redis_client', return_value=redis_client), \
+                patch('shipments.two_tier_cache.start_invalidation_listener'):
+            broadcast_cache.get_many(['a'], self.fetch_remote)
+            broadcast_cache.delete_many(['a'])
+
+        channel, data = redis_client.publish.call_args.args
+        self.assertEqual(channel, two_tier_cache.INVALIDATION_CHANNEL)
+        self.assertEqual(json.loads(data)['keys'], ['a'])
+
+        # The invalidations of other processes are applied, the own ones are ignored
+        broadcast_cache.get_many(['a'], self.fetch_remote)
+        two_tier_cache.handle_invalidation(data)
+        self.assertEqual(broadcast_cache.get_local(['a'])[0], {'a': 1})
+        two_tier_cache.handle_invalidation(json.dumps({**json.loads(data), 'origin': 'other'}))
+        self.assertEqual(broadcast_cache.get_local(['a'])[0], {})
+
+
+@override_settings(WEATHER_API_KEY='test_test_test')
+class TwoTierLookupTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.location = '10115 berlin, germany'
+
+
+    def test_weather_served_locally(self):
+        cache.set(self.location, {'weather': 'rainy!'})
+        client = WeatherAPIClient()
+        self.assertEqual(client.get_weather(self.location), {'weather': 'rainy!'})
+
+        cache.clear()
+        self.assertEqual(client.get_weather(self.location), {'weather': 'rainy!'})
+        self.assertEqual(weather_local_cache.stats()['local']['hits'], 1)
+
+        # A new value of this process replaces the local one
+        client.set_weather_cache(self.location, {'weather': 'sunny!'})
+        self.assertEqual(client.get_weather(self.location), {'weather': 'sunny!'})
+
+
+    def test_tracking_served_locally(self):
+        shipment = Shipment.objects.create(
+            tracking_number='TN12345678', carrier='DHL', sender_address='Street 1, 10115 Berlin, Germany',
+            receiver_address='Street 10, 75001 Paris, France', status=Shipment.ShipmentStatus.IN_TRANSIT,
+        )
+        # WEATHER_API_KEY is set, the real client would call the upstream
+        with patch('shipments.rest.serializers.get_client') as get_client:
+            get_client.return_value.get_weather.return_value = {'weather': 'rainy!'}
+            response = self.client.get(reverse('shipment-get_shipment', args=['DHL', 'TN12345678']))
+        self.assertEqual(response.data['weather'], {'weather': 'rainy!'})
+        self.assertIsNotNone(get_tracking_cache('DHL', 'TN12345678'))
+
+        cache.delete(get_cache_key('DHL', 'TN12345678'))
+        cached = get_tracking_cache('DHL', 'TN12345678')
+        self.assertEqual(cached['status'], 'IN_TRANSIT')
+        # Callers get a copy, the local entry is shared between requests
+        cached['weather'] = 'rainy!'
+        self.assertNotIn('weather', get_tracking_cache('DHL', 'TN12345678'))
+
+        shipment.status = Shipment.ShipmentStatus.DELIVERY
+        shipment.save()
+        self.assertEqual(tracking_local_cache.get_local([get_cache_key('DHL', 'TN12345678')])[0], {})
+        self.assertIsNone(get_tracking_cache('DHL', 'TN12345678'))
+
+
+    def test_stats_endpoint(self):
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code, 401)
+
+        self.client.force_authenticate(user=get_user_model().objects.create_superuser('admin', 'random_pass'))
+        response = self.client.get(reverse('cache_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['weather']), {'entries', 'local', 'remote'})
+        self.assertIn('tracking', response.data)
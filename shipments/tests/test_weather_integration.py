@@ -1,9 +1,22 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
+import httpx
+import requests
 import responses
+from responses.registries import OrderedRegistry
 from django.core.cache import cache
 from django.test import TestCase, override_settings
 
-from shipments.weather_integration import get_client
+from shipments import two_tier_cache
+from shipments.weather_integration import (
+    acquire_lock, get_client, get_error_key, get_error_timeout, get_fetched_at_key, get_http_session,
+    get_http_timeout, release_lock,
+)
 from shipments.models import Shipment, Article, ArticleShipmentItem
 
 class WeatherIntegrationTestCase(TestCase):
@@ -17,6 +30,7 @@ class WeatherIntegrationTestCase(TestCase):
 
     def setUp(self):
         cache.clear()
+        two_tier_cache.clear_all()
 
 
     def test_dummy_weather_client(self):
@@ -35,6 +49,36 @@ class WeatherIntegrationTestCase(TestCase):
         self.assertEquals(client.__class__.__name__, 'WeatherAPIClient')
 
 
+    @override_settings(WEATHER_API_KEY=dummy_key)
+    def test_client_is_reused(self):
+        self.assertIs(get_client(), get_client())
+        self.assertIs(get_http_session(), get_http_session())
+        with override_settings(WEATHER_API_KEY=None):
+            self.assertEquals(get_client().__class__.__name__, 'DummyWeatherClient')
+
+
+    @override_settings(WEATHER_API_KEY=dummy_key)
+    @responses.activate
+    def test_client_timeout(self):
+        response = responses.get(self.url, body=requests.Timeout('read timeout'))
+
+        data = get_client().get_weather(self.location)
+        self.assertIsNone(data)
+        self.assertEquals(response.call_count, 1)
+        self.assertEquals(responses.calls[0].request.req_kwargs['timeout'], get_http_timeout())
+
+
+    @override_settings(WEATHER_API_KEY=dummy_key)
+    @responses.activate(registry=OrderedRegistry)
+    def test_client_retries_server_errors(self):
+        responses.get(self.url, json={'error': 'unavailable'}, status=503)
+        responses.get(self.url, json={'weather': 'good!'}, status=200)
+
+        data = get_client().get_weather(self.location)
+        self.assertEquals(data, {'weather': 'good!'})
+        self.assertEquals(len(responses.calls), 2)
+
+
     @override_settings(WEATHER_API_KEY=dummy_key)
     @responses.activate
     def test_client_with_same_duplicate_location(self):
@@ -88,6 +132,14 @@ class WeatherIntegrationTestCase(TestCase):
         self.assertIsNone(cache.get(self.location))
         self.assertTrue(response.call_count, 1)
 
+        # Negatively cached
+        try_again_data = client.get_weather(self.location)
+        self.assertIsNone(try_again_data)
+        self.assertEquals(response.call_count, 1)
+
+        # Once expired in both tiers
+        cache.delete(get_error_key(self.location))
+        two_tier_cache.clear_all()
         try_again_data = client.get_weather(self.location)
         self.assertEquals(response.call_count, 2)
 
@@ -113,9 +165,265 @@ class WeatherIntegrationTestCase(TestCase):
         response = responses.get(self.url, json={'weather': 'good!'}, status=200)
         weather_cache = cache.set(self.location, {'weather': 'rainy!'})
         cache.clear()
+        two_tier_cache.clear_all()
 
         self.assertEquals(response.call_count, 0)
         data = client.get_weather(self.location)
         self.assertEquals(data, {'weather': 'good!'})
         self.assertEquals(cache.get(self.location), {'weather': 'good!'})
         self.assertEquals(response.call_count, 1)
+
+
+    @override_settings(WEATHER_API_KEY=dummy_key)
+    @responses.activate
+    def test_get_weathers_batch(self):
+        different_location = '70173 Stuttgart'
+        client = get_client()
+        response = responses.get(self.url, json={'weather': 'good!'}, status=200)
+        response_2 = responses.get(
+            f'https://api.weatherapi.com/v1/current.json?key={self.dummy_key}&q={different_location}',
+            json={'weather': 'awesome!'},
+            status=200
+        )
+        cache.set('10117 Berlin', {'weather': 'rainy!'})
+
+        data = client.get_weathers([self.location, different_location, self.location, '10117 Berlin'])
+        self.assertEquals(data, {
+            self.location: {'weather': 'good!'},
+            different_location: {'weather': 'awesome!'},
+            '10117 Berlin': {'weather': 'rainy!'},
+        })
+        self.assertEquals(response.call_count, 1)
+        self.assertEquals(response_2.call_count, 1)
+        self.assertEquals(cache.get(different_location), {'weather': 'awesome!'})
+
+        client.get_weathers([self.location, different_location])
+        self.assertEquals(len(responses.calls), 2)
+
+
+class AsyncWeatherIntegrationTestCase(TestCase):
+    location = '10115 Berlin'
+    dummy_key = 'test_test_test'
+
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.calls = []
+
+    def mock_http_client(self, status_code=200, json=None):
+        def handler(request):
+            self.calls.append(request)
+            return httpx.Response(status_code, json=json)
+        return patch(
+            'shipments.weather_integration.get_async_http_client',
+            return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+
+
+    async def test_dummy_weather_client(self):
+        data = await get_client().aget_weather(self.location)
+        self.assertIn('Dummy', data['condition'])
+        self.assertIsNone(await cache.aget(self.location))
+
+
+    @override_settings(WEATHER_API_KEY=dummy_key)
+    async def test_weather_api_client(self):
+        with self.mock_http_client(json={'weather': 'good!'}):
+            data = await get_client().aget_weather(self.location)
+            same_data = await get_client().aget_weather(self.location)
+
+        self.assertEqual(data, {'weather': 'good!'})
+        self.assertEqual(same_data, data)
+        self.assertEqual(await cache.aget(self.location), {'weather': 'good!'})
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0].url.params['q'], self.location)
+        self.assertEqual(self.calls[0].url.params['key'], self.dummy_key)
+
+
+    @override_settings(WEATHER_API_KEY=dummy_key)
+    async def test_weather_api_client_error(self):
+        with self.mock_http_client(status_code=400, json={'error': 'bad!'}):
+            data = await get_client().aget_weather(self.location)
+
+        self.assertIsNone(data)
+        self.assertIsNone(await cache.aget(self.location))
+
+
+@override_settings(WEATHER_API_KEY='test_test_test')
+class SingleFlightWeatherTestCase(TestCase):
+    location = '10115 Berlin'
+    url = f'https://api.weatherapi.com/v1/current.json?key=test_test_test&q={location}'
+
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+
+    def slow_response(self, request):
+        time.sleep(0.2)
+        return 200, {}, json.dumps({'weather': 'good!'})
+
+
+    @responses.activate
+    def test_concurrent_misses_are_coalesced(self):
+        responses.add_callback(responses.GET, self.url, callback=self.slow_response)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(get_client().get_weather, [self.location] * 8))
+
+        self.assertEquals(results, [{'weather': 'good!'}] * 8)
+        self.assertEquals(len(responses.calls), 1)
+
+
+    @responses.activate
+    def test_waits_for_other_worker(self):
+        response = responses.get(self.url, json={'weather': 'good!'}, status=200)
+        # Another worker holds the lock and stores its result a bit later
+        cache.add(f'weather-lock:{self.location}', 1)
+        def other_worker():
+            time.sleep(0.2)
+            cache.set(self.location, {'weather': 'from other worker'})
+            cache.delete(f'weather-lock:{self.location}')
+        threading.Thread(target=other_worker).start()
+
+        data = get_client().get_weather(self.location)
+        self.assertEquals(data, {'weather': 'from other worker'})
+        self.assertEquals(response.call_count, 0)
+
+
+    @responses.activate
+    @override_settings(WEATHER_LOCK_WAIT=0.2)
+    def test_does_not_wait_for_stuck_worker(self):
+        response = responses.get(self.url, json={'weather': 'good!'}, status=200)
+        cache.add(f'weather-lock:{self.location}', 1)
+
+        data = get_client().get_weather(self.location)
+        self.assertEquals(data, {'weather': 'good!'})
+        self.assertEquals(response.call_count, 1)
+
+
+    def test_lock_of_another_worker_is_not_released(self):
+        token = acquire_lock(self.location)
+        self.assertIsNotNone(token)
+        self.assertIsNone(acquire_lock(self.location))
+
+        # The lock expired during the fetch and another worker took it
+        cache.set(f'weather-lock:{self.location}', token + 1)
+        release_lock(self.location, token)
+        self.assertEquals(cache.get(f'weather-lock:{self.location}'), token + 1)
+
+        release_lock(self.location, token + 1)
+        self.assertIsNone(cache.get(f'weather-lock:{self.location}'))
+
+
+    async def test_async_waits_for_other_worker(self):
+        calls = []
+        async def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={'weather': 'good!'})
+
+        await cache.aadd(f'weather-lock:{self.location}', 1)
+        async def other_worker():
+            await asyncio.sleep(0.2)
+            await cache.aset(self.location, {'weather': 'from other worker'})
+            await cache.adelete(f'weather-lock:{self.location}')
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch('shipments.weather_integration.get_async_http_client', return_value=client):
+            data, _ = await asyncio.gather(get_client().aget_weather(self.location), other_worker())
+
+        self.assertEquals(data, {'weather': 'from other worker'})
+        self.assertEquals(calls, [])
+
+
+    async def test_async_concurrent_misses_are_coalesced(self):
+        calls = []
+        async def handler(request):
+            calls.append(request)
+            await asyncio.sleep(0.1)
+            return httpx.Response(200, json={'weather': 'good!'})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch('shipments.weather_integration.get_async_http_client', return_value=client):
+            results = await asyncio.gather(*(get_client().aget_weather(self.location) for _ in range(8)))
+
+        self.assertEquals(results, [{'weather': 'good!'}] * 8)
+        self.assertEquals(len(calls), 1)
+
+
+@override_settings(WEATHER_API_KEY='test_test_test', WEATHER_CACHE_TIMEOUT=60, WEATHER_CACHE_STALE_TIMEOUT=600)
+class StaleWhileRevalidateWeatherTestCase(TestCase):
+    location = '10115 Berlin'
+    url = f'https://api.weatherapi.com/v1/current.json?key=test_test_test&q={location}'
+
+    def setUp(self):
+        cache.clear()
+        two_tier_cache.clear_all()
+        self.refresh_executor = ThreadPoolExecutor(max_workers=1)
+        patcher = patch('shipments.weather_integration._refresh_executor', self.refresh_executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_cache(self, weather, age):
+        cache.set_many({self.location: weather, get_fetched_at_key(self.location): time.time() - age})
+
+    def wait_for_refreshes(self):
+        self.refresh_executor.shutdown(wait=True)
+
+
+    @responses.activate
+    def test_fresh_value(self):
+        response = responses.get(self.url, json={'weather': 'good!'}, status=200)
+        self.set_cache({'weather': 'rainy!'}, age=30)
+
+        self.assertEquals(get_client().get_weather(self.location), {'weather': 'rainy!'})
+        self.wait_for_refreshes()
+        self.assertEquals(response.call_count, 0)
+
+
+    @responses.activate
+    def test_stale_value_is_served_and_refreshed(self):
+        response = responses.get(self.url, json={'weather': 'good!'}, status=200)
+        self.set_cache({'weather': 'rainy!'}, age=120)
+        # Hold the refresh until both lookups are served, released as well if an assertion fails first
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        self.refresh_executor.submit(gate.wait, timeout=5)
+
+        self.assertEquals(get_client().get_weather(self.location), {'weather': 'rainy!'})
+        self.assertEquals(get_client().get_weathers([self.location]), {self.location: {'weather': 'rainy!'}})
+        gate.set()
+        self.wait_for_refreshes()
+
+        self.assertEquals(response.call_count, 1)
+        self.assertEquals(cache.get(self.location), {'weather': 'good!'})
+        self.assertEquals(get_client().get_weather(self.location), {'weather': 'good!'})
+
+
+    @responses.activate
+    def test_stale_value_is_kept_on_refresh_error(self):
+        response = responses.get(self.url, json={'error': 'unavailable'}, status=500)
+        self.set_cache({'weather': 'rainy!'}, age=120)
+
+        get_client().get_weather(self.location)
+        self.wait_for_refreshes()
+        self.assertEquals(get_client().get_weather(self.location), {'weather': 'rainy!'})
+        # The failure is negatively cached, no refresh on every request
+        self.assertEquals(response.call_count, 1 + get_http_session().get_adapter(self.url).max_retries.total)
+
+
+    @responses.activate
+    def test_set_weather_cache_uses_hard_timeout(self):
+        responses.get(self.url, json={'weather': 'good!'}, status=200)
+        with patch('shipments.weather_integration.cache.set_many') as set_many:
+            get_client().get_weather(self.location)
+        self.assertEquals(set_many.call_args.kwargs['timeout'], 600)
+
+
+    def test_error_timeouts(self):
+        def http_error(status_code):
+            return requests.HTTPError(response=type('Response', (), {'status_code': status_code})())
+
+        self.assertEquals(get_error_timeout(http_error(400)), 60*10)
+        self.assertEquals(get_error_timeout(http_error(429)), 30)
+        self.assertEquals(get_error_timeout(http_error(503)), 30)
+        self.assertEquals(get_error_timeout(requests.Timeout()), 30)
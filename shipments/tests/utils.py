@@ -0,0 +1,30 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountAssertionsMixin:
+    """ Guards against N+1 queries in the endpoints """
+
+    def assertConstantQueries(self, request, grow, rounds=2):
+        """
+        Fail if the number of queries of `request` grows with the size of the data.
+
+        Args:
+            request (callable): Sends the request under test and returns the response.
+            grow (callable): Adds more rows to the result of `request` (e.g. shipments, articles).
+            rounds (int): How many times the data is grown and the request re-sent.
+        """
+        counts = []
+        for round_ in range(rounds + 1):
+            if round_:
+                grow()
+            with CaptureQueriesContext(connection) as context:
+                response = request()
+            self.assertLess(response.status_code, 400, response.content)
+            counts.append(len(context.captured_queries))
+
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'Query count grows with the result size: {counts}\n'
+            + '\n'.join(query['sql'] for query in context.captured_queries)
+        )
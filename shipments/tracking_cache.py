@@ -0,0 +1,76 @@
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from shipments.db_router import using_replica
+from shipments.notifications import get_broker
+from shipments.two_tier_cache import TwoTierCache
+
+
+# Invalidated on write (see signals.py), the TTL only bounds the memory of cold entries
+DEFAULT_TIMEOUT = 60*60*24
+# A lagging replica may return the old rows after the invalidation, their entry must not live for long
+DEFAULT_REPLICA_TIMEOUT = 30
+
+# Invalidations are broadcast to the local tier of the other processes when LOCAL_CACHE_PUBSUB is set
+tracking_local_cache = TwoTierCache('tracking', broadcast=True)
+
+
+def get_cache_key(carrier: str, tracking_number: str) -> str:
+    return f'tracking:{carrier}:{tracking_number}'
+
+
+def get_tracking_cache(carrier: str, tracking_number: str) -> Optional[dict]:
+    """ Get the cached public response of a shipment, without the weather which has its own TTL """
+    cache_key = get_cache_key(carrier, tracking_number)
+    return copy_cached(tracking_local_cache.get_many([cache_key], cache.get_many).get(cache_key))
+
+
+def copy_cached(data: Optional[dict]) -> Optional[dict]:
+    """ The local tier shares its values between requests, the callers add the weather to their copy """
+    return dict(data) if data is not None else None
+
+
+def get_timeout() -> int:
+    """ TTL of a response read in the current block, shorter if it was read from a replica (see db_router.py) """
+    if using_replica() is not None:
+        return getattr(settings, 'TRACKING_CACHE_REPLICA_TIMEOUT', DEFAULT_REPLICA_TIMEOUT)
+    return getattr(settings, 'TRACKING_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def set_tracking_cache(carrier: str, tracking_number: str, data: dict):
+    cache.set(get_cache_key(carrier, tracking_number), data, timeout=get_timeout())
+
+
+async def aget_tracking_cache(carrier: str, tracking_number: str) -> Optional[dict]:
+    cache_key = get_cache_key(carrier, tracking_number)
+    cached = await tracking_local_cache.aget_many([cache_key], cache.aget_many)
+    return copy_cached(cached.get(cache_key))
+
+
+async def aset_tracking_cache(carrier: str, tracking_number: str, data: dict):
+    await cache.aset(get_cache_key(carrier, tracking_number), data, timeout=get_timeout())
+
+
+def invalidate_tracking_cache(tracking_keys: Iterable[tuple]):
+    """
+    Drop the cached responses of `(carrier, tracking_number)` pairs and notify their subscribers.
+    The entries are deleted right away and once more after the commit, so that a concurrent
+    read of the old rows can not put a stale entry back for good.
+    """
+    tracking_keys = list(tracking_keys)
+    cache_keys = [get_cache_key(carrier, tracking_number) for carrier, tracking_number in tracking_keys]
+    if not cache_keys:
+        return
+
+    delete_tracking_cache(cache_keys)
+    transaction.on_commit(lambda: delete_tracking_cache(cache_keys))
+    # The subscribers reload the shipments, after the entries are gone
+    transaction.on_commit(lambda: get_broker().publish(tracking_keys))
+
+
+def delete_tracking_cache(cache_keys: list):
+    cache.delete_many(cache_keys)
+    tracking_local_cache.delete_many(cache_keys)
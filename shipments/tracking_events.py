@@ -0,0 +1,234 @@
+import logging
+import time
+from collections import Counter
+from functools import reduce
+from operator import or_
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Prefetch, Q, Value, When
+
+from .importer import iter_chunks
+from .models import Shipment, TrackingEvent
+from .shipment_stats import update_shipment_counters
+from .tracking_cache import invalidate_tracking_cache
+
+
+logger = logging.getLogger(__name__)
+
+# Events returned with a shipment, the older ones stay in the table
+DEFAULT_TIMELINE_LIMIT = 100
+# Events applied per transaction by the bulk ingestion
+DEFAULT_BATCH_SIZE = 5000
+# Compare-and-set rounds of a shipment updated concurrently by other ingestion workers, the last one locks it
+MAX_TRANSITION_ATTEMPTS = 3
+# Shipments per compare-and-set UPDATE: its WHERE and CASE grow with them, SQLite caps the expression depth at 1000
+TRANSITION_UPDATE_SIZE = 250
+
+
+class RecordedEvents(NamedTuple):
+    # The event that became the status of each updated shipment, keyed by shipment id
+    applied: dict
+    # Keys (see get_event_key) of the events stored, the others were duplicates
+    recorded: set
+
+
+def get_event_key(event: TrackingEvent) -> tuple:
+    return (event.shipment_id, event.status, event.timestamp)
+
+
+def record_tracking_events(events: list) -> RecordedEvents:
+    """
+    Append tracking events and move the status of their shipments forward, in one transaction and a constant
+    number of queries. Duplicates of stored events (e.g. carrier retries) are not written again, and a shipment
+    is only updated by events that are newer than its status and allowed by Shipment.STATUS_TRANSITIONS.
+
+    Args:
+        events (list[TrackingEvent]): Unsaved events.
+
+    Returns:
+        RecordedEvents: The applied and the stored events.
+    """
+    events_by_key = {}
+    for event in events:
+        events_by_key.setdefault(get_event_key(event), event)
+
+    with transaction.atomic():
+        stored = set(
+            TrackingEvent.objects.filter(
+                shipment_id__in={event.shipment_id for event in events},
+                timestamp__in={event.timestamp for event in events},
+            ).values_list('shipment_id', 'status', 'timestamp')
+        )
+        new_events = [event for key, event in events_by_key.items() if key not in stored]
+        # A concurrent copy of the same event is dropped by the unique constraint
+        TrackingEvent.objects.bulk_create(new_events, ignore_conflicts=True)
+
+        events_by_shipment = {}
+        for event in new_events:
+            events_by_shipment.setdefault(event.shipment_id, []).append(event)
+        applied, tracking_keys = transition_shipments(events_by_shipment)
+
+        # bulk_create and update() do not send the signals that invalidate the tracking cache,
+        # the timeline changed even if the status did not
+        invalidate_tracking_cache(tracking_keys)
+    return RecordedEvents(applied, {get_event_key(event) for event in new_events})
+
+
+def replay_events(status: str, status_updated_at, events: list) -> Optional[TrackingEvent]:
+    """ The event a shipment ends up in after the events, in time then lifecycle order, or None if none applies """
+    applied = None
+    for event in sorted(events, key=lambda event: (event.timestamp, Shipment.STATUS_RANK.get(event.status, -1))):
+        if Shipment.can_transition(status, status_updated_at, event.status, event.timestamp):
+            status, status_updated_at, applied = event.status, event.timestamp, event
+    return applied
+
+
+def transition_shipments(events_by_shipment: dict) -> tuple:
+    """
+    Write the status the events lead each shipment to, with compare-and-set UPDATEs of TRANSITION_UPDATE_SIZE
+    shipments: no row is locked while the events are replayed, and a shipment changed concurrently since it was
+    read is replayed again rather than overwritten. Shipments the events do not move are not written at all. The shipments still
+    contended after MAX_TRANSITION_ATTEMPTS - 1 rounds are locked (`SELECT ... FOR UPDATE`) for the last one,
+    so a valid event is always applied.
+
+    Args:
+        events_by_shipment (dict): New events keyed by shipment id.
+
+    Returns:
+        tuple: The applied events keyed by shipment id, and the (carrier, tracking_number) of every shipment.
+    """
+    applied, tracking_keys, counter_keys = {}, [], {}
+    pending = set(events_by_shipment)
+    for attempt in range(MAX_TRANSITION_ATTEMPTS):
+        shipments = Shipment.objects.filter(pk__in=pending)
+        if attempt == MAX_TRANSITION_ATTEMPTS - 1:
+            logger.info(f"Locking {len(pending)} shipments updated concurrently during {attempt} attempts")
+            # In pk order, like the other locking write paths, to avoid deadlocks
+            shipments = shipments.select_for_update().order_by('pk')
+
+        transitions = {}
+        for pk, carrier, tracking_number, country, status, status_updated_at in shipments.values_list(
+            'pk', 'carrier', 'tracking_number', 'receiver_country', 'status', 'status_updated_at',
+        ):
+            if not attempt:
+                tracking_keys.append((carrier, tracking_number))
+                counter_keys[pk] = (carrier, country)
+            event = replay_events(status, status_updated_at, events_by_shipment[pk])
+            if event is not None:
+                transitions[pk] = (status, status_updated_at, event)
+        if not transitions:
+            break
+
+        written = sum(
+            compare_and_set_statuses(dict(chunk)) for chunk in iter_chunks(transitions.items(), TRANSITION_UPDATE_SIZE)
+        )
+        if written == len(transitions):
+            applied.update((pk, transition) for pk, transition in transitions.items())
+            break
+
+        # Some shipments were updated by another worker in the meantime: find out which, replay those
+        pending = set()
+        for pk, status, status_updated_at in Shipment.objects.filter(pk__in=transitions).values_list(
+            'pk', 'status', 'status_updated_at',
+        ):
+            event = transitions[pk][2]
+            if (status, status_updated_at) == (event.status, event.timestamp):
+                applied[pk] = transitions[pk]
+            else:
+                pending.add(pk)
+
+    # update() does not send the signals that count the shipments
+    deltas = Counter()
+    for pk, (status, _, event) in applied.items():
+        carrier, country = counter_keys[pk]
+        deltas[(carrier, status, country)] -= 1
+        deltas[(carrier, event.status, country)] += 1
+    update_shipment_counters(deltas)
+    return {pk: event for pk, (_, _, event) in applied.items()}, tracking_keys
+
+
+def compare_and_set_statuses(transitions: dict) -> int:
+    """ One UPDATE of the shipments still in the `(status, status_updated_at)` they were read in, returns the count """
+    return Shipment.objects.filter(reduce(or_, (
+        Q(pk=pk, status=status, status_updated_at=status_updated_at)
+        for pk, (status, status_updated_at, _) in transitions.items()
+    ))).update(
+        status=Case(*(When(pk=pk, then=Value(event.status)) for pk, (_, _, event) in transitions.items())),
+        status_updated_at=Case(
+            *(When(pk=pk, then=Value(event.timestamp)) for pk, (_, _, event) in transitions.items()),
+            output_field=DateTimeField(),
+        ),
+    )
+
+
+def ingest_tracking_events(items: list) -> list:
+    """
+    Apply carrier scan events in batches of `TRACKING_EVENTS_BATCH_SIZE`.
+
+    Args:
+        items (list[dict]): Validated events, see TrackingEventIngestSerializer.
+
+    Returns:
+        list[str]: Result of each item, in the same order: 'updated' (the event is the new status of its shipment),
+        'recorded' (stored in the history only: stale, or not an allowed transition), 'duplicate' (already stored,
+        nothing written) or 'not_found'.
+    """
+    started_at = time.monotonic()
+    batch_size = getattr(settings, 'TRACKING_EVENTS_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    results = []
+    for batch in iter_chunks(items, batch_size):
+        results.extend(ingest_batch(batch))
+
+    seconds = time.monotonic() - started_at
+    logger.info(f"Ingested {len(items)} tracking events in {seconds:.2f}s ({len(items) / max(seconds, 1e-6):.0f} events/sec)")
+    return results
+
+
+def ingest_batch(items: list) -> list:
+    shipment_ids = {
+        (carrier, tracking_number): pk
+        for pk, carrier, tracking_number in Shipment.objects.filter(
+            carrier__in={item['carrier'] for item in items},
+            tracking_number__in={item['tracking_number'] for item in items},
+        ).values_list('pk', 'carrier', 'tracking_number')
+    }
+
+    events = []
+    for item in items:
+        shipment_id = shipment_ids.get((item['carrier'], item['tracking_number']))
+        if shipment_id is None:
+            events.append(None)
+            continue
+        events.append(TrackingEvent(
+            shipment_id=shipment_id,
+            status=item['status'],
+            timestamp=item['timestamp'],
+            location=item.get('location', ''),
+            payload=item.get('payload', {}),
+        ))
+
+    recorded = record_tracking_events([event for event in events if event is not None])
+    results, seen = [], set()
+    for event in events:
+        if event is None:
+            results.append('not_found')
+            continue
+        key = get_event_key(event)
+        if key not in recorded.recorded or key in seen:
+            results.append('duplicate')
+        else:
+            results.append('updated' if recorded.applied.get(event.shipment_id) is event else 'recorded')
+        seen.add(key)
+    return results
+
+
+def get_timeline_prefetch() -> Prefetch:
+    """ Latest events of each shipment, newest first, in one query whatever the length of the history """
+    limit = getattr(settings, 'TRACKING_TIMELINE_LIMIT', DEFAULT_TIMELINE_LIMIT)
+    return Prefetch(
+        'tracking_events',
+        queryset=TrackingEvent.objects.order_by('-timestamp', '-id')[:limit],
+        to_attr='timeline',
+    )
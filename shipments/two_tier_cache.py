@@ -0,0 +1,214 @@
+"""
+In-process LRU/TTL tier in front of the shared (Redis) cache, for the hottest lookups: weather
+locations and public tracking responses are then served from local memory without a network round trip.
+
+Local entries expire after a few seconds (`LOCAL_CACHE_TIMEOUT`), much faster than the Redis ones, which
+bounds how stale another process can be. Invalidations are applied locally right away and, if
+`LOCAL_CACHE_PUBSUB` is set and the default cache is Redis, broadcast to the other processes.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TIMEOUT = 5
+INVALIDATION_CHANNEL = 'two-tier-cache:invalidate'
+
+# name -> TwoTierCache, to route the broadcast invalidations
+_registry = {}
+_process_id = f'{os.getpid()}-{uuid.uuid4().hex}'
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class TwoTierCache:
+    """
+    Thread-safe bounded LRU with a TTL per entry, filled from the remote tier by the callers.
+    Only values accepted by `is_cacheable` are kept locally: a miss always goes to the remote tier.
+    """
+
+    def __init__(self, name: str, broadcast: bool = False):
+        self.name = name
+        self.broadcast = broadcast
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = self.local_misses = self.remote_hits = self.remote_misses = 0
+        _registry[name] = self
+
+    @property
+    def max_entries(self) -> int:
+        return getattr(settings, 'LOCAL_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+    @property
+    def timeout(self) -> float:
+        return getattr(settings, 'LOCAL_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    def get_many(self, keys: Iterable, fetch_remote: Callable[[list], dict],
+                 is_cacheable: Callable = lambda value: value is not None) -> dict:
+        """
+        Args:
+            keys (Iterable): Keys to look up.
+            fetch_remote (callable): Looks up the local misses in the remote tier in one round trip.
+            is_cacheable (callable): Whether a remote value can be kept locally.
+
+        Returns:
+            dict: Values of all the keys, as returned by `fetch_remote` for the local misses.
+        """
+        values, missing = self.get_local(keys)
+        if missing:
+            remote_values = fetch_remote(missing)
+            self.record_remote(missing, remote_values, is_cacheable)
+            values.update(remote_values)
+        return values
+
+    async def aget_many(self, keys: Iterable, afetch_remote: Callable, is_cacheable: Callable = lambda value: value is not None) -> dict:
+        """ Async variant of get_many, the local tier is never blocking """
+        values, missing = self.get_local(keys)
+        if missing:
+            remote_values = await afetch_remote(missing)
+            self.record_remote(missing, remote_values, is_cacheable)
+            values.update(remote_values)
+        return values
+
+    def get_local(self, keys: Iterable) -> tuple:
+        values, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    values[key] = entry[0]
+                else:
+                    missing.append(key)
+            self.local_hits += len(values)
+            self.local_misses += len(missing)
+        return values, missing
+
+    def record_remote(self, keys: list, remote_values: dict, is_cacheable: Callable):
+        cacheable = {key: remote_values[key] for key in keys if key in remote_values and is_cacheable(remote_values[key])}
+        self.set_many(cacheable)
+        with self._lock:
+            self.remote_hits += len(cacheable)
+            self.remote_misses += len(keys) - len(cacheable)
+
+    def set_many(self, values: dict):
+        if self.broadcast:
+            start_invalidation_listener()
+        expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys: Iterable, publish: bool = True):
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if publish and self.broadcast and keys:
+            publish_invalidation(self.name, keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.local_hits = self.local_misses = self.remote_hits = self.remote_misses = 0
+
+    def stats(self) -> dict:
+        """ Hit ratios of this process: the remote tier only sees the local misses """
+        local_lookups = self.local_hits + self.local_misses
+        remote_lookups = self.remote_hits + self.remote_misses
+        return {
+            'entries': len(self._entries),
+            'local': {
+                'hits': self.local_hits,
+                'misses': self.local_misses,
+                'hit_ratio': self.local_hits / local_lookups if local_lookups else None,
+            },
+            'remote': {
+                'hits': self.remote_hits,
+                'misses': self.remote_misses,
+                'hit_ratio': self.remote_hits / remote_lookups if remote_lookups else None,
+            },
+        }
+
+
+def get_stats() -> dict:
+    return {name: two_tier_cache.stats() for name, two_tier_cache in _registry.items()}
+
+
+def clear_all():
+    """ Drop the local entries of every two-tier cache of this process, e.g. after clearing the shared cache """
+    for two_tier_cache in _registry.values():
+        two_tier_cache.clear()
+
+
+def get_redis_client():
+    """ Client of the default cache, if it is Redis """
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        return backend._cache.get_client(write=True)
+    return None
+
+
+def publish_invalidation(name: str, keys: list):
+    if not getattr(settings, 'LOCAL_CACHE_PUBSUB', False):
+        return
+    client = get_redis_client()
+    if client is None:
+        return
+
+    try:
+        client.publish(INVALIDATION_CHANNEL, json.dumps({'origin': _process_id, 'cache': name, 'keys': keys}))
+    except Exception as exc:
+        # The local entries of the other processes expire soon anyway
+        logger.error(f"Failed to publish the invalidation of {len(keys)} keys: {exc}")
+
+
+def start_invalidation_listener():
+    """ Subscribe this process to the invalidations of the others, once """
+    global _listener
+    if _listener is not None or not getattr(settings, 'LOCAL_CACHE_PUBSUB', False):
+        return
+    with _listener_lock:
+        if _listener is not None:
+            return
+        client = get_redis_client()
+        if client is None:
+            return
+        _listener = threading.Thread(target=_listen, args=(client,), name='two-tier-cache-invalidation', daemon=True)
+        _listener.start()
+
+
+def _listen(client):
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                handle_invalidation(message['data'])
+        except Exception as exc:
+            logger.error(f"Cache invalidation listener failed, reconnecting: {exc}")
+            time.sleep(1)
+
+
+def handle_invalidation(data):
+    """ Apply an invalidation published by another process """
+    invalidation = json.loads(data)
+    two_tier_cache = _registry.get(invalidation['cache'])
+    if two_tier_cache is not None and invalidation['origin'] != _process_id:
+        two_tier_cache.delete_many(invalidation['keys'], publish=False)
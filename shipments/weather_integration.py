@@ -1,37 +1,232 @@
+import asyncio
 import logging
-from typing import Optional
+import secrets
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, NamedTuple, Optional
 
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from shipments.two_tier_cache import TwoTierCache, get_redis_client
 
 
 logger = logging.getLogger(__name__)
 
+# Soft TTL: fresh for 2 hours, then served stale while refreshed. Hard TTL: dropped after 6 hours
 DEFAULT_TIMEOUT = 60*60*2
+DEFAULT_STALE_TIMEOUT = 60*60*6
+# Negative cache of the failed lookups: longer for the client errors (e.g. unknown location)
+DEFAULT_NEGATIVE_TIMEOUT = 60*10
+DEFAULT_ERROR_TIMEOUT = 30
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_HTTP_CONNECT_TIMEOUT = 3.05
+DEFAULT_HTTP_READ_TIMEOUT = 5
+DEFAULT_HTTP_RETRIES = 2
+DEFAULT_HTTP_BACKOFF_FACTOR = 0.2
+DEFAULT_ASYNC_MAX_CONNECTIONS = 100
+# How long a worker holds the lock on a location while it calls the upstream, and how long the others wait
+DEFAULT_LOCK_TIMEOUT = 30
+DEFAULT_LOCK_WAIT = 10
+LOCK_POLL_INTERVAL = 0.05
+# Deletes a lock only if it still holds the token of the worker releasing it, atomically
+RELEASE_LOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+# Process-wide, the clients are stateless and the HTTP sessions are thread-safe for GET requests
+_clients = {}
+_http_session = None
+_http_session_lock = threading.Lock()
+# An httpx.AsyncClient is bound to the event loop it was first used in
+_async_http_clients = weakref.WeakKeyDictionary()
+# Stale-while-revalidate refreshes, off the request path
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather-refresh')
+# Weather changes slowly, the local entries of other processes are not invalidated on refresh
+weather_local_cache = TwoTierCache('weather')
 
 def get_client():
     """
     Entry Point: Get the weather integration client based on the configuration.
+    The client is created once per process and reused.
     """
     if getattr(settings, 'WEATHER_API_KEY', None):
-        return WeatherAPIClient()
+        client_class = WeatherAPIClient
     else:
-        return DummyWeatherClient()
+        client_class = DummyWeatherClient
+
+    if client_class not in _clients:
+        _clients[client_class] = client_class()
+    return _clients[client_class]
+
+
+def get_cache_timeouts() -> tuple:
+    """ (soft, hard) TTLs of the weather cache """
+    soft_timeout = getattr(settings, 'WEATHER_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    hard_timeout = getattr(settings, 'WEATHER_CACHE_STALE_TIMEOUT', DEFAULT_STALE_TIMEOUT)
+    return soft_timeout, max(soft_timeout, hard_timeout)
+
+
+def get_error_timeout(exc: Optional[Exception] = None) -> int:
+    """ TTL of a negative cache entry: 4xx responses (but 429) are not going to change soon, the rest might """
+    response = getattr(exc, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    if status_code is not None and 400 <= status_code < 500 and status_code != 429:
+        return getattr(settings, 'WEATHER_NEGATIVE_CACHE_TIMEOUT', DEFAULT_NEGATIVE_TIMEOUT)
+    return getattr(settings, 'WEATHER_ERROR_CACHE_TIMEOUT', DEFAULT_ERROR_TIMEOUT)
+
+
+def get_fetched_at_key(location: str) -> str:
+    return f'weather-fetched-at:{location}'
+
+
+def get_error_key(location: str) -> str:
+    return f'weather-error:{location}'
+
+
+def get_lock_key(location: str) -> str:
+    return f'weather-lock:{location}'
+
+
+def acquire_lock(location: str) -> Optional[int]:
+    """ Lock a location for WEATHER_LOCK_TIMEOUT seconds (SET NX on Redis), returns its token or None if it is taken """
+    # An int, the Redis cache stores it as is instead of pickling it: the release script can compare it
+    token = secrets.randbits(62)
+    if cache.add(get_lock_key(location), token, timeout=getattr(settings, 'WEATHER_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)):
+        return token
+    return None
+
+
+def release_lock(location: str, token: int):
+    """
+    Release a lock taken by acquire_lock, unless it expired meanwhile and another worker holds it now:
+    deleting the lock of the other worker would let a third one call the upstream concurrently.
+    """
+    lock_key = get_lock_key(location)
+    client = get_redis_client()
+    if client is not None:
+        client.eval(RELEASE_LOCK_SCRIPT, 1, cache.make_and_validate_key(lock_key), token)
+    # Not atomic, for the other cache backends (tests, development)
+    elif cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+async def aacquire_lock(location: str) -> Optional[int]:
+    token = secrets.randbits(62)
+    if await cache.aadd(
+        get_lock_key(location), token, timeout=getattr(settings, 'WEATHER_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT),
+    ):
+        return token
+    return None
+
+
+async def arelease_lock(location: str, token: int):
+    await sync_to_async(release_lock)(location, token)
+
+
+def get_cache_keys(locations: list) -> list:
+    return [key for location in locations for key in (location, get_fetched_at_key(location), get_error_key(location))]
+
+
+def group_cached_by_location(locations: list, cached: dict) -> dict:
+    return {
+        location: {
+            key: cached[key] for key in (location, get_fetched_at_key(location), get_error_key(location)) if key in cached
+        }
+        for location in locations
+    }
+
+
+def get_http_timeout() -> tuple:
+    """ (connect, read) timeouts of the upstream calls """
+    return (
+        getattr(settings, 'WEATHER_HTTP_CONNECT_TIMEOUT', DEFAULT_HTTP_CONNECT_TIMEOUT),
+        getattr(settings, 'WEATHER_HTTP_READ_TIMEOUT', DEFAULT_HTTP_READ_TIMEOUT),
+    )
+
+
+def get_http_session() -> requests.Session:
+    """
+    Pooled keep-alive HTTP session shared by the sync weather clients of the process, so a cache miss
+    does not pay a new TCP + TLS handshake. Idempotent failures (connection errors, 429 and 5xx) are
+    retried with an exponential backoff.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            pool_size = getattr(settings, 'WEATHER_HTTP_POOL_SIZE', DEFAULT_HTTP_POOL_SIZE)
+            retry = Retry(
+                total=getattr(settings, 'WEATHER_HTTP_RETRIES', DEFAULT_HTTP_RETRIES),
+                backoff_factor=getattr(settings, 'WEATHER_HTTP_BACKOFF_FACTOR', DEFAULT_HTTP_BACKOFF_FACTOR),
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=('GET',),
+                raise_on_status=False,
+            )
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+            session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+            _http_session = session
+    return _http_session
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """ Pooled keep-alive HTTP client shared by the async weather clients of the current event loop """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_http_clients:
+        max_connections = getattr(settings, 'WEATHER_ASYNC_MAX_CONNECTIONS', DEFAULT_ASYNC_MAX_CONNECTIONS)
+        connect_timeout, read_timeout = get_http_timeout()
+        _async_http_clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            # httpx only retries connection failures
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                retries=getattr(settings, 'WEATHER_HTTP_RETRIES', DEFAULT_HTTP_RETRIES),
+            ),
+        )
+    return _async_http_clients[loop]
+
+
+class WeatherCacheEntry(NamedTuple):
+    weather: Optional[dict]
+    # Older than the soft TTL: the weather is still served but refreshed in the background
+    is_stale: bool
+    # The last upstream call failed, do not call it again before the entry expires
+    is_error: bool
+    # Timestamp of the upstream call, None if unknown
+    fetched_at: Optional[float] = None
 
 
 class AbstractWeatherClient:
     BASE_URL: str = ''
     SETTINGS_API_KEY: str = ''
+    # Coalesce the concurrent cache misses of a location into a single upstream call
+    SINGLE_FLIGHT: bool = True
 
+    def __init__(self):
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._async_in_flight = weakref.WeakKeyDictionary()
+        self._async_refreshes = set()
 
     def make_request(self, location: str) -> Optional[dict]:
         raise NotImplementedError("Subclasses must implement this method")
 
+    async def amake_request(self, location: str) -> Optional[dict]:
+        """ Async variant of make_request, runs the blocking one in a thread unless overridden """
+        return await sync_to_async(self.make_request, thread_sensitive=False)(location)
+
     def get_weather(self, location: str) -> Optional[dict]:
         """
-        Get weather data for a location. If cached data is available and not older than 2 hours, return it.
+        Get weather data for a location. Cached data is returned right away: once older than the soft TTL
+        (`WEATHER_CACHE_TIMEOUT`, 2 hours) it is refreshed in the background, and dropped after the hard TTL.
         Otherwise, fetch the data from the weather API and cache it and return the new data.
+        Failures are cached for a short time too, so a bad location does not call the API on every request.
         
         Args:
             location (str): Location in Shipment. format.
@@ -39,29 +234,262 @@ class AbstractWeatherClient:
         Returns:
             Optional[dict]: Weather data if available, otherwise None.
         """
-        weather_cache = self.get_weather_cache(location)
-        if weather_cache:
-            return weather_cache
-        
+        entry = self.get_weather_cache_entries([location])[location]
+        if entry.weather or entry.is_error:
+            if entry.is_stale and not entry.is_error:
+                self.refresh_weather_in_background(location)
+            return entry.weather
+
+        return self.fetch_weather_once(location)
+
+    def get_weathers(self, locations: Iterable[str]) -> dict:
+        """
+        Get weather data for many locations at once, e.g. for a page of shipments.
+        Cached entries are loaded with a single `cache.get_many` and the misses are fetched
+        concurrently with a bounded thread pool (`WEATHER_MAX_WORKERS` setting).
+
+        Args:
+            locations (Iterable[str]): Locations in Shipment. format, duplicates are allowed.
+
+        Returns:
+            dict: Weather data (or None) keyed by location.
+        """
+        weather, missing = {}, []
+        for location, entry in self.get_weather_cache_entries(list(dict.fromkeys(locations))).items():
+            if entry.weather or entry.is_error:
+                weather[location] = entry.weather
+                if entry.is_stale and not entry.is_error:
+                    self.refresh_weather_in_background(location)
+            else:
+                missing.append(location)
+
+        if missing:
+            max_workers = min(len(missing), getattr(settings, 'WEATHER_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                weather.update(zip(missing, executor.map(self.fetch_weather_once, missing)))
+
+        return weather
+
+    def refresh_weather_in_background(self, location: str):
+        """ Stale-while-revalidate: one worker refreshes a stale location, the requests do not wait for it """
+        token = acquire_lock(location)
+        if token is None:
+            return
+
+        def refresh():
+            try:
+                self.fetch_weather(location)
+            finally:
+                release_lock(location, token)
+
+        _refresh_executor.submit(refresh)
+
+    def fetch_weather_once(self, location: str) -> Optional[dict]:
+        """
+        Single-flight fetch_weather: when the entry of a popular location expires, the threads of this
+        process missing it at the same time share one call, see fetch_weather_locked for the other workers.
+        """
+        if not self.SINGLE_FLIGHT:
+            return self.fetch_weather(location)
+
+        with self._in_flight_lock:
+            future = self._in_flight.get(location)
+            is_leader = future is None
+            if is_leader:
+                future = self._in_flight[location] = Future()
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            weather_data = self.fetch_weather_locked(location)
+            future.set_result(weather_data)
+            return weather_data
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[location]
+
+    def fetch_weather_locked(self, location: str) -> Optional[dict]:
+        """
+        Call the upstream for a location unless another worker is already doing it, in which case wait
+        for its result in the cache. The lock is a short-lived cache entry (SET NX on Redis).
+        """
+        token = acquire_lock(location)
+        if token is not None:
+            try:
+                return self.fetch_weather(location)
+            finally:
+                release_lock(location, token)
+
+        lock_key = get_lock_key(location)
+        deadline = time.monotonic() + getattr(settings, 'WEATHER_LOCK_WAIT', DEFAULT_LOCK_WAIT)
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            if cache.get(lock_key) is None:
+                # Released: either the value is there, or the call failed (and is negatively cached)
+                return self.get_weather_cache(location)
+        # The other worker is stuck, do not wait any longer
+        return self.fetch_weather(location)
+
+    def fetch_weather(self, location: str) -> Optional[dict]:
+        """ Fetch the weather data for a location from the weather API and cache it, or cache the failure """
         weather_data = None
         try:
             weather_data = self.make_request(location)
         except requests.RequestException as exc:
             logger.error(f"Failed to fetch weather data for {location}: {exc}")
-            weather_data = None
+            self.set_weather_error_cache(location, get_error_timeout(exc))
+            return None
         
         if weather_data:
             self.set_weather_cache(location, weather_data)
+        else:
+            self.set_weather_error_cache(location, get_error_timeout())
+
+        return weather_data
+
+    async def aget_weather(self, location: str) -> Optional[dict]:
+        """ Async variant of get_weather, an upstream call does not hold a thread while waiting """
+        entry = (await self.aget_weather_cache_entries([location]))[location]
+        if entry.weather or entry.is_error:
+            if entry.is_stale and not entry.is_error:
+                await self.arefresh_weather_in_background(location)
+            return entry.weather
+
+        return await self.afetch_weather_once(location)
+
+    async def arefresh_weather_in_background(self, location: str):
+        """ Async variant of refresh_weather_in_background """
+        token = await aacquire_lock(location)
+        if token is None:
+            return
+
+        async def refresh():
+            try:
+                await self.afetch_weather(location)
+            finally:
+                await arelease_lock(location, token)
+
+        # Keep a reference, the event loop only holds weak ones to its tasks
+        task = asyncio.ensure_future(refresh())
+        self._async_refreshes.add(task)
+        task.add_done_callback(self._async_refreshes.discard)
+
+    async def afetch_weather_once(self, location: str) -> Optional[dict]:
+        """
+        Async variant of fetch_weather_once, the requests of this event loop missing a location share one call,
+        see afetch_weather_locked for the other workers.
+        """
+        if not self.SINGLE_FLIGHT:
+            return await self.afetch_weather(location)
+
+        in_flight = self._async_in_flight.setdefault(asyncio.get_running_loop(), {})
+        task = in_flight.get(location)
+        if task is None:
+            task = in_flight[location] = asyncio.ensure_future(self.afetch_weather_locked(location))
+            task.add_done_callback(lambda _: in_flight.pop(location, None))
+        # A cancelled request must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+    async def afetch_weather_locked(self, location: str) -> Optional[dict]:
+        """ Async variant of fetch_weather_locked, the same lock is shared with the sync workers """
+        token = await aacquire_lock(location)
+        if token is not None:
+            try:
+                return await self.afetch_weather(location)
+            finally:
+                await arelease_lock(location, token)
+
+        lock_key = get_lock_key(location)
+        deadline = time.monotonic() + getattr(settings, 'WEATHER_LOCK_WAIT', DEFAULT_LOCK_WAIT)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            if await cache.aget(lock_key) is None:
+                return await cache.aget(location)
+        return await self.afetch_weather(location)
+
+    async def afetch_weather(self, location: str) -> Optional[dict]:
+        """ Async variant of fetch_weather """
+        weather_data = None
+        try:
+            weather_data = await self.amake_request(location)
+        except (requests.RequestException, httpx.HTTPError) as exc:
+            logger.error(f"Failed to fetch weather data for {location}: {exc}")
+            await self.aset_weather_error_cache(location, get_error_timeout(exc))
+            return None
+
+        if weather_data:
+            await self.aset_weather_cache(location, weather_data)
+        else:
+            await self.aset_weather_error_cache(location, get_error_timeout())
 
         return weather_data
 
     def get_weather_cache(self, location: str) -> Optional[dict]:
-        """ Get the weather cache for a location """
+        """ Get the weather cache for a location, fresh or stale """
         return cache.get(location)
-    
+
+    def get_weather_cache_entries(self, locations: list) -> dict:
+        """
+        Get the weather cache and its freshness for many locations, from the local tier or else in one round trip.
+        Only the locations with a value or an error are kept locally, a miss is always looked up in the shared cache.
+        """
+        cached = weather_local_cache.get_many(locations, self.get_shared_weather_cache, is_cacheable=bool)
+        return self.build_cache_entries(locations, cached)
+
+    async def aget_weather_cache_entries(self, locations: list) -> dict:
+        cached = await weather_local_cache.aget_many(locations, self.aget_shared_weather_cache, is_cacheable=bool)
+        return self.build_cache_entries(locations, cached)
+
+    @staticmethod
+    def get_shared_weather_cache(locations: list) -> dict:
+        """ Raw cached values (weather, fetch time, error) of each location """
+        return group_cached_by_location(locations, cache.get_many(get_cache_keys(locations)))
+
+    @staticmethod
+    async def aget_shared_weather_cache(locations: list) -> dict:
+        return group_cached_by_location(locations, await cache.aget_many(get_cache_keys(locations)))
+
+    @staticmethod
+    def build_cache_entries(locations: list, cached_by_location: dict) -> dict:
+        """ Freshness is computed at read time, so that locally cached values get stale too """
+        soft_timeout, _ = get_cache_timeouts()
+        now = time.time()
+        entries = {}
+        for location in locations:
+            cached = cached_by_location.get(location, {})
+            fetched_at = cached.get(get_fetched_at_key(location))
+            entries[location] = WeatherCacheEntry(
+                weather=cached.get(location),
+                # Entries without a fetch time (e.g. set by hand) are considered fresh until they expire
+                is_stale=fetched_at is not None and now - fetched_at > soft_timeout,
+                is_error=get_error_key(location) in cached,
+                fetched_at=fetched_at,
+            )
+        return entries
+
     def set_weather_cache(self, location: str, weather_data: dict):
-        """ Set the weather cache for a location """
-        cache.set(location, weather_data, timeout=DEFAULT_TIMEOUT)
+        """ Set the weather cache for a location, kept for the hard TTL and refreshed after the soft TTL """
+        _, hard_timeout = get_cache_timeouts()
+        cache.set_many({location: weather_data, get_fetched_at_key(location): time.time()}, timeout=hard_timeout)
+        weather_local_cache.delete_many([location])
+
+    async def aset_weather_cache(self, location: str, weather_data: dict):
+        _, hard_timeout = get_cache_timeouts()
+        await cache.aset_many({location: weather_data, get_fetched_at_key(location): time.time()}, timeout=hard_timeout)
+        weather_local_cache.delete_many([location])
+
+    def set_weather_error_cache(self, location: str, timeout: int):
+        """ Negative cache: the location is not looked up again before `timeout`, a stale value is still served """
+        cache.set(get_error_key(location), 1, timeout=timeout)
+        weather_local_cache.delete_many([location])
+
+    async def aset_weather_error_cache(self, location: str, timeout: int):
+        await cache.aset(get_error_key(location), 1, timeout=timeout)
+        weather_local_cache.delete_many([location])
 
 
 class WeatherAPIClient(AbstractWeatherClient):
@@ -70,7 +498,7 @@ class WeatherAPIClient(AbstractWeatherClient):
 
     def make_request(self, location: str) -> Optional[dict]:
         key = getattr(settings, self.SETTINGS_API_KEY, '')
-        response = requests.get(f"{self.BASE_URL}?key={settings.WEATHER_API_KEY}&q={location}")
+        response = get_http_session().get(f"{self.BASE_URL}?key={key}&q={location}", timeout=get_http_timeout())
         response.raise_for_status()
 
         if response.status_code == 200:
@@ -79,9 +507,20 @@ class WeatherAPIClient(AbstractWeatherClient):
         
         return None
 
+    async def amake_request(self, location: str) -> Optional[dict]:
+        key = getattr(settings, self.SETTINGS_API_KEY, '')
+        response = await get_async_http_client().get(self.BASE_URL, params={'key': key, 'q': location})
+        response.raise_for_status()
+
+        if response.status_code == 200:
+            return response.json()
+
+        return None
+
 
 class DummyWeatherClient(AbstractWeatherClient):
     """ A dummy weather client that always returns the same weather data. """
+    SINGLE_FLIGHT = False
 
     def make_request(self, location: str) -> dict:
         return {
@@ -89,5 +528,11 @@ class DummyWeatherClient(AbstractWeatherClient):
             "condition": "Sunny and Dummy (Set the API key to get real weather data :)"
         }
 
+    async def amake_request(self, location: str) -> dict:
+        return self.make_request(location)
+
     def set_weather_cache(self, location: str, weather_data: dict):
         """ No need to cache dummy data """
+
+    async def aset_weather_cache(self, location: str, weather_data: dict):
+        """ No need to cache dummy data """